@@ -0,0 +1,48 @@
+from benchmark import measure_cold_start, percentile, run_benchmark, WORKLOAD
+from app.main import app
+
+
+def test_percentile():
+    values = list(range(1, 101))
+
+    # Assertions
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile([7], 95) == 7
+    assert percentile(list(range(1, 61)), 99) == 60  # rank 59.4 rounds up
+    assert percentile(list(range(1, 61)), 50) == 30
+    assert percentile([], 50) is None
+
+
+def test_run_benchmark_in_process(tmp_path):
+    database_url = f"sqlite:///{tmp_path / 'benchmark.db'}"
+
+    # Call the function
+    report = run_benchmark(
+        database_url=database_url,
+        rows=50,
+        images=2,
+        requests=60,
+        warmup=10,
+        concurrency=2,
+    )
+    app.dependency_overrides.clear()
+
+    # Assertions
+    assert report["rows"] == 50
+    assert report["requests"] == 60
+    assert set(report["endpoints"]) == set(WORKLOAD)
+    assert all(endpoint["errors"] == 0 for endpoint in report["endpoints"].values())
+    assert report["endpoints"]["get_one"]["p50_ms"] is not None
+    assert report["cold_start"]["total_s"] > 0
+
+
+def test_measure_cold_start(tmp_path):
+    database = tmp_path / "cold.db"
+
+    # Call the function
+    report = measure_cold_start(f"sqlite:///{database}")
+
+    # Assertions, the startup created its schema in the given database
+    assert report["total_s"] > 0
+    assert database.exists()
@@ -1,24 +1,32 @@
 from fastapi.testclient import TestClient
 from io import BytesIO
-from PIL import Image
+import os
+import subprocess
+import sys
+import json
+from PIL import Image, ImageDraw
 import pytest
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
-from app.main import app
+from app.main import app, create_app
 from app.models.seashells import Base
 from app.delivery.seashells import get_database as get_db
+from app.images.pool import image_pool
+from app.usecase.cache import TTLCache, seashell_cache
 from app.app_testconfig import TEST_DATABASE_URL
 
 # Create a test db engine
 engine = create_engine(TEST_DATABASE_URL)
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+
 @pytest.fixture
 def db_session():
     Base.metadata.drop_all(bind=engine)
     Base.metadata.create_all(bind=engine)
 
     session = TestingSessionLocal()
+    seashell_cache.clear()  # ids are reused between tests
 
     def override_get_db():
         yield session
@@ -253,3 +261,645 @@ def test_delete_invalid_seashell(db_session):
 
     # Check if the response
     assert response.status_code == 404
+
+
+def test_get_all_seashell_pagination(db_session):
+    _, client = db_session
+
+    for i in range(3):
+        files = {"image": ("image.png", create_image(), "image/png")}
+        data = {
+            "name": f"Seashell_{i}",
+            "collected_at": "2024-02-01T14:30:45",
+            "species": "snail",
+            "description": "seashell description",
+        }
+        _ = client.post("/v1/seashell/", data=data, files=files)
+
+    response = client.get("/v1/seashell/", params={"limit": 2})
+    next_cursor = response.json()["next_cursor"]
+    next_response = client.get(
+        "/v1/seashell/", params={"limit": 2, "cursor": next_cursor}
+    )
+
+    # Check if the pages are continuous
+    assert response.status_code == 200
+    assert len(response.json()["data"]) == 2
+    assert next_cursor is not None
+    assert [s["name"] for s in next_response.json()["data"]] == ["Seashell_2"]
+    assert next_response.json()["next_cursor"] is None
+
+
+def test_get_all_seashell_invalid_cursor(db_session):
+    _, client = db_session
+
+    response = client.get("/v1/seashell/", params={"cursor": "%%%"})
+
+    # Check if the response
+    assert response.status_code == 400
+
+
+def test_export_seashells(db_session):
+    _, client = db_session
+    image_data = create_image()
+
+    files = {"image": ("image.png", image_data, "image/png")}
+    data = {
+        "name": "Seashell_export",
+        "collected_at": "2024-02-01T14:30:45",
+        "species": "snail",
+        "description": "seashell description",
+    }
+    _ = client.post("/v1/seashell/", data=data, files=files)
+
+    response = client.get("/v1/seashell/export")
+    filtered = client.get(
+        "/v1/seashell/export", params={"updated_since": "2999-01-01T00:00:00"}
+    )
+
+    # Check if every row is streamed as one json line
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = response.text.splitlines()
+    assert len(lines) == 1
+    assert json.loads(lines[0])["name"] == "Seashell_export"
+    assert filtered.text == ""  # Nothing changed since then
+
+
+def test_add_seashells_bulk(db_session):
+    _, client = db_session
+
+    files = [
+        ("images", ("shell-a.png", create_image(), "image/png")),
+        ("images", ("shell-b.png", create_image(), "image/png")),
+    ]
+    seashells = [
+        {
+            "name": "Seashell_a",
+            "collected_at": "2024-02-01T14:30:45",
+            "species": "snail",
+            "image": "shell-a.png",
+        },
+        {
+            "name": "Seashell_b",
+            "collected_at": "2024-02-01T14:30:45",
+            "species": "snail",
+            "image": "shell-b.png",
+        },
+        {
+            "name": "Seashell_c",
+            "collected_at": "2024-02-01T14:30:45",
+            "species": "snail",
+            "image": "shell-a.png",
+        },
+        {
+            "name": "Seashell_d",
+            "collected_at": "not a date",
+            "species": "snail",
+            "image": "shell-a.png",
+        },
+        {
+            "name": "Seashell_e",
+            "collected_at": "2024-02-01T14:30:45",
+            "species": "snail",
+            "image": "missing.png",
+        },
+    ]
+
+    response = client.post(
+        "/v1/seashell/bulk", data={"seashells": json.dumps(seashells)}, files=files
+    )
+
+    # Check if the valid records were created and the others reported
+    assert response.status_code == 201
+    results = response.json()["data"]
+    assert [r["id"] is not None for r in results] == [True, True, True, False, False]
+    assert results[3]["error"] == "Invalid collected_at"
+    assert results[4]["error"] == "Missing image file"
+    assert (
+        client.get(f"/v1/seashell/{results[2]['id']}").json()["data"]["name"]
+        == "Seashell_c"
+    )
+
+
+def test_invalid_add_seashells_bulk(db_session):
+    _, client = db_session
+
+    files = [("images", ("shell-a.png", create_image(), "image/png"))]
+
+    response = client.post(
+        "/v1/seashell/bulk", data={"seashells": "not json"}, files=files
+    )
+
+    # Check if the response
+    assert response.status_code == 400
+
+
+def test_add_seashell_image_pool_full(db_session, mocker):
+    _, client = db_session
+    mocker.patch.object(image_pool, "max_pending", 0)
+
+    files = {"image": ("image.png", create_image(), "image/png")}
+    data = {
+        "name": "Seashell",
+        "collected_at": "2024-02-01T14:30:45",
+        "species": "snail",
+    }
+
+    response = client.post("/v1/seashell/", data=data, files=files)
+
+    # Check if the upload is shed instead of queued
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+
+
+def test_add_duplicate_image_seashell(db_session):
+    _, client = db_session
+
+    data = {
+        "name": "Seashell",
+        "collected_at": "2024-02-01T14:30:45",
+        "species": "snail",
+    }
+    first = client.post(
+        "/v1/seashell/",
+        data=data,
+        files={"image": ("first.png", create_image(), "image/png")},
+    )
+    second = client.post(
+        "/v1/seashell/",
+        data=data,
+        files={"image": ("second.png", create_image(), "image/png")},
+    )
+    image_url = first.json()["data"]["image_url"]
+
+    # Check if both shells share the stored image
+    assert second.json()["data"]["image_url"] == image_url
+    assert os.path.exists(image_url)
+
+    client.delete(f"/v1/seashell/{first.json()['data']['id']}")
+    assert os.path.exists(image_url)  # Still referenced by the second shell
+
+    client.delete(f"/v1/seashell/{second.json()['data']['id']}")
+    assert not os.path.exists(image_url)  # Unreferenced, so removed
+
+
+def test_get_seashell_image(db_session):
+    _, client = db_session
+
+    files = {"image": ("image.png", create_image(), "image/png")}
+    data = {
+        "name": "Seashell",
+        "collected_at": "2024-02-01T14:30:45",
+        "species": "snail",
+    }
+    result = client.post("/v1/seashell/", data=data, files=files)
+    url = f"/v1/seashell/{result.json()['data']['id']}/image"
+
+    original = client.get(url)
+    thumbnail = client.get(url, params={"w": 20})
+    not_modified = client.get(
+        url, params={"w": 20}, headers={"If-None-Match": thumbnail.headers["etag"]}
+    )
+    partial = client.get(url, params={"w": 20}, headers={"Range": "bytes=0-3"})
+
+    # Check if the resized image is served and revalidated
+    assert original.status_code == 200
+    assert Image.open(BytesIO(original.content)).size == (100, 100)
+    assert thumbnail.status_code == 200
+    assert thumbnail.headers["content-type"] == "image/png"
+    assert Image.open(BytesIO(thumbnail.content)).size == (20, 20)
+    assert thumbnail.headers["etag"] != original.headers["etag"]
+    assert not_modified.status_code == 304
+    assert partial.status_code == 206
+    assert partial.content == thumbnail.content[:4]
+
+
+def test_get_invalid_seashell_image(db_session):
+    _, client = db_session
+
+    response = client.get("/v1/seashell/100/image", params={"w": 20})
+
+    # Check if the response
+    assert response.status_code == 404
+
+
+def test_get_seashell_cache_invalidation(db_session):
+    _, client = db_session
+
+    files = {"image": ("image.png", create_image(), "image/png")}
+    data = {
+        "name": "Seashell_cached",
+        "collected_at": "2024-02-01T14:30:45",
+        "species": "snail",
+    }
+    result = client.post("/v1/seashell/", data=data, files=files)
+    url = f"/v1/seashell/{result.json()['data']['id']}"
+
+    hits_before = seashell_cache.stats()["hits"]  # counters outlive clear()
+    first = client.get(url)
+    second = client.get(url)
+    hits = seashell_cache.stats()["hits"] - hits_before
+    client.patch(url, data={"name": "Seashell_renamed"})
+    updated = client.get(url)
+    client.delete(url)
+    deleted = client.get(url)
+
+    # Check if cached reads see every write
+    assert first.json() == second.json()
+    assert hits == 1
+    assert updated.json()["data"]["name"] == "Seashell_renamed"
+    assert deleted.status_code == 404
+
+
+def test_search_seashells(db_session):
+    _, client = db_session
+
+    for name in ["Cowrie", "Conch"]:
+        files = {"image": ("image.png", create_image(), "image/png")}
+        data = {
+            "name": name,
+            "collected_at": "2024-02-01T14:30:45",
+            "species": "snail",
+            "description": "collected from cox's bazar",
+        }
+        _ = client.post("/v1/seashell/", data=data, files=files)
+
+    response = client.get("/v1/seashell/search", params={"q": "cowrie cox's bazar"})
+    empty = client.get("/v1/seashell/search", params={"q": "'"})
+
+    # Check if only the matching shell is returned
+    assert response.status_code == 200
+    assert [s["name"] for s in response.json()["data"]] == ["Cowrie"]
+    assert empty.status_code == 400
+
+
+def test_get_all_seashell_filtered(db_session):
+    _, client = db_session
+
+    for name, species in [("Conch", "snail"), ("Cowrie", "snail"), ("Clam", "bivalve")]:
+        files = {"image": ("image.png", create_image(), "image/png")}
+        data = {
+            "name": name,
+            "collected_at": "2024-02-01T14:30:45",
+            "species": species,
+        }
+        _ = client.post("/v1/seashell/", data=data, files=files)
+
+    response = client.get(
+        "/v1/seashell/",
+        params={"species": "snail", "name_prefix": "Co", "sort": "-name"},
+    )
+    invalid = client.get("/v1/seashell/", params={"sort": "description"})
+
+    # Check if the filters and the order are applied
+    assert response.status_code == 200
+    assert [s["name"] for s in response.json()["data"]] == ["Cowrie", "Conch"]
+    assert invalid.status_code == 422
+
+
+def test_update_seashell_single_statement(db_session):
+    _, client = db_session
+
+    files = {"image": ("image.png", create_image(), "image/png")}
+    data = {
+        "name": "Seashell",
+        "collected_at": "2024-02-01T14:30:45",
+        "species": "snail",
+    }
+    result = client.post("/v1/seashell/", data=data, files=files)
+    url = f"/v1/seashell/{result.json()['data']['id']}"
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        updated = client.patch(url, data={"species": "cowrie"})
+        deleted = client.delete(url)
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+    # Check if each write is a single statement
+    assert updated.json()["data"]["species"] == "cowrie"
+    assert updated.json()["data"]["name"] == "Seashell"
+    assert deleted.json()["data"]["species"] == "cowrie"
+    writes = [s for s in statements if s.startswith(("UPDATE", "DELETE"))]
+    assert len(writes) == 2
+    assert all("RETURNING" in s for s in writes)
+    assert not any(s.startswith("SELECT seashells.id") for s in statements)
+
+
+def test_update_and_delete_seashells_bulk(db_session, mocker):
+    session, client = db_session
+    task_sessions = []
+
+    def task_database():
+        task_sessions.append(TestingSessionLocal())  # not the request session
+        yield task_sessions[-1]
+
+    mocker.patch("app.delivery.seashells.get_database", task_database)
+
+    ids = []
+    for i in range(3):
+        image = Image.new("RGB", (100, 100), color=(i, i, i))  # one image each
+        image_data = BytesIO()
+        image.save(image_data, format="PNG")
+        image_data.seek(0)
+        files = {"image": ("image.png", image_data, "image/png")}
+        data = {
+            "name": f"Seashell_{i}",
+            "collected_at": "2024-02-01T14:30:45",
+            "species": "snail",
+        }
+        ids.append(client.post("/v1/seashell/", data=data, files=files).json()["data"])
+
+    updated = client.patch(
+        "/v1/seashell/bulk",
+        json={
+            "ids": [ids[0]["id"], ids[1]["id"], 100],
+            "changes": {"species": "cowrie"},
+        },
+    )
+    deleted = client.request(
+        "DELETE", "/v1/seashell/bulk", json={"filter": {"species": "cowrie"}}
+    )
+    remaining = client.get("/v1/seashell/")
+    invalid = client.request("DELETE", "/v1/seashell/bulk", json={"filter": {}})
+    empty_prefix = {"filter": {"name_prefix": ""}}
+    empty_delete = client.request("DELETE", "/v1/seashell/bulk", json=empty_prefix)
+    empty_update = client.patch(
+        "/v1/seashell/bulk", json={**empty_prefix, "changes": {"name": "wiped"}}
+    )
+
+    # Check if the results are reported per id and orphaned images removed
+    assert updated.status_code == 200
+    assert [r["status"] for r in updated.json()["data"]] == [
+        "updated",
+        "updated",
+        "not_found",
+    ]
+    assert sorted(r["id"] for r in deleted.json()["data"]) == [
+        ids[0]["id"],
+        ids[1]["id"],
+    ]
+    assert not os.path.exists(ids[0]["image_url"])
+    assert os.path.exists(ids[2]["image_url"])
+    assert len(task_sessions) == 1 and task_sessions[0] is not session
+    assert [s["name"] for s in remaining.json()["data"]] == ["Seashell_2"]
+    assert invalid.status_code == 422
+    assert empty_delete.status_code == 422  # would match every row
+    assert empty_update.status_code == 422
+    assert client.get("/v1/seashell/").json()["data"][0]["name"] == "Seashell_2"
+
+
+def test_fast_json_response_shape(db_session, mocker):
+    _, client = db_session
+    files = {"image": ("image.png", create_image(), "image/png")}
+    data = {
+        "name": "Seashell",
+        "collected_at": "2024-02-01T14:30:45",
+        "species": "snail",
+    }
+    seashell = client.post("/v1/seashell/", data=data, files=files).json()["data"]
+
+    paths = [
+        "/v1/seashell/",
+        f"/v1/seashell/{seashell['id']}",
+        "/v1/seashell/search?q=seash",
+    ]
+    fast = [client.get(path).json() for path in paths]
+    mocker.patch("app.delivery.responses.orjson", None)  # pydantic-core fallback
+    fallback = [client.get(path).json() for path in paths]
+    mocker.patch("app.delivery.responses.FAST_JSON", False)
+    validated = [client.get(path).json() for path in paths]
+
+    # Check if every serializer produces the same JSON body
+    assert fast == fallback == validated
+    assert fast[0]["next_cursor"] is None
+    assert fast[1]["data"]["collected_at"] == "2024-02-01T14:30:45"
+    assert fast[2]["data"] == fast[0]["data"]
+
+
+def create_gradient_image(width=120, flip=False):
+    img = Image.new("RGB", (120, 90))
+    draw = ImageDraw.Draw(img)
+    for x in range(120):
+        draw.line([(x, 0), (x, 90)], fill=((x * 7) % 256, x, 255 - x))
+    if flip:
+        img = img.transpose(Image.Transpose.FLIP_LEFT_RIGHT)
+    img_byte_arr = BytesIO()
+    img.resize((width, width * 3 // 4)).save(img_byte_arr, format="PNG")
+    img_byte_arr.seek(0)
+
+    return img_byte_arr
+
+
+def test_get_similar_seashells(db_session, mocker):
+    _, client = db_session
+    data = {
+        "name": "Seashell",
+        "collected_at": "2024-02-01T14:30:45",
+        "species": "snail",
+    }
+    ids = []
+    for image in [create_gradient_image(), create_gradient_image(flip=True)]:
+        files = {"image": ("image.png", image, "image/png")}
+        ids.append(
+            client.post("/v1/seashell/", data=data, files=files).json()["data"]["id"]
+        )
+
+    mocker.patch("app.delivery.seashells.SIMILAR_WARN_ON_UPLOAD", True)
+    files = {"image": ("image.png", create_gradient_image(width=60), "image/png")}
+    resized = client.post("/v1/seashell/", data=data, files=files)
+    response = client.get(f"/v1/seashell/{ids[0]}/similar")
+    missing = client.get("/v1/seashell/9999/similar")
+
+    # Check if only the resized copy is found, both on upload and on lookup
+    assert resized.status_code == 201
+    assert resized.headers["X-Similar-Seashells"] == str(ids[0])
+    assert response.status_code == 200
+    assert [item["id"] for item in response.json()["data"]] == [
+        resized.json()["data"]["id"]
+    ]
+    assert response.json()["data"][0]["distance"] <= 6
+    assert missing.status_code == 404
+
+
+def test_get_seashell_stats(db_session):
+    _, client = db_session
+    for name, species in [("a", "snail"), ("b", "snail"), ("c", "clam")]:
+        files = {"image": ("image.png", create_image(), "image/png")}
+        data = {"name": name, "collected_at": "2024-02-01T14:30:45", "species": species}
+        client.post("/v1/seashell/", data=data, files=files)
+
+    response = client.get("/v1/seashell/stats")
+    snails = client.get("/v1/seashell/stats?species=snail")
+
+    # Check if the counts come back per species and per collection month
+    assert response.status_code == 200
+    assert response.json()["data"] == {
+        "total": 3,
+        "species": [{"species": "clam", "count": 1}, {"species": "snail", "count": 2}],
+        "months": [{"month": "2024-02", "count": 3}],
+    }
+    assert snails.json()["data"]["total"] == 2
+
+
+def test_get_seashell_conditional(db_session, mocker):
+    _, client = db_session
+    files = {"image": ("image.png", create_image(), "image/png")}
+    data = {
+        "name": "Seashell",
+        "collected_at": "2024-02-01T14:30:45",
+        "species": "snail",
+    }
+    url = f"/v1/seashell/{client.post('/v1/seashell/', data=data, files=files).json()['data']['id']}"
+
+    first = client.get(url)
+    etag = first.headers["etag"]
+    unchanged = client.get(url, headers={"If-None-Match": etag})
+    since = client.get(
+        url, headers={"If-Modified-Since": first.headers["last-modified"]}
+    )
+    client.patch(url, data={"name": "Seashell_renamed"})
+    changed = client.get(url, headers={"If-None-Match": etag})
+    mocker.patch("app.delivery.responses.FAST_JSON", False)
+    validated = client.get(url)
+
+    # Check if unchanged shells answer 304 without a body and changes are seen
+    assert unchanged.status_code == 304
+    assert unchanged.content == b""
+    assert unchanged.headers["etag"] == etag
+    assert since.status_code == 304
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+    assert changed.json()["data"]["name"] == "Seashell_renamed"
+    assert validated.headers["etag"] == changed.headers["etag"]
+    assert (
+        client.get("/v1/seashell/100", headers={"If-None-Match": etag}).status_code
+        == 404
+    )
+
+
+def test_get_all_seashell_conditional(db_session):
+    _, client = db_session
+    files = {"image": ("image.png", create_image(), "image/png")}
+    data = {
+        "name": "Seashell",
+        "collected_at": "2024-02-01T14:30:45",
+        "species": "snail",
+    }
+    empty = client.get("/v1/seashell/")
+    seashell_id = client.post("/v1/seashell/", data=data, files=files).json()["data"][
+        "id"
+    ]
+
+    first = client.get("/v1/seashell/")
+    unchanged = client.get(
+        "/v1/seashell/", headers={"If-None-Match": first.headers["etag"]}
+    )
+    client.delete(f"/v1/seashell/{seashell_id}")
+    deleted = client.get(
+        "/v1/seashell/", headers={"If-None-Match": first.headers["etag"]}
+    )
+
+    # Check if the collection validator follows inserts and deletes
+    assert empty.headers["etag"] != first.headers["etag"]
+    assert "last-modified" not in empty.headers
+    assert unchanged.status_code == 304
+    assert deleted.status_code == 200
+    assert deleted.json()["data"] == []
+
+
+def test_get_all_seashell_if_modified_since_after_delete(db_session):
+    _, client = db_session
+    data = {
+        "name": "Seashell",
+        "collected_at": "2024-02-01T14:30:45",
+        "species": "snail",
+    }
+    ids = []
+    for _ in range(2):
+        files = {"image": ("image.png", create_image(), "image/png")}
+        ids.append(
+            client.post("/v1/seashell/", data=data, files=files).json()["data"]["id"]
+        )
+
+    first = client.get("/v1/seashell/")
+    client.delete(f"/v1/seashell/{ids[0]}")  # the newest updated_at stays the same
+    since = client.get(
+        "/v1/seashell/", headers={"If-Modified-Since": "Fri, 01 Jan 2100 00:00:00 GMT"}
+    )
+
+    # Check if a delete is never hidden behind a 304 on If-Modified-Since
+    assert "last-modified" not in first.headers
+    assert since.status_code == 200
+    assert [s["id"] for s in since.json()["data"]] == [ids[1]]
+
+
+def test_import_has_no_side_effects():
+    code = (
+        "import sys, app.main, app.repository.seashells as repo;"
+        "print(repo._engine is None, 'PIL' in sys.modules)"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+
+    # Check if importing the app neither opens the database nor loads PIL
+    assert result.stdout.split() == ["True", "False"]
+
+
+def test_app_lifespan(mocker):
+    init_db = mocker.patch("app.main.init_db")
+    dispose_db = mocker.patch("app.main.dispose_db")
+    shutdown = mocker.spy(image_pool, "shutdown")
+
+    with TestClient(create_app()) as client:
+        response = client.get("/")
+        started = init_db.call_count
+
+    # Check if resources are created on startup and released on shutdown
+    assert response.status_code == 200
+    assert started == 1
+    dispose_db.assert_called_once()
+    shutdown.assert_called_once()
+
+
+def test_app_lifespan_with_several_workers(mocker):
+    mocker.patch("app.main.init_db")
+    mocker.patch("app.main.dispose_db")
+    cache = mocker.patch("app.main.seashell_cache", TTLCache())
+    mocker.patch.dict(os.environ, {"SEASHELL_WORKERS": "4"})
+
+    with TestClient(create_app()):
+        enabled = cache.set(1, "one")
+
+    # Check if the per process cache is off, writes would leave the others stale
+    assert enabled is False
+
+
+def test_serve(mocker):
+    import main
+
+    run = mocker.patch("main.uvicorn.run")
+    init_db = mocker.patch("app.repository.seashells.init_db")
+    mocker.patch("app.repository.seashells.dispose_db")
+    mocker.patch.dict(os.environ)
+
+    main.serve(1, "127.0.0.1", 7777)
+    workers = os.environ["SEASHELL_WORKERS"]
+    main.serve(1, "127.0.0.1", 7777, reload=True)
+
+    # Check if one worker is a production server, reloading only on request
+    assert run.call_args_list == [
+        mocker.call(
+            "app.main:create_app", factory=True, host="127.0.0.1", port=7777, workers=1
+        ),
+        mocker.call("app.main:app", host="127.0.0.1", port=7777, reload=True),
+    ]
+    assert workers == "1"
+    init_db.assert_called_once()
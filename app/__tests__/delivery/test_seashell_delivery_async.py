@@ -0,0 +1,144 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from io import BytesIO
+from PIL import Image
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+from app.main import include_seashell_routers
+from app.models.seashells import Base
+from app.delivery.seashells import get_database as get_db
+from app.delivery.seashells_async import get_async_database as get_async_db
+from app.usecase.cache import seashell_cache
+from app.app_testconfig import TEST_DATABASE_URL, TEST_ASYNC_DATABASE_URL
+
+# Create a test db engine
+engine = create_engine(TEST_DATABASE_URL)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+async_engine = create_async_engine(TEST_ASYNC_DATABASE_URL, poolclass=NullPool)
+TestingAsyncSessionLocal = async_sessionmaker(
+    bind=async_engine, autoflush=False, expire_on_commit=False
+)
+
+# An app served in async mode
+app = FastAPI()
+include_seashell_routers(app, async_mode=True)
+
+
+@pytest.fixture
+def client():
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    seashell_cache.clear()  # ids are reused between tests
+
+    async def override_get_async_db():
+        async with TestingAsyncSessionLocal() as session:
+            yield session
+
+    def override_get_db():  # endpoints without an async twin
+        session = TestingSessionLocal()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    app.dependency_overrides[get_db] = override_get_db
+
+    yield TestClient(app)
+
+    Base.metadata.drop_all(bind=engine)  # Cleanup database
+    app.dependency_overrides.clear()  # Clear dependency overrides
+
+
+def create_image():
+    blank_image = Image.new("RGB", (100, 100), color="white")
+    img_byte_arr = BytesIO()
+    blank_image.save(img_byte_arr, format="PNG")
+    img_byte_arr.seek(0)
+
+    return img_byte_arr
+
+
+def test_seashell_crud(client):
+    files = {"image": ("image.png", create_image(), "image/png")}
+    data = {
+        "name": "Seashell",
+        "collected_at": "2024-02-01T14:30:45",
+        "species": "snail",
+        "description": "seashell description",
+    }
+
+    created = client.post("/v1/seashell/", data=data, files=files)
+    url = f"/v1/seashell/{created.json()['data']['id']}"
+    retrived = client.get(url)
+    listed = client.get("/v1/seashell/")
+    updated = client.patch(url, data={"name": "Updated_Seashell"})
+    deleted = client.delete(url)
+    missing = client.get(url)
+
+    # Check if every endpoint is served by the async path
+    assert created.status_code == 201
+    assert retrived.json()["data"]["name"] == "Seashell"
+    assert len(listed.json()["data"]) == 1
+    assert updated.json()["data"]["name"] == "Updated_Seashell"
+    assert updated.json()["data"]["species"] == "snail"
+    assert deleted.json()["message"] == "Seashell deleted successfully"
+    assert missing.status_code == 404
+
+
+def test_invalid_add_seashell(client):
+    files = {"image": ("image.pdf", "fake content", "application/pdf")}
+    data = {
+        "name": "Seashell",
+        "collected_at": "2024-02-01T14:30:45",
+        "species": "snail",
+    }
+
+    response = client.post("/v1/seashell/", data=data, files=files)
+
+    # Check if the response
+    assert response.status_code == 400
+
+
+def test_sync_routes_still_served(client):
+    response = client.get("/v1/seashell/search", params={"q": "cowrie"})
+
+    # Check if static sync paths are not shadowed by /{seashell_id}
+    assert response.status_code == 200
+    assert response.json()["data"] == []
+
+
+def test_get_seashell_conditional(client):
+    files = {"image": ("image.png", create_image(), "image/png")}
+    data = {
+        "name": "Seashell",
+        "collected_at": "2024-02-01T14:30:45",
+        "species": "snail",
+    }
+    seashell_id = client.post("/v1/seashell/", data=data, files=files).json()["data"][
+        "id"
+    ]
+
+    one = client.get(f"/v1/seashell/{seashell_id}")
+    listed = client.get("/v1/seashell/")
+    one_again = client.get(
+        f"/v1/seashell/{seashell_id}", headers={"If-None-Match": one.headers["etag"]}
+    )
+    listed_again = client.get(
+        "/v1/seashell/", headers={"If-None-Match": listed.headers["etag"]}
+    )
+
+    client.delete(f"/v1/seashell/{seashell_id}")
+    listed_since = client.get(
+        "/v1/seashell/", headers={"If-Modified-Since": "Fri, 01 Jan 2100 00:00:00 GMT"}
+    )
+
+    # Check if the async endpoints answer conditional requests the same way
+    assert one_again.status_code == 304
+    assert listed_again.status_code == 304
+    assert "last-modified" not in listed.headers
+    assert listed_since.status_code == 200
+    assert listed_since.json()["data"] == []
@@ -0,0 +1,84 @@
+import os
+from io import BytesIO
+from PIL import Image
+from app.images.derivatives import DerivativeCache, resize_image
+
+
+def create_image_bytes(width=200, height=100):
+    blank_image = Image.new("RGB", (width, height), color="white")
+    img_byte_arr = BytesIO()
+    blank_image.save(img_byte_arr, format="PNG")
+
+    return img_byte_arr.getvalue()
+
+
+def test_resize_image():
+    resized = Image.open(BytesIO(resize_image(create_image_bytes(), 50)))
+
+    # Assertions
+    assert resized.size == (50, 25)  # Aspect ratio is kept
+    assert resized.format == "PNG"
+
+
+def test_resize_image_no_upscale():
+    data = create_image_bytes()
+
+    # Assertions
+    assert resize_image(data, 400) == data
+
+
+def test_derivative_cache_get_put(tmp_path):
+    cache = DerivativeCache(folder=str(tmp_path), max_bytes=1024)
+
+    miss = cache.get("abcd", "png")
+    path = cache.put("abcd", "png", b"resized")
+    hit = cache.get("abcd", "png")
+
+    # Assertions
+    assert miss is None
+    assert hit == path
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_derivative_cache_eviction(tmp_path):
+    cache = DerivativeCache(folder=str(tmp_path), max_bytes=20)
+
+    first = cache.put("aaaa", "png", b"12345678")
+    second = cache.put("bbbb", "png", b"12345678")
+    cache.get("aaaa", "png")  # first is now the most recently used
+    third = cache.put("cccc", "png", b"12345678")
+
+    # Assertions
+    assert os.path.exists(first)
+    assert not os.path.exists(second)  # Least recently used is evicted
+    assert os.path.exists(third)
+    assert cache.stats()["bytes"] == 16
+    assert cache.stats()["evictions"] == 1
+
+
+def test_derivative_cache_budget_is_shared(tmp_path):
+    # Two workers on one folder share a single budget
+    worker_1 = DerivativeCache(folder=str(tmp_path), max_bytes=20)
+    worker_2 = DerivativeCache(folder=str(tmp_path), max_bytes=20)
+
+    first = worker_1.put("aaaa", "png", b"12345678")
+    second = worker_2.put("bbbb", "png", b"12345678")
+    third = worker_1.put("cccc", "png", b"12345678")
+
+    # Assertions
+    assert not os.path.exists(first)  # oldest of the folder, whoever wrote it
+    assert os.path.exists(second) and os.path.exists(third)
+    assert worker_2.stats()["bytes"] == 16
+    assert worker_2.get("cccc", "png") == third
+
+
+def test_derivative_cache_reload(tmp_path):
+    path = DerivativeCache(folder=str(tmp_path)).put("abcd", "png", b"resized")
+
+    # A new cache picks up files written by an earlier run
+    cache = DerivativeCache(folder=str(tmp_path))
+
+    # Assertions
+    assert cache.get("abcd", "png") == path
+    assert cache.stats()["bytes"] == len(b"resized")
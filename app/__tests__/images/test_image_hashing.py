@@ -0,0 +1,55 @@
+import random
+from PIL import Image, ImageDraw
+from app.images.hashing import (
+    dhash,
+    hamming_distance,
+    hash_chunks,
+    chunk_probes,
+    to_signed,
+)
+
+
+def create_gradient(size=(120, 90)):
+    img = Image.new("RGB", size)
+    draw = ImageDraw.Draw(img)
+    for x in range(size[0]):
+        draw.line([(x, 0), (x, size[1])], fill=((x * 7) % 256, x % 256, 255 - x % 256))
+
+    return img
+
+
+def test_dhash_near_duplicates():
+    original = create_gradient()
+    resized = original.resize((60, 45))
+    edited = original.copy()
+    ImageDraw.Draw(edited).rectangle([0, 0, 10, 10], fill="black")
+    other = original.transpose(Image.Transpose.FLIP_LEFT_RIGHT)
+
+    # Assertions
+    assert hamming_distance(dhash(original), dhash(resized)) <= 2
+    assert hamming_distance(dhash(original), dhash(edited)) <= 6
+    assert hamming_distance(dhash(original), dhash(other)) > 20
+    assert -(2**63) <= dhash(original) < 2**63  # fits a SQLite integer
+
+
+def test_hash_chunks_match_generated_columns():
+    image_hash = to_signed(0xFEDC_BA98_7654_3210)
+
+    # Assertions
+    assert hash_chunks(image_hash) == [0xFEDC, 0xBA98, 0x7654, 0x3210]
+    assert hamming_distance(image_hash, to_signed(0x7EDC_BA98_7654_3211)) == 2
+
+
+def test_chunk_probes_find_every_match():
+    rng = random.Random(0)
+    for distance in (0, 3, 6, 11):
+        for _ in range(50):
+            image_hash = to_signed(rng.getrandbits(64))
+            flipped = rng.sample(range(64), distance)
+            near = to_signed((image_hash ^ sum(1 << bit for bit in flipped)) % 2**64)
+            probes = chunk_probes(image_hash, distance)
+
+            # At least one chunk of every hash within distance is probed
+            assert any(
+                chunk in values for chunk, values in zip(hash_chunks(near), probes)
+            )
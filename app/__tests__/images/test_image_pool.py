@@ -0,0 +1,48 @@
+import pytest
+from io import BytesIO
+from PIL import Image
+from app.images.pool import ImagePool, ImagePoolFull, process_image
+
+
+def create_image_bytes():
+    blank_image = Image.new("RGB", (100, 100), color="white")
+    img_byte_arr = BytesIO()
+    blank_image.save(img_byte_arr, format="PNG")
+
+    return img_byte_arr.getvalue()
+
+
+def test_process_image():
+    data, image_format, image_hash = process_image(create_image_bytes())
+
+    # Assertions
+    assert image_format == "PNG"
+    assert Image.open(BytesIO(data)).size == (100, 100)  # Still a valid image
+
+
+def test_process_invalid_image():
+    with pytest.raises(IOError):
+        process_image(b"fake content")
+
+
+def test_image_pool_run():
+    pool = ImagePool(workers=1, max_pending=2)
+
+    data, image_format, image_hash = pool.run(process_image, create_image_bytes())
+    stats = pool.stats()
+    pool.shutdown()
+
+    # Assertions
+    assert image_format == "PNG"
+    assert stats["processed"] == 1
+    assert stats["pending"] == 0
+
+
+def test_image_pool_full():
+    pool = ImagePool(workers=0, max_pending=0)
+
+    with pytest.raises(ImagePoolFull):
+        pool.run(process_image, create_image_bytes())
+
+    # Assertions
+    assert pool.stats()["rejected"] == 1
@@ -0,0 +1,70 @@
+import os
+from io import BytesIO
+from app.images.store import (
+    store_image,
+    delete_image,
+    restore_image,
+    trash_image,
+    restore_trashed_image,
+)
+
+
+def test_store_image(tmp_path):
+    folder = str(tmp_path)
+
+    path = store_image(BytesIO(b"seashell image"), "png", folder=folder)
+
+    # Assertions
+    relative = os.path.relpath(path, folder).split(os.sep)
+    assert len(relative) == 3  # Two shard directories and the blob
+    assert relative[2].startswith(relative[0] + relative[1])
+    assert relative[2].endswith(".png")
+    with open(path, "rb") as image_file:
+        assert image_file.read() == b"seashell image"
+
+
+def test_store_duplicate_image(tmp_path):
+    folder = str(tmp_path)
+
+    first = store_image(BytesIO(b"seashell image"), "png", folder=folder)
+    second = store_image(BytesIO(b"seashell image"), "png", folder=folder)
+    other = store_image(BytesIO(b"another image"), "png", folder=folder)
+
+    # Assertions
+    assert first == second  # Stored once
+    assert first != other
+    assert not [name for name in os.listdir(folder) if name.endswith(".tmp")]
+
+
+def test_delete_image(tmp_path):
+    folder = str(tmp_path / "images")
+    path = store_image(BytesIO(b"seashell image"), "png", folder=folder)
+    outside = tmp_path / "outside.png"
+    outside.write_bytes(b"keep me")
+
+    # Assertions
+    assert delete_image(path, folder=folder) is True
+    assert not os.path.exists(path)
+    assert delete_image(path, folder=folder) is False  # Already gone
+    assert delete_image(str(outside), folder=folder) is False
+    assert outside.exists()
+
+
+def test_trash_and_restore_image(tmp_path):
+    folder = str(tmp_path / "images")
+    path = store_image(BytesIO(b"seashell image"), "png", folder=folder)
+
+    trash_path = trash_image(path, folder=folder)
+    trashed = os.path.exists(path)
+    restore_trashed_image(trash_path, path)
+    restored = restore_image(path, b"seashell image", folder=folder)
+    delete_image(path, folder=folder)
+    rewritten = restore_image(path, b"seashell image", folder=folder)
+
+    # Assertions
+    assert trashed is False and trash_path.startswith(path)
+    assert restored is False  # still there, nothing to do
+    assert rewritten is True
+    with open(path, "rb") as image_file:
+        assert image_file.read() == b"seashell image"
+    assert trash_image(os.path.join(folder, "missing.png"), folder=folder) is None
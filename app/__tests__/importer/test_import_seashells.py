@@ -0,0 +1,145 @@
+import json
+import os
+import pytest
+from PIL import Image
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from import_seashells import import_seashells
+from app.models.seashells import Base, ImportProgress
+from app.usecase import seashells as usecase
+from app.repository.seashells import get_all_seashells
+from app.app_testconfig import TEST_DATABASE_URL
+
+# Create a test db
+engine = create_engine(TEST_DATABASE_URL)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+@pytest.fixture
+def db_session():
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    session = TestingSessionLocal()
+    yield session
+    session.close()
+    Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+def collection(tmp_path):
+    images_dir = tmp_path / "images"
+    images_dir.mkdir()
+    Image.new("RGB", (10, 10), color="white").save(images_dir / "white.png")
+    (images_dir / "broken.png").write_text("not an image")
+
+    records = [
+        {
+            "name": "a",
+            "species": "snail",
+            "collected_at": "2024-02-01T14:30:45",
+            "image": "white.png",
+        },
+        {
+            "name": "b",
+            "species": "snail",
+            "collected_at": "2024-02-02T10:00:00",
+            "image": "white.png",
+        },
+        {
+            "name": "c",
+            "species": "clam",
+            "collected_at": "2024-02-03T10:00:00",
+            "image": "broken.png",
+        },
+        {
+            "name": "d",
+            "species": "clam",
+            "collected_at": "not a date",
+            "image": "white.png",
+        },
+        {
+            "name": "e",
+            "species": "clam",
+            "collected_at": "2024-02-05T10:00:00",
+            "image": "missing.png",
+        },
+    ]
+    path = tmp_path / "shells.jsonl"
+    path.write_text("".join(json.dumps(record) + "\n" for record in records))
+
+    return str(path), str(images_dir), str(tmp_path / "store")
+
+
+def test_import_seashells(db_session, collection):
+    path, images_dir, folder = collection
+    reports = []
+
+    # Call the function
+    result = import_seashells(
+        path,
+        images_dir,
+        db_session,
+        workers=0,
+        batch_size=2,
+        folder=folder,
+        report=reports.append,
+    )
+
+    # Assertions
+    assert result["imported"] == 2
+    assert result["rejected"] == [
+        (3, "Invalid image file"),
+        (4, "Invalid collected_at"),
+        (5, "Missing image file"),
+    ]
+    seashells = get_all_seashells(db_session)
+    assert [s.name for s in seashells] == ["a", "b"]
+    assert seashells[0].image_url == seashells[1].image_url  # stored once
+    assert len(reports) == 3 and reports[-1].startswith("5 records, 2 imported")
+
+
+def test_import_seashells_resume(db_session, collection):
+    path, images_dir, folder = collection
+    # A previous run committed row 1
+    db_session.add(ImportProgress(source=os.path.abspath(path), records_done=1))
+    db_session.commit()
+
+    # Call the function
+    result = import_seashells(
+        path, images_dir, db_session, workers=0, folder=folder, report=lambda _: None
+    )
+
+    # Assertions
+    assert result["skipped"] == 1
+    assert [s.name for s in get_all_seashells(db_session)] == ["b"]
+
+
+def test_import_seashells_killed_after_commit(db_session, collection, mocker):
+    path, images_dir, folder = collection
+    add_seashells = usecase.add_seashells
+
+    def add_then_die(*args, **kwargs):
+        add_seashells(*args, **kwargs)
+        raise KeyboardInterrupt()  # the batch is committed, nothing after it ran
+
+    mocker.patch.object(usecase, "add_seashells", add_then_die)
+    with pytest.raises(KeyboardInterrupt):
+        import_seashells(
+            path, images_dir, db_session, workers=0, batch_size=2, folder=folder
+        )
+    mocker.stopall()
+
+    # Call the function
+    result = import_seashells(
+        path,
+        images_dir,
+        db_session,
+        workers=0,
+        batch_size=2,
+        folder=folder,
+        report=lambda _: None,
+    )
+
+    # Assertions, the committed batch is never imported twice
+    assert result["skipped"] == 2
+    assert [s.name for s in get_all_seashells(db_session)] == ["a", "b"]
@@ -0,0 +1,152 @@
+import logging
+import pstats
+from io import BytesIO
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+from sqlalchemy.orm import sessionmaker
+from fastapi.routing import APIRoute
+from app.main import app, create_app
+from app.models.seashells import Base
+from app.delivery.seashells import get_database as get_db
+from app.metrics.registry import Counter, Histogram, MetricsRegistry
+from app.metrics.profiling import ProfileSession
+from app.repository.database import create_db_engine
+from app.usecase.cache import seashell_cache
+from app.app_testconfig import TEST_DATABASE_URL
+
+# Instrumented like the app engine, so queries are counted
+engine = create_db_engine(TEST_DATABASE_URL)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+@pytest.fixture
+def client():
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    session = TestingSessionLocal()
+    seashell_cache.clear()
+
+    def override_get_db():
+        yield session
+
+    app.dependency_overrides[get_db] = override_get_db
+
+    yield TestClient(app)
+
+    session.close()
+    Base.metadata.drop_all(bind=engine)
+    app.dependency_overrides.clear()
+
+
+def test_histogram_render():
+    registry = MetricsRegistry()
+    histogram = registry.register(
+        Histogram("test_seconds", "A test histogram", ("route",), (0.1, 1.0))
+    )
+    counter = registry.register(
+        Counter("test_events_total", "A test counter", ("route",))
+    )
+
+    histogram.observe(0.1, route="/a")
+    histogram.observe(0.5, route="/a")
+    histogram.observe(5, route="/a")
+    counter.inc(route='/"b"')
+
+    # Assertions
+    lines = registry.render().splitlines()
+    assert "# TYPE test_seconds histogram" in lines
+    assert 'test_seconds_bucket{route="/a",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{route="/a",le="1.0"} 2' in lines
+    assert 'test_seconds_bucket{route="/a",le="+Inf"} 3' in lines
+    assert 'test_seconds_count{route="/a"} 3' in lines
+    assert "# HELP test_events_total A test counter" in lines
+    assert "# TYPE test_events_total counter" in lines
+    assert 'test_events_total{route="/\\"b\\""} 1' in lines
+
+
+def test_metrics_endpoint(client):
+    image_data = BytesIO()
+    Image.new("RGB", (10, 10), color="white").save(image_data, format="PNG")
+    image_data.seek(0)
+    files = {"image": ("image.png", image_data, "image/png")}
+    data = {
+        "name": "Seashell",
+        "collected_at": "2024-02-01T14:30:45",
+        "species": "snail",
+    }
+    seashell_id = client.post("/v1/seashell/", data=data, files=files).json()["data"][
+        "id"
+    ]
+    client.get(f"/v1/seashell/{seashell_id}")
+
+    response = client.get("/metrics")
+
+    # Check if requests are labelled by route template and their queries counted
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert (
+        'seashell_request_duration_seconds_count{method="GET",'
+        'route="/v1/seashell/{seashell_id}",status="200"}' in response.text
+    )
+    assert 'seashell_request_queries_bucket{method="POST",route="/v1/seashell/"' in (
+        response.text
+    )
+    assert "seashell_image_processing_seconds_count" in response.text
+
+
+def test_slow_request_log(client, mocker, caplog):
+    mocker.patch("app.metrics.middleware.SLOW_REQUEST_SECONDS", 0)
+
+    with caplog.at_level(logging.WARNING, logger="app.metrics"):
+        client.get("/v1/seashell/")
+
+    # Check if the slow request is logged together with its SQL
+    assert "Slow request GET /v1/seashell/" in caplog.text
+    assert "queries=2" in caplog.text  # collection validator, then the page
+    assert "FROM seashells" in caplog.text
+
+
+def test_profiled_request(client, mocker, tmp_path):
+    mocker.patch("app.metrics.profiling.PROFILING_ENABLED", True)
+    mocker.patch("app.metrics.profiling.PROFILE_DIR", str(tmp_path))
+    save = mocker.spy(ProfileSession, "save")
+    start = mocker.spy(ProfileSession, "start")
+
+    plain = client.get("/v1/seashell/")
+    response = client.get("/v1/seashell/", headers={"X-Profile": "1"})
+
+    # Check if only the flagged request is profiled, endpoint code included
+    assert "x-profile-id" not in plain.headers
+    profile_id = response.headers["x-profile-id"]
+    stats = pstats.Stats(save.spy_return)
+    assert save.spy_return == str(tmp_path / f"{profile_id}.pstats")
+    assert any(name == "get_seashells_page" for _, _, name in stats.stats)
+    assert start.call_count == 1  # never nested, Python 3.12+ refuses that
+
+
+def wrap_depth(endpoint):
+    depth = 0
+    while hasattr(endpoint, "__wrapped__"):
+        endpoint, depth = endpoint.__wrapped__, depth + 1
+    return depth
+
+
+@pytest.mark.parametrize("async_mode", [False, True])
+def test_endpoints_profiled_once(async_mode):
+    routes = [
+        route for route in create_app(async_mode).routes if isinstance(route, APIRoute)
+    ]
+    depths = {route.path: wrap_depth(route.endpoint) for route in routes}
+
+    # Check if include_router does not wrap the sync endpoints a second time
+    assert max(depths.values()) == 1
+    assert depths["/v1/seashell/export"] == 1
+
+
+def test_profiling_disabled(client):
+    response = client.get("/v1/seashell/", headers={"X-Profile": "1"})
+
+    # Check if the header is ignored unless profiling is enabled
+    assert response.status_code == 200
+    assert "x-profile-id" not in response.headers
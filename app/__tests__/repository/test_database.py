@@ -0,0 +1,86 @@
+import pytest
+from sqlalchemy import text, inspect
+from sqlalchemy.exc import OperationalError
+from app.models.seashells import Base
+from app.repository.database import (
+    create_db_engine,
+    create_schema,
+    use_explicit_transactions,
+)
+
+
+def test_create_db_engine_pragmas(tmp_path):
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'seashell.db'}")
+
+    with engine.connect() as connection:
+        journal_mode = connection.execute(text("PRAGMA journal_mode")).scalar()
+        busy_timeout = connection.execute(text("PRAGMA busy_timeout")).scalar()
+        synchronous = connection.execute(text("PRAGMA synchronous")).scalar()
+
+    # Assertions
+    assert journal_mode == "wal"
+    assert busy_timeout > 0
+    assert synchronous == 1  # NORMAL
+    assert engine.pool.size() > 1
+
+
+def test_create_db_engine_memory():
+    engine = create_db_engine("sqlite://")
+
+    with engine.connect() as connection:
+        result = connection.execute(text("SELECT 1")).scalar()
+
+    # Assertions
+    assert result == 1
+
+
+def test_create_schema_adds_missing_indexes(tmp_path):
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'seashell.db'}")
+    with engine.begin() as connection:  # a table created before the indexes existed
+        connection.execute(
+            text(
+                "CREATE TABLE seashells (id INTEGER PRIMARY KEY, created_at DATETIME,"
+                " updated_at DATETIME, collected_at DATETIME NOT NULL, name VARCHAR,"
+                " species VARCHAR, description VARCHAR(200), image_url VARCHAR)"
+            )
+        )
+
+    create_schema(engine, Base.metadata)
+    indexes = {index["name"] for index in inspect(engine).get_indexes("seashells")}
+    columns = {column["name"] for column in inspect(engine).get_columns("seashells")}
+
+    # Assertions
+    assert {
+        "ix_seashells_species",
+        "ix_seashells_collected_at",
+        "ix_seashells_updated_at",
+        "ix_seashells_name",
+        "ix_seashells_image_hash_0",
+    } <= indexes
+    assert {"image_hash", "image_hash_0", "image_hash_3"} <= columns
+
+
+def test_read_only_engine(tmp_path):
+    database_url = f"sqlite:///{tmp_path / 'seashell.db'}"
+    writer = use_explicit_transactions(create_db_engine(database_url))
+    create_schema(writer, Base.metadata)
+    reader = create_db_engine(database_url, read_only=True)
+
+    with writer.connect() as write_connection:
+        write_connection.begin()  # holds the write lock, BEGIN IMMEDIATE
+        write_connection.execute(
+            text("INSERT INTO seashells (collected_at) VALUES ('2024-02-01')")
+        )
+        with reader.connect() as read_connection:  # not blocked by the writer
+            count = read_connection.execute(
+                text("SELECT count(*) FROM seashells")
+            ).scalar()
+            query_only = read_connection.execute(text("PRAGMA query_only")).scalar()
+            with pytest.raises(OperationalError):
+                read_connection.execute(text("DELETE FROM seashells"))
+        write_connection.commit()
+
+    # Assertions
+    assert count == 0  # uncommitted rows stay invisible to readers
+    assert query_only == 1
+    assert "mode=ro" in str(reader.url)
@@ -1,6 +1,6 @@
 import pytest
 from datetime import datetime
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker
 from app.models.seashells import SeaShell, Base
 from app.repository.seashells import (
@@ -9,6 +9,21 @@ from app.repository.seashells import (
     get_seashell,
     update_seashell,
     delete_seashell,
+    iter_seashell_batches,
+    add_seashells,
+    count_image_references,
+    search_seashells,
+    update_seashell_by_id,
+    delete_seashell_by_id,
+    update_seashells,
+    delete_seashells,
+    get_seashell_stat_counts,
+    rebuild_seashell_stats,
+    iter_similar_candidates,
+    get_seashells_by_ids,
+    get_unhashed_image_urls,
+    set_image_hashes,
+    seashells_page_statement,
 )
 from app.app_testconfig import TEST_DATABASE_URL
 
@@ -145,3 +160,363 @@ def test_delete_seashell(db_session):
     # Assertions
     assert removed_obj.name == "seashell1"  # Validate the created seashell
     assert result == None  # After remove, nothing found
+
+
+def test_get_all_seashells_after_id(db_session):
+    for i in range(3):
+        db_session.add(
+            SeaShell(
+                collected_at=datetime.strptime(
+                    "2024-02-01T14:30:45", "%Y-%m-%dT%H:%M:%S"
+                ),
+                name=f"seashell{i}",
+                species="snails",
+                description="collected from cox's bazar",
+                image_url="static/images/seashell_images/seashell-1.png",
+            )
+        )
+    db_session.commit()
+
+    # Call the function
+    results = get_all_seashells(db_session, after_id=1, limit=1)
+
+    # Assertions
+    assert len(results) == 1
+    assert results[0].id == 2  # Seeks past the given id
+
+
+def test_iter_seashell_batches(db_session):
+    for i in range(5):
+        db_session.add(
+            SeaShell(
+                collected_at=datetime.strptime(
+                    "2024-02-01T14:30:45", "%Y-%m-%dT%H:%M:%S"
+                ),
+                name=f"seashell{i}",
+                species="snails",
+                description="collected from cox's bazar",
+                image_url="static/images/seashell_images/seashell-1.png",
+            )
+        )
+    db_session.commit()
+
+    # Call the function
+    batches = list(iter_seashell_batches(db_session, batch_size=2))
+
+    # Assertions
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+    assert batches[0][0]["name"] == "seashell0"  # Rows come back as plain dicts
+
+
+def test_add_seashells(db_session):
+    seashells = [
+        {
+            "collected_at": datetime.strptime(
+                "2024-02-01T14:30:45", "%Y-%m-%dT%H:%M:%S"
+            ),
+            "name": f"seashell{i}",
+            "species": "snails",
+            "description": "collected from cox's bazar",
+            "image_url": "static/images/seashell_images/seashell-1.png",
+        }
+        for i in range(5)
+    ]
+
+    # Call the function
+    seashell_ids = add_seashells(seashells=seashells, db=db_session, chunk_size=2)
+
+    # Assertions
+    assert len(seashell_ids) == 5
+    assert get_seashell(seashell_id=seashell_ids[4], db=db_session).name == "seashell4"
+
+
+def test_count_image_references(db_session):
+    for i in range(2):
+        db_session.add(
+            SeaShell(
+                collected_at=datetime.strptime(
+                    "2024-02-01T14:30:45", "%Y-%m-%dT%H:%M:%S"
+                ),
+                name=f"seashell{i}",
+                species="snails",
+                description="collected from cox's bazar",
+                image_url="static/images/seashell_images/seashell-1.png",
+            )
+        )
+    db_session.commit()
+
+    # Call the function
+    result = count_image_references(
+        image_url="static/images/seashell_images/seashell-1.png", db=db_session
+    )
+
+    # Assertions
+    assert result == 2
+
+
+def test_search_seashells(db_session):
+    seashell1 = SeaShell(
+        collected_at=datetime.strptime("2024-02-01T14:30:45", "%Y-%m-%dT%H:%M:%S"),
+        name="cowrie",
+        species="snails",
+        description="collected from cox's bazar",
+        image_url="static/images/seashell_images/seashell-1.png",
+    )
+    seashell2 = SeaShell(
+        collected_at=datetime.strptime("2024-02-01T14:30:45", "%Y-%m-%dT%H:%M:%S"),
+        name="conch",
+        species="snails",
+        description="collected from saint martin",
+        image_url="static/images/seashell_images/seashell-2.png",
+    )
+    db_session.add(seashell1)
+    db_session.add(seashell2)
+    db_session.commit()
+
+    # Call the function
+    results = search_seashells(query='"cowrie" "bazar"', db=db_session)
+
+    seashell2.description = "collected from cox's bazar"
+    db_session.commit()
+    updated_results = search_seashells(query='"bazar"', db=db_session)
+
+    db_session.delete(seashell1)
+    db_session.commit()
+    deleted_results = search_seashells(query='"cowrie"', db=db_session)
+
+    # Assertions
+    assert [s.name for s in results] == ["cowrie"]
+    assert len(updated_results) == 2  # Index follows updates
+    assert deleted_results == []  # And deletes
+
+
+def test_get_all_seashells_filter_sort(db_session):
+    for i, (species, day) in enumerate(
+        [("snails", 3), ("clams", 1), ("snails", 1), ("snails", 2)]
+    ):
+        db_session.add(
+            SeaShell(
+                collected_at=datetime(2024, 2, day, 14, 30, 45),
+                name=f"seashell{i}",
+                species=species,
+                image_url="static/images/seashell_images/seashell-1.png",
+            )
+        )
+    db_session.commit()
+
+    # Call the function
+    results = get_all_seashells(
+        db_session,
+        sort="collected_at",
+        descending=True,
+        species="snails",
+        collected_from=datetime(2024, 2, 1),
+        collected_to=datetime(2024, 2, 2, 23, 59, 59),
+    )
+    prefixed = get_all_seashells(db_session, sort="name", name_prefix="seashell1")
+    by_id = get_all_seashells(
+        db_session,
+        species="snails",
+        collected_from=datetime(2024, 2, 2),
+        name_prefix="seashell",
+    )
+
+    # Assertions
+    assert [s.name for s in results] == ["seashell3", "seashell2"]
+    assert [s.name for s in prefixed] == ["seashell1"]
+    assert [s.name for s in by_id] == ["seashell0", "seashell3"]
+
+
+@pytest.mark.parametrize(
+    "filters",
+    [
+        {"species": "snails"},
+        {"species": "snails", "collected_from": datetime(2024, 2, 1)},
+        {"species": "snails", "collected_to": datetime(2024, 2, 1), "descending": True},
+        {"species": "snails", "name_prefix": "sea"},
+        {"species": "snails", "sort": "updated_at"},
+        {"species": "snails", "sort": "collected_at"},
+        {"species": "snails", "sort": "name", "name_prefix": "sea"},
+        {"collected_from": datetime(2024, 2, 1), "sort": "collected_at"},
+    ],
+)
+def test_seashells_page_plan(db_session, filters):
+    statement = seashells_page_statement(**filters).compile(
+        engine, compile_kwargs={"literal_binds": True}
+    )
+    plan = [
+        row[3] for row in db_session.execute(text(f"EXPLAIN QUERY PLAN {statement}"))
+    ]
+
+    # Assertions, read in index order, the scan stops after the page
+    assert not any("TEMP B-TREE" in step for step in plan), plan
+
+
+def test_update_seashell_by_id(db_session):
+    seashell1 = SeaShell(
+        collected_at=datetime.strptime("2024-02-01T14:30:45", "%Y-%m-%dT%H:%M:%S"),
+        name="seashell1",
+        species="snails",
+        description="collected from cox's bazar",
+        image_url="static/images/seashell_images/seashell-1.png",
+    )
+    db_session.add(seashell1)
+    db_session.commit()
+
+    # Call the function
+    result = update_seashell_by_id(
+        seashell_id=seashell1.id, changes={"name": "seashell1-new"}, db=db_session
+    )
+    missing = update_seashell_by_id(
+        seashell_id=100, changes={"name": "seashell1-new"}, db=db_session
+    )
+
+    # Assertions
+    assert result.name == "seashell1-new"  # The new row is returned
+    assert result.species == "snails"  # Untouched columns are kept
+    assert missing is None
+
+
+def test_delete_seashell_by_id(db_session):
+    seashell1 = SeaShell(
+        collected_at=datetime.strptime("2024-02-01T14:30:45", "%Y-%m-%dT%H:%M:%S"),
+        name="seashell1",
+        species="snails",
+        description="collected from cox's bazar",
+        image_url="static/images/seashell_images/seashell-1.png",
+    )
+    db_session.add(seashell1)
+    db_session.commit()
+    seashell_id = seashell1.id
+
+    # Call the function
+    removed = delete_seashell_by_id(seashell_id=seashell_id, db=db_session)
+    missing = delete_seashell_by_id(seashell_id=seashell_id, db=db_session)
+
+    # Assertions
+    assert removed.name == "seashell1"
+    assert missing is None
+    assert get_seashell(seashell_id=seashell_id, db=db_session) is None
+
+
+def test_update_and_delete_seashells(db_session):
+    for i, species in enumerate(["snails", "clams", "snails"]):
+        db_session.add(
+            SeaShell(
+                collected_at=datetime.strptime(
+                    "2024-02-01T14:30:45", "%Y-%m-%dT%H:%M:%S"
+                ),
+                name=f"seashell{i}",
+                species=species,
+                image_url=f"static/images/seashell_images/seashell-{i}.png",
+            )
+        )
+    db_session.commit()
+
+    # Call the functions
+    updated_ids = update_seashells(
+        changes={"species": "cowries"}, db=db_session, seashell_ids=[1, 2, 100]
+    )
+    filtered_ids = update_seashells(
+        changes={"name": "renamed"}, db=db_session, species="snails"
+    )
+    deleted_rows = delete_seashells(db=db_session, species="cowries")
+
+    # Assertions
+    assert sorted(updated_ids) == [1, 2]
+    assert filtered_ids == [3]
+    assert sorted(row.id for row in deleted_rows) == [1, 2]
+    assert deleted_rows[0].image_url.startswith("static/images/")
+    assert [s.name for s in get_all_seashells(db_session)] == ["renamed"]
+
+
+def test_seashell_stats_follow_writes(db_session):
+    seashells = [
+        {"collected_at": datetime(2024, 2, 1), "name": "a", "species": "snails"},
+        {"collected_at": datetime(2024, 2, 9), "name": "b", "species": "snails"},
+        {"collected_at": datetime(2024, 3, 1), "name": "c", "species": "clams"},
+    ]
+    ids = add_seashells(seashells, db_session)
+
+    # Call the functions
+    update_seashell_by_id(ids[0], {"collected_at": datetime(2024, 3, 5)}, db_session)
+    update_seashells({"species": "clams"}, db_session, seashell_ids=[ids[1]])
+    delete_seashell_by_id(ids[2], db_session)
+
+    # Assertions
+    assert get_seashell_stat_counts(db_session, "species") == [
+        ("clams", 1),
+        ("snails", 1),
+    ]
+    assert get_seashell_stat_counts(db_session, "month") == [
+        ("2024-02", 1),
+        ("2024-03", 1),
+    ]
+    assert get_seashell_stat_counts(db_session, "month", "snails") == [("2024-03", 1)]
+
+
+def test_rebuild_seashell_stats(db_session):
+    add_seashells(
+        [{"collected_at": datetime(2024, 2, 1), "name": "a", "species": "snails"}],
+        db_session,
+    )
+    db_session.execute(text("UPDATE seashell_stats SET count = 42"))  # drift
+    db_session.commit()
+
+    # Call the function
+    groups = rebuild_seashell_stats(db_session)
+
+    # Assertions
+    assert groups == 1
+    assert get_seashell_stat_counts(db_session, "species") == [("snails", 1)]
+
+
+def test_iter_similar_candidates(db_session):
+    image_hashes = [0x0F0F_0000_0000_0001, 0x0F0F_0000_0000_0007, -1, None]
+    for i, image_hash in enumerate(image_hashes):
+        add_seashell(
+            SeaShell(
+                collected_at=datetime(2024, 2, 1),
+                name=f"seashell{i}",
+                species="snails",
+                image_url=f"static/images/seashell_images/seashell-{i}.png",
+                image_hash=image_hash,
+            ),
+            db_session,
+        )
+
+    close = list(iter_similar_candidates(image_hashes[0], 3, db_session))
+    near = iter_similar_candidates(image_hashes[0], 2, db_session, exclude_id=1)
+    batches = iter_similar_candidates(image_hashes[0], 3, db_session, batch_size=1)
+    signed = next(iter_similar_candidates(-2, 1, db_session))
+
+    # Assertions, candidates share a hash chunk, the caller checks the distance
+    assert len(close) == 1 and {row.id for row in close[0]} == {1, 2}
+    assert [row.id for batch in near for row in batch] == [2]
+    assert [len(batch) for batch in batches] == [1, 1]  # every candidate, paged
+    assert signed == [(3, -1)]  # sign bit set
+    assert sorted(row.id for row in get_seashells_by_ids([2, 3, 100], db_session)) == [
+        2,
+        3,
+    ]
+
+
+def test_set_image_hashes(db_session):
+    for i, image_url in enumerate(["a.png", "a.png", "b.png"]):
+        add_seashell(
+            SeaShell(
+                collected_at=datetime(2024, 2, 1),
+                name=f"seashell{i}",
+                species="snails",
+                image_url=image_url,
+            ),
+            db_session,
+        )
+
+    first = get_unhashed_image_urls(db_session, limit=1)
+    set_image_hashes({"a.png": 42}, db_session)
+
+    # Assertions
+    assert first == ["a.png"]
+    assert get_unhashed_image_urls(db_session) == ["b.png"]
+    assert [row.image_hash for row in db_session.query(SeaShell)] == [42, 42, None]
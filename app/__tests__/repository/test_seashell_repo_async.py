@@ -0,0 +1,86 @@
+import asyncio
+import pytest
+from datetime import datetime
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import NullPool
+from app.models.seashells import SeaShell, Base
+from app.repository.seashells_async import (
+    add_seashell,
+    get_seashell,
+    get_all_seashells,
+    update_seashell_by_id,
+    delete_seashell_by_id,
+)
+from app.app_testconfig import TEST_DATABASE_URL, TEST_ASYNC_DATABASE_URL
+
+# Create a test db, the schema is managed through the sync engine
+engine = create_engine(TEST_DATABASE_URL)
+async_engine = create_async_engine(TEST_ASYNC_DATABASE_URL, poolclass=NullPool)
+TestingAsyncSessionLocal = async_sessionmaker(
+    bind=async_engine, autoflush=False, expire_on_commit=False
+)
+
+
+@pytest.fixture
+def db_schema():
+    Base.metadata.drop_all(bind=engine)  # Clean schema
+    Base.metadata.create_all(bind=engine)  # Create tables
+    yield
+    Base.metadata.drop_all(bind=engine)  # Drop tables after test
+
+
+def create_seashell(name="seashell1"):
+    return SeaShell(
+        collected_at=datetime.strptime("2024-02-01T14:30:45", "%Y-%m-%dT%H:%M:%S"),
+        name=name,
+        species="snails",
+        description="collected from cox's bazar",
+        image_url="static/images/seashell_images/seashell-1.png",
+    )
+
+
+def test_add_and_get_seashell(db_schema):
+    async def scenario():
+        async with TestingAsyncSessionLocal() as db:
+            created = await add_seashell(seashell=create_seashell(), db=db)
+            return await get_seashell(seashell_id=created.id, db=db)
+
+    result = asyncio.run(scenario())
+
+    # Assertions
+    assert result.name == "seashell1"
+
+
+def test_get_all_seashells(db_schema):
+    async def scenario():
+        async with TestingAsyncSessionLocal() as db:
+            for name in ["seashell1", "seashell2", "seashell3"]:
+                await add_seashell(seashell=create_seashell(name), db=db)
+            return await get_all_seashells(db, after_id=1, limit=1)
+
+    results = asyncio.run(scenario())
+
+    # Assertions
+    assert [s.name for s in results] == ["seashell2"]
+
+
+def test_update_and_delete_seashell(db_schema):
+    async def scenario():
+        async with TestingAsyncSessionLocal() as db:
+            created = await add_seashell(seashell=create_seashell(), db=db)
+            updated = await update_seashell_by_id(
+                created.id, {"name": "seashell1-new"}, db
+            )
+            removed = await delete_seashell_by_id(created.id, db)
+            missing = await update_seashell_by_id(created.id, {"name": "gone"}, db)
+            return updated, removed, missing, await get_seashell(created.id, db)
+
+    updated, removed, missing, result = asyncio.run(scenario())
+
+    # Assertions
+    assert updated.name == "seashell1-new"
+    assert updated.species == "snails"  # untouched columns are kept
+    assert removed.name == "seashell1-new"
+    assert missing is None
+    assert result is None  # After remove, nothing found
@@ -0,0 +1,127 @@
+import threading
+from datetime import datetime
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.models.seashells import SeaShell, Base
+from app.repository.coalescer import WriteCoalescer
+from app.repository.seashells import (
+    init_db,
+    dispose_db,
+    get_db,
+    add_seashell,
+    insert_seashell,
+    update_seashell_by_id,
+    delete_seashell_by_id,
+    get_all_seashells,
+)
+from app.usecase.seashells import (
+    update_seashell_by_id as update_seashell_by_id_usecase,
+    delete_seashell_by_id as delete_seashell_by_id_usecase,
+)
+from app.app_testconfig import TEST_DATABASE_URL
+
+# Create a test db
+engine = create_engine(TEST_DATABASE_URL)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+@pytest.fixture
+def db_session():
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    session = TestingSessionLocal()
+    yield session
+    session.close()
+    Base.metadata.drop_all(bind=engine)
+
+
+def new_seashell(name: str):
+    return SeaShell(
+        collected_at=datetime(2024, 2, 1, 14, 30, 45),
+        name=name,
+        species="snails",
+        image_url="static/images/seashell_images/seashell.png",
+    )
+
+
+def test_write_coalescer_batches_concurrent_writes(db_session):
+    coalescer = WriteCoalescer(TEST_DATABASE_URL, max_batch=64, window_seconds=0.2)
+    results = {}
+
+    def failing_insert(seashell, db):
+        insert_seashell(seashell, db)  # flushed, then undone by its savepoint
+        raise ValueError("rejected")
+
+    def write(i):
+        operation = failing_insert if i % 5 == 0 else insert_seashell
+        try:
+            results[i] = coalescer.submit(operation, new_seashell(f"seashell{i}"))
+        except ValueError as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=write, args=(i,)) for i in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = coalescer.stats()
+    coalescer.shutdown()
+
+    # Assertions
+    assert sum(isinstance(r, ValueError) for r in results.values()) == 4
+    assert all(results[i].name == f"seashell{i}" for i in range(20) if i % 5)
+    assert len(get_all_seashells(db_session, limit=100)) == 16
+    assert stats["operations"] == 20 and stats["batches"] < 20
+    assert stats["failed"] == 4
+
+
+def test_repository_writes_through_coalescer(db_session, mocker):
+    coalescer = WriteCoalescer(TEST_DATABASE_URL)
+    mocker.patch("app.repository.seashells.WRITE_COALESCING", True)
+    mocker.patch("app.repository.seashells.write_coalescer", coalescer)
+
+    # Call the functions
+    seashell = add_seashell(new_seashell("seashell1"), db_session)
+    updated = update_seashell_by_id(seashell.id, {"name": "renamed"}, db_session)
+    missing = update_seashell_by_id(100, {"name": "renamed"}, db_session)
+    deleted = delete_seashell_by_id(seashell.id, db_session)
+    coalescer.shutdown()
+
+    # Assertions
+    assert seashell.id == 1 and seashell.updated_at is not None
+    assert updated.name == "renamed"
+    assert missing is None
+    assert deleted.id == seashell.id
+    assert get_all_seashells(db_session) == []
+
+
+def test_coalescer_with_read_write_split(tmp_path, mocker):
+    database_url = f"sqlite:///{tmp_path / 'seashell.db'}"
+    coalescer = WriteCoalescer(database_url)
+    mocker.patch("app.repository.seashells.DATABASE_URL", database_url)
+    mocker.patch("app.repository.seashells.READ_WRITE_SPLIT", True)
+    mocker.patch("app.repository.seashells.WRITE_COALESCING", True)
+    mocker.patch("app.repository.seashells.write_coalescer", coalescer)
+    trash_image = mocker.patch("app.usecase.seashells.trash_image", return_value=None)
+    dispose_db()
+    init_db()
+    db = next(get_db())
+
+    # Lookups on the writer session before and after each coalesced write,
+    # like a PATCH that replaces the image
+    try:
+        seashell = add_seashell(new_seashell("seashell1"), db)
+        updated = update_seashell_by_id_usecase(
+            seashell.id, {"image_url": "static/images/seashell_images/new.png"}, db
+        )
+        deleted = delete_seashell_by_id_usecase(seashell.id, db)
+    finally:
+        db.close()
+        coalescer.shutdown()
+        dispose_db()
+
+    # Assertions
+    assert updated.image_url == "static/images/seashell_images/new.png"
+    assert deleted.id == seashell.id
+    assert trash_image.call_count == 2  # old image, then the replaced one
@@ -0,0 +1,133 @@
+import asyncio
+import threading
+from datetime import datetime
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from app.models.seashells import Base, seashell_changes_ddl
+from app.schemas.seashells import CreateSeaShellReq
+from app.usecase.changes import ChangeFeed, resume_changes, get_changes
+from app.usecase.seashells import (
+    add_seashell,
+    add_seashells,
+    update_seashell_by_id,
+    delete_seashell_by_id,
+)
+from app.delivery import seashells as delivery
+from app.app_testconfig import TEST_DATABASE_URL
+
+# Create a test db engine
+engine = create_engine(TEST_DATABASE_URL)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+@pytest.fixture
+def db_session():
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    session = TestingSessionLocal()
+    yield session
+    session.close()
+    Base.metadata.drop_all(bind=engine)
+
+
+def new_seashellreq(name="seashell"):
+    return CreateSeaShellReq(
+        collected_at=datetime(2024, 2, 1),
+        name=name,
+        species="snails",
+        image_url="static/images/seashell_images/seashell-1.png",
+    )
+
+
+def test_get_changes(db_session):
+    seashell_id = add_seashell(new_seashellreq(), db_session).id
+    bulk_ids = add_seashells([new_seashellreq(), new_seashellreq()], db_session)
+    update_seashell_by_id(seashell_id, {"name": "renamed"}, db_session)
+    update_seashell_by_id(999, {"name": "missing"}, db_session)  # no change logged
+    delete_seashell_by_id(seashell_id, db_session)
+
+    events, sequence, resync = get_changes(0, db_session)
+    first, first_sequence, _ = get_changes(0, db_session, limit=2)
+
+    # Assertions, consecutive changes with the same op share one event
+    assert resync is False
+    assert events == [
+        (3, {"op": "create", "ids": [seashell_id] + bulk_ids}),
+        (4, {"op": "update", "ids": [seashell_id]}),
+        (5, {"op": "delete", "ids": [seashell_id]}),
+    ]
+    assert sequence == 5
+    assert first == [(2, {"op": "create", "ids": [seashell_id, bulk_ids[0]]})]
+    assert first_sequence == 2
+    assert get_changes(5, db_session) == ([], 5, False)
+
+
+def test_get_changes_after_prune(db_session, mocker):
+    with engine.begin() as connection:  # keep only the two newest changes
+        connection.execute(text("DROP TRIGGER seashell_changes_prune"))
+        connection.exec_driver_sql(seashell_changes_ddl(max_events=2)[-1])
+    add_seashells([new_seashellreq(f"seashell{i}") for i in range(4)], db_session)
+    feed = mocker.patch("app.usecase.changes.change_feed", ChangeFeed())
+
+    # Assertions
+    assert get_changes(1, db_session) == ([], 4, True)  # changes 2 and 3 are gone
+    assert get_changes(2, db_session)[0] == [(4, {"op": "create", "ids": [3, 4]})]
+    assert feed.resyncs == 1
+
+
+def test_resume_changes(db_session):
+    add_seashells([new_seashellreq(), new_seashellreq()], db_session)
+
+    # Assertions
+    assert resume_changes(None, db_session) == (2, False)  # starts at the newest
+    assert resume_changes("0", db_session) == (0, False)
+    assert resume_changes("1", db_session) == (1, False)
+    assert resume_changes("5", db_session) == (2, True)  # another database
+    assert resume_changes("1a2b3c4d-1", db_session) == (2, True)
+
+
+def test_change_feed_wait_wakes_on_notify():
+    feed = ChangeFeed()
+
+    async def subscribe():
+        notified = feed.notified()
+        timed_out = await feed.wait(notified, timeout=0.01)
+        threading.Timer(0.05, feed.notify).start()  # another thread
+        woken = await feed.wait(notified, timeout=5)
+        return timed_out, woken, await feed.wait(notified, timeout=5)
+
+    # Assertions, a notify before the wait is not missed either
+    assert asyncio.run(subscribe()) == (False, True, True)
+
+
+def test_change_events_stream(db_session, mocker):
+    def test_database(request=None):
+        yield TestingSessionLocal()
+
+    mocker.patch.object(delivery, "get_database", test_database)
+    mocker.patch.object(delivery, "CHANGE_FEED_POLL_SECONDS", 0.05)
+    add_seashell(new_seashellreq(), db_session)
+
+    async def read(last_event_id, write=None):
+        stream = delivery.change_events(None, last_event_id)
+        message = asyncio.ensure_future(stream.__anext__())
+        await asyncio.sleep(0.1)  # subscribed, waiting for changes
+        if write is not None:
+            await asyncio.to_thread(write)
+        messages = [await message]
+        await stream.aclose()
+        return messages
+
+    def other_worker():  # no notify, only the poll sees it
+        with engine.begin() as connection:
+            connection.execute(text("UPDATE seashells SET name = 'renamed'"))
+
+    live = asyncio.run(read(None, other_worker))
+    resumed = asyncio.run(read("1"))
+    unknown = asyncio.run(read("99"))
+
+    # Assertions
+    assert live == ['id: 2\nevent: change\ndata: {"op":"update","ids":[1]}\n\n']
+    assert resumed == live
+    assert unknown == ["id: 2\nevent: resync\ndata: {}\n\n"]
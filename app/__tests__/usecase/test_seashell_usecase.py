@@ -1,5 +1,7 @@
+import os
 import pytest
 from datetime import datetime
+from io import BytesIO
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from app.models.seashells import Base
@@ -10,7 +12,28 @@ from app.usecase.seashells import (
     get_all_seashells,
     update_seashell,
     delete_seashell,
+    get_seashells_page,
+    export_seashells_csv,
+    add_seashells,
+    get_seashell_response,
+    search_seashells,
+    build_search_query,
+    update_seashells,
+    delete_seashells,
+    hash_stored_images,
+    get_similar_seashells,
+    find_similar_seashells,
+    get_database,
+    update_seashell_by_id,
+    delete_seashell_by_id,
+    release_image,
 )
+from app.schemas.seashells import BulkUpdateReq, BulkDeleteReq
+from pydantic import ValidationError
+from app.usecase.cache import TTLCache, seashell_cache
+from app.usecase.changes import change_feed
+from app.repository.seashells import iter_similar_candidates
+from app.images.store import store_image, delete_image
 from app.app_testconfig import TEST_DATABASE_URL
 
 # Create a test db engine
@@ -25,6 +48,7 @@ def db_session():
     Base.metadata.drop_all(bind=engine)  # Clean schema
     Base.metadata.create_all(bind=engine)  # Create tables
     session = TestingSessionLocal()
+    seashell_cache.clear()  # ids are reused between tests
     yield session
     session.close()
     Base.metadata.drop_all(bind=engine)  # Drop tables after test
@@ -139,3 +163,334 @@ def test_delete_seashell(db_session):
 
     # Assertions to check
     assert result is None
+
+
+def test_get_seashells_page(db_session):
+    for i in range(3):
+        seashell_data = CreateSeaShellReq(
+            collected_at=datetime.strptime("2024-02-01T14:30:45", "%Y-%m-%dT%H:%M:%S"),
+            name=f"seashell{i}",
+            species="snails",
+            description="collected from cox's bazar",
+            image_url="static/images/seashell_images/seashell-1.png",
+        )
+        _ = add_seashell(seashellreq=seashell_data, db=db_session)
+
+    first_page, next_cursor = get_seashells_page(db=db_session, limit=2)
+    second_page, last_cursor = get_seashells_page(
+        db=db_session, cursor=next_cursor, limit=2
+    )
+
+    # Assertions to check
+    assert [s.name for s in first_page] == ["seashell0", "seashell1"]
+    assert [s.name for s in second_page] == ["seashell2"]
+    assert last_cursor is None  # No more pages
+
+
+def test_get_seashells_page_invalid_cursor(db_session):
+    with pytest.raises(ValueError):
+        get_seashells_page(db=db_session, cursor="not-a-cursor")
+
+
+def test_export_seashells_csv(db_session):
+    seashell_data = CreateSeaShellReq(
+        collected_at=datetime.strptime("2024-02-01T14:30:45", "%Y-%m-%dT%H:%M:%S"),
+        name="seashell1",
+        species="snails",
+        description="collected from cox's bazar",
+        image_url="static/images/seashell_images/seashell-1.png",
+    )
+    _ = add_seashell(seashellreq=seashell_data, db=db_session)
+
+    lines = "".join(export_seashells_csv(db=db_session)).splitlines()
+
+    # Assertions to check
+    assert lines[0].startswith("id,created_at,updated_at")  # Header row
+    assert len(lines) == 2
+    assert "seashell1" in lines[1]
+
+
+def test_add_seashells(db_session):
+    seashell_data = [
+        CreateSeaShellReq(
+            collected_at=datetime.strptime("2024-02-01T14:30:45", "%Y-%m-%dT%H:%M:%S"),
+            name=f"seashell{i}",
+            species="snails",
+            image_url="static/images/seashell_images/seashell-1.png",
+        )
+        for i in range(3)
+    ]
+
+    seashell_ids = add_seashells(seashellreqs=seashell_data, db=db_session)
+    result = get_seashell(seashell_id=seashell_ids[0], db=db_session)
+
+    # Assertions to check
+    assert len(seashell_ids) == 3
+    assert result.name == "seashell0"
+    assert result.description == "No description provided"  # Default applied
+
+
+def test_get_seashell_response(db_session):
+    seashell_data = CreateSeaShellReq(
+        collected_at=datetime.strptime("2024-02-01T14:30:45", "%Y-%m-%dT%H:%M:%S"),
+        name="seashell1",
+        species="snails",
+        description="collected from cox's bazar",
+        image_url="static/images/seashell_images/seashell-1.png",
+    )
+
+    seashell = add_seashell(seashellreq=seashell_data, db=db_session)
+    first = get_seashell_response(seashell_id=seashell.id, db=db_session)
+    second = get_seashell_response(seashell_id=seashell.id, db=db_session)
+    missing = get_seashell_response(seashell_id=100, db=db_session)
+
+    # Assertions to check
+    assert first["name"] == "seashell1"
+    assert second is first  # Served from the cache
+    assert missing is None
+
+
+def test_ttl_cache():
+    cache = TTLCache(max_entries=2, ttl_seconds=60)
+
+    cache.set(1, "one")
+    cache.set(2, "two")
+    cache.get(1)  # 1 is now the most recently used
+    cache.set(3, "three")
+    generation = cache.generation()
+    cache.invalidate(3)
+
+    # Assertions to check
+    assert cache.get(2) is None  # Evicted
+    assert cache.get(1) == "one"
+    assert cache.get(3) is None  # Invalidated
+    assert cache.set(3, "stale", generation) is False  # Loaded before the write
+    assert cache.stats()["evictions"] == 1
+
+
+def test_ttl_cache_expiry():
+    cache = TTLCache(max_entries=2, ttl_seconds=0)
+
+    cache.set(1, "one")
+
+    # Assertions to check
+    assert cache.get(1) is None
+
+
+def test_ttl_cache_disable():
+    cache = TTLCache(max_entries=2, ttl_seconds=60)
+
+    cache.set(1, "one")
+    cache.disable()
+
+    # Assertions to check
+    assert cache.get(1) is None
+    assert cache.set(1, "one") is False
+    assert cache.get(1) is None
+
+
+def test_build_search_query():
+    # Assertions to check
+    assert build_search_query("Cowrie from cox's baz") == (
+        '"cowrie" "from" "cox" "s" "baz"*'
+    )
+    with pytest.raises(ValueError):
+        build_search_query("'*")
+
+
+def test_search_seashells(db_session):
+    for name in ["cowrie", "cowrie tiger", "conch"]:
+        seashell_data = CreateSeaShellReq(
+            collected_at=datetime.strptime("2024-02-01T14:30:45", "%Y-%m-%dT%H:%M:%S"),
+            name=name,
+            species="snails",
+            description="collected from cox's bazar",
+            image_url="static/images/seashell_images/seashell-1.png",
+        )
+        _ = add_seashell(seashellreq=seashell_data, db=db_session)
+
+    first_page, next_cursor = search_seashells(
+        text="cowrie from cox's bazar", db=db_session, limit=1
+    )
+    second_page, last_cursor = search_seashells(
+        text="cowrie from cox's bazar", db=db_session, cursor=next_cursor, limit=1
+    )
+
+    # Assertions to check
+    assert len(first_page) == 1
+    assert {first_page[0].name, second_page[0].name} == {"cowrie", "cowrie tiger"}
+    assert last_cursor is None
+
+
+def test_get_seashells_page_sorted(db_session):
+    for name in ["b", "a", "c", "a"]:
+        seashell_data = CreateSeaShellReq(
+            collected_at=datetime.strptime("2024-02-01T14:30:45", "%Y-%m-%dT%H:%M:%S"),
+            name=name,
+            species="snails",
+            image_url="static/images/seashell_images/seashell-1.png",
+        )
+        _ = add_seashell(seashellreq=seashell_data, db=db_session)
+
+    names, ids, cursor = [], [], None
+    while True:  # Walk every page, ties on the sort key continue by id
+        page, cursor = get_seashells_page(
+            db=db_session, cursor=cursor, limit=1, sort="-name"
+        )
+        names += [s.name for s in page]
+        ids += [s.id for s in page]
+        if cursor is None:
+            break
+
+    by_date, date_cursor = get_seashells_page(
+        db=db_session, limit=3, sort="collected_at"
+    )
+    rest, _ = get_seashells_page(
+        db=db_session, cursor=date_cursor, limit=3, sort="collected_at"
+    )
+
+    # Assertions to check
+    assert names == ["c", "b", "a", "a"]
+    assert ids == [3, 1, 4, 2]
+    assert len(by_date) + len(rest) == 4  # Equal dates are not skipped
+    with pytest.raises(ValueError):  # A cursor can't switch to another order
+        get_seashells_page(db=db_session, cursor=date_cursor, sort="name")
+
+
+def test_update_and_delete_seashells(db_session):
+    for i in range(2):
+        seashell_data = CreateSeaShellReq(
+            collected_at=datetime.strptime("2024-02-01T14:30:45", "%Y-%m-%dT%H:%M:%S"),
+            name=f"seashell{i}",
+            species="snails",
+            image_url="static/images/seashell_images/seashell-1.png",
+        )
+        _ = add_seashell(seashellreq=seashell_data, db=db_session)
+    cached = get_seashell_response(seashell_id=1, db=db_session)
+
+    updated = update_seashells(
+        bulkreq=BulkUpdateReq(ids=[1, 7], changes={"species": "cowries"}),
+        db=db_session,
+    )
+    refreshed = get_seashell_response(seashell_id=1, db=db_session)
+    deleted, image_urls = delete_seashells(
+        bulkreq=BulkDeleteReq(filter={"species": "snails"}), db=db_session
+    )
+
+    # Assertions to check
+    assert [(r.id, r.status) for r in updated] == [(1, "updated"), (7, "not_found")]
+    assert cached["species"] == "snails"
+    assert refreshed["species"] == "cowries"  # The cache was invalidated
+    assert [(r.id, r.status) for r in deleted] == [(2, "deleted")]
+    assert image_urls == ["static/images/seashell_images/seashell-1.png"]
+
+
+def test_bulk_request_needs_a_target():
+    with pytest.raises(ValidationError):
+        BulkDeleteReq(filter={})
+    with pytest.raises(ValidationError):
+        BulkDeleteReq(ids=[1], filter={"species": "snails"})
+
+
+def test_hash_stored_images(db_session, tmp_path):
+    from PIL import Image
+
+    image_path = str(tmp_path / "seashell.png")
+    Image.new("RGB", (40, 30), color="blue").save(image_path)
+    seashellreqs = [
+        CreateSeaShellReq(
+            collected_at=datetime(2024, 2, 1),
+            name=f"seashell{i}",
+            species="snails",
+            image_url=image_url,
+        )
+        for i, image_url in enumerate([image_path, image_path, "missing.png"])
+    ]
+    add_seashells(seashellreqs, db_session)
+
+    with pytest.raises(ValueError):  # stored before hashing
+        get_similar_seashells(1, db_session)
+    skipped = []
+    hashed = hash_stored_images(db_session, batch_size=1, report=skipped.append)
+
+    # Assertions
+    assert hashed == 1  # one distinct readable image
+    assert skipped == ["skipped missing.png"]
+    assert [seashell.id for seashell in get_similar_seashells(1, db_session)] == [2]
+    assert get_similar_seashells(99, db_session) is None
+
+
+def test_find_similar_seashells_reads_every_candidate(db_session, mocker):
+    # Far away hashes sharing chunks with 0 first, the near duplicates last
+    image_hashes = [0xFFFF] * 10 + [0b1, 0b11]
+    seashellreqs = [
+        CreateSeaShellReq(
+            collected_at=datetime(2024, 2, 1),
+            name=f"seashell{i}",
+            species="snails",
+            image_url=f"static/images/seashell_images/seashell-{i}.png",
+            image_hash=image_hash,
+        )
+        for i, image_hash in enumerate(image_hashes)
+    ]
+    add_seashells(seashellreqs, db_session)
+    mocker.patch(
+        "app.usecase.seashells.iter_similar_candidates_repo",
+        lambda *args: iter_similar_candidates(*args, batch_size=3),
+    )
+
+    similar = find_similar_seashells(0, db_session, distance=6, limit=5)
+
+    # Assertions, closest first across every batch of candidates
+    assert [(s.id, s.distance) for s in similar] == [(11, 1), (12, 2)]
+    assert similar[0].name == "seashell10"
+
+
+def test_get_database_routes_by_method(mocker):
+    read_session, write_session = mocker.Mock(), mocker.Mock()
+    mocker.patch("app.usecase.seashells.get_read_db", return_value=iter([read_session]))
+    mocker.patch(
+        "app.usecase.seashells.get_db", side_effect=lambda: iter([write_session])
+    )
+
+    # Assertions
+    assert next(get_database(mocker.Mock(method="GET"))) is read_session
+    assert next(get_database(mocker.Mock(method="POST"))) is write_session
+    assert next(get_database()) is write_session  # CLIs write
+
+
+def test_release_image_racing_an_upload(db_session, mocker):
+    image_url = store_image(BytesIO(b"released while reused"), "png")
+    # An upload of the same content commits its row between the two counts
+    count = mocker.patch(
+        "app.usecase.seashells.count_image_references_repo", side_effect=[0, 1, 0, 0]
+    )
+
+    kept = release_image(image_url, db_session)
+    kept_exists = os.path.exists(image_url)
+    released = release_image(image_url, db_session)
+
+    # Assertions
+    assert kept is False and kept_exists
+    assert released is True and not os.path.exists(image_url)
+    assert count.call_count == 4
+    assert not delete_image(image_url)
+
+
+def test_writes_notify_change_streams(db_session):
+    notified = change_feed.notified()
+    seashellreq = CreateSeaShellReq(
+        collected_at=datetime(2024, 2, 1),
+        name="seashell1",
+        species="snails",
+        image_url="static/images/seashell_images/seashell-1.png",
+    )
+
+    seashell_id = add_seashell(seashellreq, db_session).id
+    add_seashells([seashellreq, seashellreq], db_session)
+    update_seashell_by_id(seashell_id, {"name": "renamed"}, db_session)
+    update_seashell_by_id(999, {"name": "missing"}, db_session)  # no change, no wakeup
+    delete_seashell_by_id(seashell_id, db_session)
+
+    # Assertions, the events themselves are logged by triggers
+    assert change_feed.notified() - notified == 4
@@ -1,4 +1,50 @@
 DATABASE_URL = "sqlite:///./seashell.db"
-OFFSET = 0
-LIMIT = 10
+LIMIT = 10  # default page size
+MAX_LIMIT = 100  # largest page size a client may ask for
 IMAGE_FOLDER = "static/images/seashell_images"
+EXPORT_BATCH_SIZE = 1000  # rows fetched per round trip when streaming an export
+BULK_CHUNK_SIZE = 500  # rows per executemany batch in bulk inserts
+BULK_MAX_ITEMS = 10000  # largest number of records one bulk request may carry
+IMAGE_POOL_WORKERS = 2  # processes decoding uploads, 0 runs them inline
+IMAGE_POOL_MAX_PENDING = 8  # uploads queued or in flight before answering 503
+DERIVATIVE_FOLDER = "static/images/derivatives"  # resized copies of stored images
+DERIVATIVE_CACHE_MAX_BYTES = 512 * 1024 * 1024  # least recently used evicted above this
+DERIVATIVE_MAX_WIDTH = 2048
+SEASHELL_CACHE_MAX_ENTRIES = 10000  # single seashell payloads kept in memory
+SEASHELL_CACHE_TTL_SECONDS = 30  # bounds staleness across worker processes
+WORKERS_ENV = "SEASHELL_WORKERS"  # set by "main.py serve", the cache is off above 1
+# SQLite connection tuning, applied to every pooled connection
+SQLITE_JOURNAL_MODE = "WAL"  # readers no longer block the writer
+SQLITE_SYNCHRONOUS = "NORMAL"  # safe with WAL, fsync only at checkpoints
+SQLITE_CACHE_SIZE_KB = 16000  # page cache per connection
+SQLITE_MMAP_SIZE = 256 * 1024 * 1024
+SQLITE_BUSY_TIMEOUT_MS = 5000  # wait for the write lock instead of failing
+DB_POOL_SIZE = 20
+DB_MAX_OVERFLOW = 20  # pool_size + overflow matches the 40 threadpool workers
+DB_POOL_TIMEOUT = 30
+ASYNC_MODE = False  # serve CRUD with async endpoints over ASYNC_DATABASE_URL
+ASYNC_DATABASE_URL = "sqlite+aiosqlite:///./seashell.db"
+FAST_JSON = True  # serialize rows straight to JSON instead of through pydantic models
+SLOW_REQUEST_SECONDS = 0.5  # requests at least this slow are logged with their SQL
+SLOW_REQUEST_LOG_STATEMENTS = 5  # slowest statements kept per request for the log
+PROFILING_ENABLED = False  # allow "X-Profile: 1" requests to run under cProfile
+PROFILE_DIR = "profiles"  # <profile id>.pstats files of profiled requests
+WRITE_COALESCING = False  # group concurrent single row writes into one transaction
+WRITE_COALESCE_MAX_BATCH = 64  # writes committed together at most
+WRITE_COALESCE_WINDOW_SECONDS = 0.002  # how long the first write waits for others
+SIMILAR_DEFAULT_DISTANCE = 6  # differing hash bits still counted as the same picture
+SIMILAR_MAX_DISTANCE = 11  # larger radii probe too many chunk values to stay indexed
+SIMILAR_CANDIDATE_BATCH_SIZE = (
+    1000  # chunk matches streamed per batch, all are compared
+)
+SIMILAR_WARN_ON_UPLOAD = False  # list near duplicates of an upload in a header
+IMAGE_HASH_BATCH_SIZE = 100  # distinct images hashed per commit by hash-images
+READ_WRITE_SPLIT = True  # GET requests read through a separate read only pool
+DB_READ_POOL_SIZE = 32  # read only connections, serve the threadpool's readers
+DB_READ_MAX_OVERFLOW = 8
+DB_WRITE_POOL_SIZE = 4  # SQLite runs one writer at a time, the rest wait here
+DB_WRITE_MAX_OVERFLOW = 0
+CHANGE_FEED_MAX_EVENTS = 10000  # seashell_changes rows kept for resuming subscribers
+CHANGE_FEED_POLL_SECONDS = 1.0  # streams read writes of other processes this often
+CHANGE_FEED_BATCH_SIZE = 500  # change rows read per query
+CHANGE_FEED_HEARTBEAT_SECONDS = 15  # comment sent on idle streams to keep them open
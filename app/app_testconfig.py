@@ -1 +1,2 @@
 TEST_DATABASE_URL = "sqlite:///./seashelltest.db"
+TEST_ASYNC_DATABASE_URL = "sqlite+aiosqlite:///./seashelltest.db"
@@ -0,0 +1,132 @@
+import json
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response as HTTPResponse
+from pydantic import TypeAdapter
+
+from app.schemas.seashells import SeaShellResponse, ResponsePayload, Response
+from app.app_config import FAST_JSON
+
+try:
+    import orjson
+except ImportError:  # optional, pydantic-core serializes the payload instead
+    orjson = None
+
+# Built once, serializes the plain dicts without validating them again
+RESPONSE_PAYLOAD_ADAPTER = TypeAdapter(ResponsePayload)
+RESPONSE_FIELDS = list(SeaShellResponse.model_fields)
+
+
+class FastJSONResponse(HTTPResponse):
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(content)
+        return RESPONSE_PAYLOAD_ADAPTER.dump_json(content)
+
+
+def to_row_dict(seashell):
+    if isinstance(seashell, dict):  # cached payloads are dicts already
+        return seashell
+    if hasattr(seashell, "_mapping"):  # column tuples from the repository
+        return {field: seashell._mapping[field] for field in RESPONSE_FIELDS}
+    return SeaShellResponse.model_validate(seashell).model_dump()
+
+
+def seashell_response(
+    message: str,
+    data,
+    next_cursor: str = None,
+    status_code: int = 200,
+    headers: dict = None,
+):
+    if not FAST_JSON:  # validated through response_model as before
+        response = Response(message=message, data=data, next_cursor=next_cursor)
+        if headers is None:
+            return response
+        return JSONResponse(jsonable_encoder(response), status_code, headers)
+
+    if isinstance(data, list):
+        data = [to_row_dict(seashell) for seashell in data]
+    else:
+        data = to_row_dict(data)
+    return FastJSONResponse(
+        {"message": message, "data": data, "next_cursor": next_cursor},
+        status_code=status_code,
+        headers=headers,
+    )
+
+
+def seashell_etag(seashell_id: int, updated_at: datetime):
+    return f'"{seashell_id}-{updated_at:%Y%m%d%H%M%S%f}"'
+
+
+def collection_etag(updated_at: Optional[datetime], count: int):
+    # Any insert, update or delete moves the newest updated_at or the count
+    version = f"{updated_at:%Y%m%d%H%M%S%f}" if updated_at is not None else "0"
+    return f'"c{count}-{version}"'
+
+
+def validator_headers(etag: str, updated_at: Optional[datetime]):
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}  # revalidate every time
+    if updated_at is not None:  # stored as naive UTC
+        last_modified = updated_at.replace(tzinfo=timezone.utc)
+        headers["Last-Modified"] = format_datetime(last_modified, usegmt=True)
+    return headers
+
+
+def etag_matches(request: Request, etag: str):
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is None:
+        return False
+
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+
+def is_conditional(request: Request):
+    return "if-none-match" in request.headers or "if-modified-since" in request.headers
+
+
+def not_modified(request: Request, etag: str, updated_at: Optional[datetime]):
+    # If-None-Match wins over If-Modified-Since when a client sends both
+    if "if-none-match" in request.headers:
+        return etag_matches(request, etag)
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is None or updated_at is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):  # an invalid date is ignored
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+
+    # HTTP dates have whole seconds
+    modified = updated_at.replace(tzinfo=timezone.utc, microsecond=0)
+    return modified <= since
+
+
+def not_modified_response(headers: dict):
+
+    return HTTPResponse(status_code=304, headers=headers)
+
+
+def similar_headers(similar: list):
+    # Upload warning, the ids of near duplicates without changing the body
+    if not similar:
+        return None
+
+    return {"X-Similar-Seashells": ",".join(str(seashell.id) for seashell in similar)}
+
+
+def sse_message(event: str, data: dict, event_id: str = None):
+    # One Server-Sent Events message, the id is what a client resumes from
+    lines = [f"id: {event_id}"] if event_id is not None else []
+    lines += [f"event: {event}", f"data: {json.dumps(data, separators=(',', ':'))}"]
+    return "\n".join(lines) + "\n\n"
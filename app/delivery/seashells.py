@@ -1,43 +1,113 @@
-from fastapi import APIRouter, Depends, Form, File, UploadFile, HTTPException
+from fastapi import (
+    APIRouter,
+    Depends,
+    Form,
+    File,
+    UploadFile,
+    HTTPException,
+    Query,
+    Request,
+    Header,
+    BackgroundTasks,
+)
+from fastapi.responses import StreamingResponse, FileResponse, Response as HTTPResponse
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from PIL import Image
 import os
+import json
+import time
+from io import BytesIO
 from datetime import datetime
+from typing import List, Literal
 
 from app.usecase.seashells import (
     get_database,
     add_seashell as add_seashell_usecase,
+    add_seashells as add_seashells_usecase,
     get_seashell as get_seashell_usecase,
-    get_all_seashells as get_all_seashells_usecase,
-    update_seashell as update_seashell_usecase,
-    delete_seashell as delete_seashell_usecase,
+    get_seashell_response as get_seashell_response_usecase,
+    get_seashell_updated_at as get_seashell_updated_at_usecase,
+    get_collection_version as get_collection_version_usecase,
+    get_seashells_page as get_seashells_page_usecase,
+    search_seashells as search_seashells_usecase,
+    get_seashell_stats as get_seashell_stats_usecase,
+    export_seashells_ndjson as export_seashells_ndjson_usecase,
+    export_seashells_csv as export_seashells_csv_usecase,
+    update_seashells as update_seashells_usecase,
+    delete_seashells as delete_seashells_usecase,
+    release_images as release_images_usecase,
+    update_seashell_by_id as update_seashell_by_id_usecase,
+    delete_seashell_by_id as delete_seashell_by_id_usecase,
+    get_similar_seashells as get_similar_seashells_usecase,
+    find_similar_seashells as find_similar_seashells_usecase,
+)
+from app.schemas.seashells import (
+    CreateSeaShellReq,
+    Response,
+    BulkItemResult,
+    BulkResponse,
+    BulkUpdateReq,
+    BulkDeleteReq,
+    BulkWriteResponse,
+    StatsResponse,
+    SimilarResponse,
+)
+from app.delivery.responses import (
+    seashell_response,
+    seashell_etag,
+    collection_etag,
+    validator_headers,
+    etag_matches,
+    is_conditional,
+    not_modified,
+    not_modified_response,
+    similar_headers,
+    sse_message,
+)
+from app.usecase.changes import (
+    change_feed,
+    resume_changes as resume_changes_usecase,
+    get_changes as get_changes_usecase,
+)
+from app.metrics.profiling import ProfiledRoute
+from app.images.pool import image_pool, process_image, ImagePoolFull
+from app.images.store import store_image, restore_image
+from app.images.derivatives import derivative_cache, derivative_key, resize_image
+from app.app_config import (
+    LIMIT,
+    MAX_LIMIT,
+    BULK_MAX_ITEMS,
+    DERIVATIVE_MAX_WIDTH,
+    SIMILAR_DEFAULT_DISTANCE,
+    SIMILAR_MAX_DISTANCE,
+    SIMILAR_WARN_ON_UPLOAD,
+    CHANGE_FEED_HEARTBEAT_SECONDS,
+    CHANGE_FEED_POLL_SECONDS,
 )
-from app.schemas.seashells import CreateSeaShellReq, UpdateSeaShellReq, Response
-from app.app_config import IMAGE_FOLDER
 
 seashell_router = APIRouter(
-    prefix="/v1/seashell", tags=["seashells"]
+    prefix="/v1/seashell", tags=["seashells"], route_class=ProfiledRoute
 )  # Categorizes endpoints under "seashell"
 
 
 def save_image(image: UploadFile):
-    filename = image.filename
-
-    if not os.path.exists(
-        IMAGE_FOLDER
-    ):  # if the folder doesn't exist, cretae the folder
-        os.makedirs(IMAGE_FOLDER)
-
-    image_path = os.path.join(IMAGE_FOLDER, filename)
-
     try:
-        img = Image.open(image.file)
-        img.verify()
-        img = Image.open(image.file)  # Reopen the image to use it after verification
-        img.save(image_path)
-        return True, image_path
+        data, image_format, image_hash = image_pool.run(
+            process_image, image.file.read()
+        )
+    except ImagePoolFull:
+        raise HTTPException(
+            status_code=503,
+            detail="Image processing is busy, try again later",
+            headers={"Retry-After": "1"},
+        )
     except (IOError, SyntaxError) as e:
-        return False, None
+        return False, None, None, None
+
+    # Content addressed, so a duplicate upload reuses the stored file. The data
+    # is kept for restore_image() once the row is committed.
+    image_path = store_image(BytesIO(data), image_format.lower())
+    return True, image_path, image_hash, data
 
 
 @seashell_router.post("/", status_code=201,response_model=Response)
@@ -50,7 +120,7 @@ def add_seashells(
     db: Session = Depends(get_database),
 ):
 
-    is_image, image_url = save_image(image)
+    is_image, image_url, image_hash, image_data = save_image(image)
     if is_image:
         date_format = "%Y-%m-%dT%H:%M:%S"
         seashellreq = CreateSeaShellReq(
@@ -59,30 +129,403 @@ def add_seashells(
             species=species,
             description=description,
             image_url=image_url,
+            image_hash=image_hash,
         )
 
         data = add_seashell_usecase(seashellreq, db)
-        return Response(message="Seashell created successfully", data=data)
+        restore_image(image_url, image_data)
+        headers = None
+        if SIMILAR_WARN_ON_UPLOAD:
+            similar = find_similar_seashells_usecase(image_hash, db, exclude_id=data.id)
+            headers = similar_headers(similar)
+        return seashell_response(
+            "Seashell created successfully", data, status_code=201, headers=headers
+        )
     else:
         raise HTTPException(status_code=400, detail="Invalid image file")
 
 
+def build_bulk_seashellreq(record, uploads: dict, saved_images: dict):
+    if not isinstance(record, dict):
+        raise ValueError("Invalid seashell record")
+
+    date_format = "%Y-%m-%dT%H:%M:%S"
+    try:
+        collected_at = datetime.strptime(record.get("collected_at"), date_format)
+    except (TypeError, ValueError):
+        raise ValueError("Invalid collected_at")
+
+    fields = {
+        key: record[key] for key in ("name", "species", "description") if key in record
+    }
+    try:
+        seashellreq = CreateSeaShellReq(
+            collected_at=collected_at, image_url="", **fields
+        )
+    except ValueError:  # pydantic ValidationError
+        raise ValueError("Invalid seashell fields")
+
+    filename = record.get("image")
+    if not isinstance(filename, str) or filename not in uploads:
+        raise ValueError("Missing image file")
+    if filename not in saved_images:  # records may share one uploaded image
+        is_image, image_url, image_hash, image_data = save_image(uploads[filename])
+        saved_images[filename] = (
+            (image_url, image_hash, image_data) if is_image else None
+        )
+    if saved_images[filename] is None:
+        raise ValueError("Invalid image file")
+
+    seashellreq.image_url, seashellreq.image_hash, _ = saved_images[filename]
+    return seashellreq
+
+
+@seashell_router.post("/bulk", status_code=201, response_model=BulkResponse)
+def add_seashells_bulk(
+    seashells: str = Form(...),  # json list of records, "image" names an uploaded file
+    images: List[UploadFile] = File(...),
+    db: Session = Depends(get_database),
+):
+
+    try:
+        records = json.loads(seashells)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid seashells payload")
+    if not isinstance(records, list):
+        raise HTTPException(status_code=400, detail="Invalid seashells payload")
+    if len(records) > BULK_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail="Too many seashells")
+
+    uploads = {image.filename: image for image in images}
+    saved_images = {}
+    results = []
+    seashellreqs = []
+    for index, record in enumerate(records):
+        try:
+            seashellreqs.append(build_bulk_seashellreq(record, uploads, saved_images))
+            results.append(BulkItemResult(index=index))
+        except ValueError as e:
+            results.append(BulkItemResult(index=index, error=str(e)))
+
+    seashell_ids = iter(add_seashells_usecase(seashellreqs, db))
+    for saved_image in saved_images.values():
+        if saved_image is not None:
+            restore_image(saved_image[0], saved_image[2])
+    for result in results:
+        if result.error is None:
+            result.id = next(seashell_ids)
+
+    return BulkResponse(message="Seashells created successfully", data=results)
+
+
+@seashell_router.patch("/bulk", response_model=BulkWriteResponse)
+def update_seashells_bulk(bulkreq: BulkUpdateReq, db: Session = Depends(get_database)):
+
+    if bulkreq.ids is not None and len(bulkreq.ids) > BULK_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail="Too many seashells")
+    try:
+        results = update_seashells_usecase(bulkreq, db)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return BulkWriteResponse(message="Seashells updated successfully", data=results)
+
+
+def release_images_task(image_urls: List[str]):
+    # Runs after the response, the request session is closed by then
+    db = next(get_database())
+    try:
+        release_images_usecase(image_urls, db)
+    finally:
+        db.close()
+
+
+@seashell_router.delete("/bulk", response_model=BulkWriteResponse)
+def delete_seashells_bulk(
+    bulkreq: BulkDeleteReq,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_database),
+):
+
+    if bulkreq.ids is not None and len(bulkreq.ids) > BULK_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail="Too many seashells")
+
+    results, image_urls = delete_seashells_usecase(bulkreq, db)
+    background_tasks.add_task(release_images_task, image_urls)
+
+    return BulkWriteResponse(message="Seashells deleted successfully", data=results)
+
+
+@seashell_router.get("/search", response_model=Response)
+def search_seashells(
+    q: str = Query(..., min_length=1, max_length=200),  # free text, e.g. cowrie bazar
+    cursor: str = Query(None),
+    limit: int = Query(LIMIT, ge=1),
+    db: Session = Depends(get_database),
+):
+
+    try:
+        seashell_objs, next_cursor = search_seashells_usecase(q, db, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return seashell_response(
+        "Seashells retrived successfully",
+        seashell_objs,
+        next_cursor,
+    )
+
+
+def close_after_stream(chunks, db: Session):
+    try:
+        yield from chunks
+    finally:
+        db.close()  # the stream outlives the request scoped session
+
+
+@seashell_router.get("/stats", response_model=StatsResponse)
+def get_seashell_stats(
+    species: str = Query(None),  # narrows both breakdowns to one species
+    db: Session = Depends(get_database),
+):
+    stats = get_seashell_stats_usecase(db, species)
+
+    return StatsResponse(message="Seashell stats retrived successfully", data=stats)
+
+
+def read_changes(request: Request, read, *args):
+    # A short session per read, an idle stream holds no pooled connection
+    db = next(get_database(request))
+    try:
+        return read(*args, db)
+    finally:
+        db.close()
+
+
+async def change_events(request: Request, last_event_id: str = None):
+    sequence, resync = await run_in_threadpool(
+        read_changes, request, resume_changes_usecase, last_event_id
+    )
+    last_sent = time.monotonic()
+    while True:
+        if resync:  # events were missed, the client reloads and continues from here
+            yield sse_message("resync", {}, sequence)
+            last_sent = time.monotonic()
+
+        notified = change_feed.notified()
+        events, sequence, resync = await run_in_threadpool(
+            read_changes, request, get_changes_usecase, sequence
+        )
+        for event_id, event in events:
+            yield sse_message("change", event, event_id)
+        if events or resync:  # a full batch may have more changes behind it
+            last_sent = time.monotonic()
+            continue
+
+        # Woken by a write of this process, else polls for the other workers' writes
+        await change_feed.wait(notified, CHANGE_FEED_POLL_SECONDS)
+        if time.monotonic() - last_sent >= CHANGE_FEED_HEARTBEAT_SECONDS:
+            yield ": keepalive\n\n"  # comment line, keeps proxies from closing it
+            last_sent = time.monotonic()
+
+
+@seashell_router.get("/changes")
+async def stream_changes(request: Request, last_event_id: str = Header(None)):
+    # Server-Sent Events, an EventSource sends Last-Event-ID when it reconnects
+    return StreamingResponse(
+        change_events(request, last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@seashell_router.get("/export")
+def export_seashells(
+    export_format: Literal["ndjson", "csv"] = Query("ndjson", alias="format"),
+    updated_since: datetime = Query(None),  # incremental sync, updated_at >= value
+    db: Session = Depends(get_database),
+):
+
+    if export_format == "csv":
+        chunks = export_seashells_csv_usecase(db, updated_since)
+        media_type = "text/csv"
+    else:
+        chunks = export_seashells_ndjson_usecase(db, updated_since)
+        media_type = "application/x-ndjson"
+
+    return StreamingResponse(
+        close_after_stream(chunks, db),
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f'attachment; filename="seashells.{export_format}"'
+        },
+    )
+
+
 @seashell_router.get("/{seashell_id}", response_model=Response)
-def get_seashell(seashell_id: int, db: Session = Depends(get_database)):
+def get_seashell(
+    seashell_id: int, request: Request, db: Session = Depends(get_database)
+):
 
-    seashell_obj = get_seashell_usecase(seashell_id, db)
-    if seashell_obj is None:
+    # Conditional requests are checked against updated_at alone, before the row
+    if is_conditional(request):
+        updated_at = get_seashell_updated_at_usecase(seashell_id, db)
+        if updated_at is None:
+            raise HTTPException(status_code=404, detail="Seashell not found")
+        headers = validator_headers(seashell_etag(seashell_id, updated_at), updated_at)
+        if not_modified(request, headers["ETag"], updated_at):
+            return not_modified_response(headers)
+
+    seashell = get_seashell_response_usecase(seashell_id, db)
+    if seashell is None:
+        raise HTTPException(status_code=404, detail="Seashell not found")
+
+    updated_at = seashell["updated_at"]
+    headers = validator_headers(seashell_etag(seashell_id, updated_at), updated_at)
+    return seashell_response(
+        "Seashell retrived successfully", seashell, headers=headers
+    )
+
+
+def get_derivative(image_url: str, key: str, width: int):
+    extension = os.path.splitext(image_url)[1].lstrip(".")
+    path = derivative_cache.get(key, extension)
+    if path is not None:
+        return path
+
+    with open(image_url, "rb") as image_file:
+        data = image_file.read()
+    try:
+        resized = image_pool.run(resize_image, data, width)
+    except ImagePoolFull:
+        raise HTTPException(
+            status_code=503,
+            detail="Image processing is busy, try again later",
+            headers={"Retry-After": "1"},
+        )
+
+    return derivative_cache.put(key, extension, resized)
+
+
+@seashell_router.get("/{seashell_id}/similar", response_model=SimilarResponse)
+def get_similar_seashells(
+    seashell_id: int,
+    distance: int = Query(SIMILAR_DEFAULT_DISTANCE, ge=0, le=SIMILAR_MAX_DISTANCE),
+    limit: int = Query(LIMIT, ge=1, le=MAX_LIMIT),
+    db: Session = Depends(get_database),
+):
+
+    try:
+        similar = get_similar_seashells_usecase(seashell_id, db, distance, limit)
+    except ValueError as e:  # stored before hashing, see main.py hash-images
+        raise HTTPException(status_code=409, detail=str(e))
+    if similar is None:
         raise HTTPException(status_code=404, detail="Seashell not found")
 
-    return Response(message="Seashell retrived successfully", data=seashell_obj)
+    return SimilarResponse(
+        message="Similar seashells retrived successfully", data=similar
+    )
+
+
+@seashell_router.get("/{seashell_id}/image")
+def get_seashell_image(
+    seashell_id: int,
+    request: Request,
+    w: int = Query(None, ge=1, le=DERIVATIVE_MAX_WIDTH),  # resized width in pixels
+    db: Session = Depends(get_database),
+):
+
+    seashell_obj = get_seashell_usecase(seashell_id, db)
+    if seashell_obj is None or not os.path.isfile(seashell_obj.image_url):
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    stat_result = os.stat(seashell_obj.image_url)
+    key = derivative_key(seashell_obj.image_url, stat_result, w or 0)
+    headers = {"ETag": f'"{key}"', "Cache-Control": "public, max-age=86400"}
+    if etag_matches(request, headers["ETag"]):  # answered before any decode or read
+        return HTTPResponse(status_code=304, headers=headers)
+
+    if w is None:
+        return FileResponse(
+            seashell_obj.image_url, headers=headers, stat_result=stat_result
+        )
+
+    path = get_derivative(seashell_obj.image_url, key, w)
+    return FileResponse(path, headers=headers)
 
 
 @seashell_router.get("/", response_model=Response)
-def get_all_seashells(db: Session = Depends(get_database)):
+def get_all_seashells(
+    request: Request,
+    cursor: str = Query(None),  # opaque token taken from a previous next_cursor
+    limit: int = Query(LIMIT, ge=1),  # capped at MAX_LIMIT by the usecase
+    species: str = Query(None),
+    collected_from: datetime = Query(None),
+    collected_to: datetime = Query(None),
+    name_prefix: str = Query(None, min_length=1),  # case sensitive
+    sort: Literal[
+        "id",
+        "-id",
+        "collected_at",
+        "-collected_at",
+        "updated_at",
+        "-updated_at",
+        "name",
+        "-name",
+    ] = Query("id"),
+    db: Session = Depends(get_database),
+):
+
+    # Validated before the page is fetched, a write racing the fetch only makes
+    # the validator older than the body, which costs a refetch and never a stale 304
+    # ETag only, a delete leaves the newest updated_at as it was, so the list
+    # has no Last-Modified and If-Modified-Since is ignored
+    updated_at, count = get_collection_version_usecase(db)
+    headers = validator_headers(collection_etag(updated_at, count), None)
+    if not_modified(request, headers["ETag"], None):
+        return not_modified_response(headers)
+
+    try:
+        seashell_objs, next_cursor = get_seashells_page_usecase(
+            db,
+            cursor,
+            limit,
+            sort,
+            species=species,
+            collected_from=collected_from,
+            collected_to=collected_to,
+            name_prefix=name_prefix,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return seashell_response(
+        "Seashells retrived successfully",
+        seashell_objs,
+        next_cursor,
+        headers=headers,
+    )
 
-    seashell_objs = get_all_seashells_usecase(db)
 
-    return Response(message="Seashells retrived successfully", data=seashell_objs)
+def build_seashell_changes(
+    name: str = None,
+    collected_at: str = None,
+    description: str = None,
+    species: str = None,
+):
+    # Only the fields sent by the client end up in the UPDATE
+    changes = {}
+    if collected_at is not None:
+        date_format = "%Y-%m-%dT%H:%M:%S"
+        changes["collected_at"] = datetime.strptime(collected_at, date_format)
+    if name is not None:
+        changes["name"] = name
+    if species is not None:
+        changes["species"] = species
+    if description is not None:
+        changes["description"] = description
+
+    return changes
 
 
 @seashell_router.patch("/{seashell_id}", response_model=Response)
@@ -96,44 +539,29 @@ def update_seashells(
     db: Session = Depends(get_database),
 ):
 
-    seashell_obj = get_seashell_usecase(seashell_id, db)
-    if seashell_obj is None:
-        raise HTTPException(status_code=404, detail="Seashell not found")
-    else:
-        seashellreq = UpdateSeaShellReq()
-
-        if image is not None:
-            is_image, image_url = save_image(image)
-            if is_image:
-                seashellreq.image_url = image_url
-            else:
-                raise HTTPException(status_code=400, detail="Invalid image file")
-        else:
-            seashellreq.image_url = seashell_obj.image_url
-
-        if collected_at is not None:
-            date_format = "%Y-%m-%dT%H:%M:%S"
-            seashellreq.collected_at = datetime.strptime(collected_at, date_format)
+    changes = build_seashell_changes(name, collected_at, description, species)
+    if image is not None:
+        is_image, image_url, image_hash, image_data = save_image(image)
+        if is_image:
+            changes["image_url"] = image_url
+            changes["image_hash"] = image_hash
         else:
-            seashellreq.collected_at = seashell_obj.collected_at
+            raise HTTPException(status_code=400, detail="Invalid image file")
 
-        seashellreq.name = name if name is not None else seashell_obj.name
-        seashellreq.species = species if species is not None else seashell_obj.species
-        seashellreq.description = (
-            description if description is not None else seashell_obj.description
-        )
+    data = update_seashell_by_id_usecase(seashell_id, changes, db)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Seashell not found")
+    if image is not None:
+        restore_image(image_url, image_data)
 
-        data = update_seashell_usecase(seashell_obj, seashellreq, db)
-        return Response(message="Seashell updated successfully", data=data)
+    return seashell_response("Seashell updated successfully", data)
 
 
 @seashell_router.delete("/{seashell_id}", response_model=Response)
 def delete_seashell(seashell_id: int, db: Session = Depends(get_database)):
 
-    seashell_obj = get_seashell_usecase(seashell_id, db)
-    if seashell_obj is None:
+    data = delete_seashell_by_id_usecase(seashell_id, db)
+    if data is None:
         raise HTTPException(status_code=404, detail="Seashell not found")
 
-    data = delete_seashell_usecase(seashell_obj, db)
-
-    return Response(message="Seashell deleted successfully", data=data)
+    return seashell_response("Seashell deleted successfully", data)
@@ -0,0 +1,221 @@
+from fastapi import (
+    APIRouter,
+    Depends,
+    Form,
+    File,
+    UploadFile,
+    HTTPException,
+    Query,
+    Request,
+)
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
+from io import BytesIO
+from datetime import datetime
+from typing import Literal
+
+from app.usecase.seashells_async import (
+    get_async_database,
+    add_seashell as add_seashell_usecase,
+    get_seashell_response as get_seashell_response_usecase,
+    get_seashell_updated_at as get_seashell_updated_at_usecase,
+    get_collection_version as get_collection_version_usecase,
+    get_seashells_page as get_seashells_page_usecase,
+    update_seashell_by_id as update_seashell_by_id_usecase,
+    delete_seashell_by_id as delete_seashell_by_id_usecase,
+    find_similar_seashells as find_similar_seashells_usecase,
+)
+from app.delivery.seashells import build_seashell_changes
+from app.schemas.seashells import CreateSeaShellReq, Response
+from app.delivery.responses import (
+    seashell_response,
+    seashell_etag,
+    collection_etag,
+    validator_headers,
+    is_conditional,
+    not_modified,
+    not_modified_response,
+    similar_headers,
+)
+from app.images.pool import image_pool, process_image, ImagePoolFull
+from app.images.store import store_image, restore_image
+from app.app_config import LIMIT, SIMILAR_WARN_ON_UPLOAD
+
+seashell_async_router = APIRouter(
+    prefix="/v1/seashell", tags=["seashells"]
+)  # Same endpoints as seashell_router, served without a thread per request
+
+
+async def save_image(image: UploadFile):
+    try:
+        data, image_format, image_hash = await image_pool.run_async(
+            process_image, await image.read()
+        )
+    except ImagePoolFull:
+        raise HTTPException(
+            status_code=503,
+            detail="Image processing is busy, try again later",
+            headers={"Retry-After": "1"},
+        )
+    except (IOError, SyntaxError) as e:
+        return False, None, None, None
+
+    image_path = await run_in_threadpool(
+        store_image, BytesIO(data), image_format.lower()
+    )
+    return True, image_path, image_hash, data
+
+
+@seashell_async_router.post("/", status_code=201, response_model=Response)
+async def add_seashells_async(
+    name: str = Form(...),
+    collected_at: str = Form(...),
+    description: str = Form(None),  # here description is optional
+    species: str = Form(...),
+    image: UploadFile = File(...),
+    db: AsyncSession = Depends(get_async_database),
+):
+
+    is_image, image_url, image_hash, image_data = await save_image(image)
+    if is_image:
+        date_format = "%Y-%m-%dT%H:%M:%S"
+        seashellreq = CreateSeaShellReq(
+            name=name,
+            collected_at=datetime.strptime(collected_at, date_format),
+            species=species,
+            description=description,
+            image_url=image_url,
+            image_hash=image_hash,
+        )
+
+        data = await add_seashell_usecase(seashellreq, db)
+        await run_in_threadpool(restore_image, image_url, image_data)
+        headers = None
+        if SIMILAR_WARN_ON_UPLOAD:
+            similar = await find_similar_seashells_usecase(
+                image_hash, db, exclude_id=data.id
+            )
+            headers = similar_headers(similar)
+        return seashell_response(
+            "Seashell created successfully", data, status_code=201, headers=headers
+        )
+    else:
+        raise HTTPException(status_code=400, detail="Invalid image file")
+
+
+@seashell_async_router.get("/{seashell_id}", response_model=Response)
+async def get_seashell_async(
+    seashell_id: int,
+    request: Request,
+    db: AsyncSession = Depends(get_async_database),
+):
+
+    if is_conditional(request):
+        updated_at = await get_seashell_updated_at_usecase(seashell_id, db)
+        if updated_at is None:
+            raise HTTPException(status_code=404, detail="Seashell not found")
+        headers = validator_headers(seashell_etag(seashell_id, updated_at), updated_at)
+        if not_modified(request, headers["ETag"], updated_at):
+            return not_modified_response(headers)
+
+    seashell = await get_seashell_response_usecase(seashell_id, db)
+    if seashell is None:
+        raise HTTPException(status_code=404, detail="Seashell not found")
+
+    updated_at = seashell["updated_at"]
+    headers = validator_headers(seashell_etag(seashell_id, updated_at), updated_at)
+    return seashell_response(
+        "Seashell retrived successfully", seashell, headers=headers
+    )
+
+
+@seashell_async_router.get("/", response_model=Response)
+async def get_all_seashells_async(
+    request: Request,
+    cursor: str = Query(None),  # opaque token taken from a previous next_cursor
+    limit: int = Query(LIMIT, ge=1),  # capped at MAX_LIMIT by the usecase
+    species: str = Query(None),
+    collected_from: datetime = Query(None),
+    collected_to: datetime = Query(None),
+    name_prefix: str = Query(None, min_length=1),  # case sensitive
+    sort: Literal[
+        "id",
+        "-id",
+        "collected_at",
+        "-collected_at",
+        "updated_at",
+        "-updated_at",
+        "name",
+        "-name",
+    ] = Query("id"),
+    db: AsyncSession = Depends(get_async_database),
+):
+
+    # ETag only, a delete leaves the newest updated_at as it was, so the list
+    # has no Last-Modified and If-Modified-Since is ignored
+    updated_at, count = await get_collection_version_usecase(db)
+    headers = validator_headers(collection_etag(updated_at, count), None)
+    if not_modified(request, headers["ETag"], None):
+        return not_modified_response(headers)
+
+    try:
+        seashell_objs, next_cursor = await get_seashells_page_usecase(
+            db,
+            cursor,
+            limit,
+            sort,
+            species=species,
+            collected_from=collected_from,
+            collected_to=collected_to,
+            name_prefix=name_prefix,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return seashell_response(
+        "Seashells retrived successfully",
+        seashell_objs,
+        next_cursor,
+        headers=headers,
+    )
+
+
+@seashell_async_router.patch("/{seashell_id}", response_model=Response)
+async def update_seashells_async(
+    seashell_id: int,
+    name: str = Form(None),
+    collected_at: str = Form(None),
+    description: str = Form(None),  # here description is optional
+    species: str = Form(None),
+    image: UploadFile = File(None),
+    db: AsyncSession = Depends(get_async_database),
+):
+
+    changes = build_seashell_changes(name, collected_at, description, species)
+    if image is not None:
+        is_image, image_url, image_hash, image_data = await save_image(image)
+        if is_image:
+            changes["image_url"] = image_url
+            changes["image_hash"] = image_hash
+        else:
+            raise HTTPException(status_code=400, detail="Invalid image file")
+
+    data = await update_seashell_by_id_usecase(seashell_id, changes, db)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Seashell not found")
+    if image is not None:
+        await run_in_threadpool(restore_image, image_url, image_data)
+
+    return seashell_response("Seashell updated successfully", data)
+
+
+@seashell_async_router.delete("/{seashell_id}", response_model=Response)
+async def delete_seashell_async(
+    seashell_id: int, db: AsyncSession = Depends(get_async_database)
+):
+
+    data = await delete_seashell_by_id_usecase(seashell_id, db)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Seashell not found")
+
+    return seashell_response("Seashell deleted successfully", data)
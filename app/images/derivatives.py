@@ -0,0 +1,166 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from io import BytesIO
+
+from app.app_config import DERIVATIVE_FOLDER, DERIVATIVE_CACHE_MAX_BYTES
+
+try:
+    import fcntl
+except ImportError:  # Windows, only safe with a single process per folder
+    fcntl = None
+
+LEDGER_NAME = ".bytes"  # total size of the folder's derivatives
+EVICT_TO = 0.9  # of max_bytes, evictions make room for more than one put
+
+
+def resize_image(data: bytes, width: int):
+    # Runs in the image pool, keeps the aspect ratio and never upscales
+    from PIL import Image  # lazy, only resize requests need it
+
+    img = Image.open(BytesIO(data))
+    if width >= img.width:
+        return data
+
+    image_format = img.format
+    height = max(1, round(img.height * width / img.width))
+    img = img.resize((width, height), Image.LANCZOS)
+
+    output = BytesIO()
+    img.save(output, format=image_format)
+    return output.getvalue()
+
+
+def derivative_key(image_url: str, stat_result: os.stat_result, width: int):
+    # Changes whenever the original file changes, doubles as the ETag
+    source = f"{image_url}:{stat_result.st_mtime_ns}:{stat_result.st_size}:{width}"
+    return hashlib.sha256(source.encode()).hexdigest()
+
+
+def touch(path: str):
+    # Explicit nanoseconds, the file system clock may lag by a few milliseconds
+    now = time.time_ns()
+    os.utime(path, ns=(now, now))
+
+
+class DerivativeCache:
+    # Shared by every worker process using the folder. The folder's total size
+    # is kept in a ledger file changed under a file lock, so the byte budget holds
+    # for the folder and not per process. File mtimes are the recency order.
+    def __init__(
+        self,
+        folder: str = DERIVATIVE_FOLDER,
+        max_bytes: int = DERIVATIVE_CACHE_MAX_BYTES,
+    ):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def path(self, key: str, extension: str):
+        return os.path.join(self.folder, key[:2], f"{key}.{extension}")
+
+    def get(self, key: str, extension: str):
+        path = self.path(key, extension)
+        try:
+            touch(path)  # most recently used, for every process
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return path
+
+    def put(self, key: str, extension: str, data: bytes):
+        path = self.path(key, extension)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            replaced = os.path.getsize(path)
+        except FileNotFoundError:
+            replaced = 0
+
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as temp_file:
+            temp_file.write(data)
+        os.replace(temp_path, path)
+        touch(path)
+
+        self._add_bytes(len(data) - replaced, keep=path)
+        return path
+
+    def _add_bytes(self, delta: int, keep: str):
+        ledger_path = os.path.join(self.folder, LEDGER_NAME)
+        with self._lock, open(ledger_path, "a+") as ledger:
+            if fcntl is not None:
+                fcntl.flock(ledger, fcntl.LOCK_EX)  # released when the file closes
+            ledger.seek(0)
+            content = ledger.read()
+            if content:
+                total = int(content) + delta
+            else:  # first use of the folder, the scan already counts keep
+                total = sum(size for _, _, size in self._scan())
+            if total > self.max_bytes:
+                total = self._evict(keep)
+
+            ledger.seek(0)
+            ledger.truncate()
+            ledger.write(str(total))
+
+    def _scan(self):
+        files = []
+        for root, _, names in os.walk(self.folder):
+            for name in names:
+                if name.endswith(".tmp") or name == LEDGER_NAME:
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat_result = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((stat_result.st_mtime_ns, path, stat_result.st_size))
+        return files
+
+    def _evict(self, keep: str):
+        # Counts the folder again, every process' files, and removes the least
+        # recently used down to EVICT_TO of the budget, so a full cache is not
+        # scanned on every put
+        files = sorted(self._scan())
+        total = sum(size for _, _, size in files)
+        for _, path, size in files:
+            if total <= self.max_bytes * EVICT_TO:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            self.evictions += 1
+        return total
+
+    def stats(self):
+        try:
+            with open(os.path.join(self.folder, LEDGER_NAME)) as ledger:
+                total = int(ledger.read() or 0)
+        except FileNotFoundError:
+            total = 0
+
+        with self._lock:
+            return {
+                "bytes": total,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+derivative_cache = DerivativeCache()
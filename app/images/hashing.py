@@ -0,0 +1,70 @@
+from itertools import combinations
+
+HASH_SIZE = 8  # 8x8 gradient bits, a 64 bit hash
+HASH_CHUNKS = 4  # indexed 16 bit slices of the hash
+CHUNK_BITS = 64 // HASH_CHUNKS
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+HASH_MASK = (1 << 64) - 1
+
+
+def dhash(img, hash_size: int = HASH_SIZE):
+    # Difference hash, one bit per horizontally adjacent pixel pair of a small
+    # grayscale copy. Re-encoding, scaling and small edits flip only a few bits.
+    from PIL import Image
+
+    pixels = list(
+        img.convert("L")
+        .resize((hash_size + 1, hash_size), Image.Resampling.LANCZOS)
+        .getdata()
+    )
+    value = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            offset = row * (hash_size + 1) + col
+            value = (value << 1) | (pixels[offset] > pixels[offset + 1])
+
+    return to_signed(value)
+
+
+def to_signed(value: int):
+    # SQLite integers are signed 64 bit, the bits are stored as they are
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def hamming_distance(a: int, b: int):
+
+    return ((a ^ b) & HASH_MASK).bit_count()
+
+
+def hash_chunks(image_hash: int):
+    # Most significant first, same order as the image_hash_<n> columns
+    return [
+        (image_hash >> (CHUNK_BITS * (HASH_CHUNKS - 1 - n))) & CHUNK_MASK
+        for n in range(HASH_CHUNKS)
+    ]
+
+
+def chunk_neighbors(chunk: int, radius: int):
+    # Every chunk value within radius bits of chunk, chunk itself included
+    values = [chunk]
+    for flipped in range(1, radius + 1):
+        for bits in combinations(range(CHUNK_BITS), flipped):
+            values.append(chunk ^ sum(1 << bit for bit in bits))
+
+    return values
+
+
+def chunk_probes(image_hash: int, distance: int):
+    # Multi-index hashing: hashes within distance bits of image_hash differ in at
+    # least one chunk by no more than distance // HASH_CHUNKS bits (pigeonhole),
+    # so probing those chunk values on the chunk indexes finds every match
+    radius = distance // HASH_CHUNKS
+
+    return [chunk_neighbors(chunk, radius) for chunk in hash_chunks(image_hash)]
+
+
+def image_file_hash(path: str):
+    from PIL import Image
+
+    with Image.open(path) as img:
+        return dhash(img)
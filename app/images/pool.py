@@ -0,0 +1,125 @@
+import asyncio
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+
+from app.images.hashing import dhash
+from app.metrics.registry import image_processing_duration
+from app.metrics.tracking import record_image_time
+from app.app_config import IMAGE_POOL_WORKERS, IMAGE_POOL_MAX_PENDING
+
+
+class ImagePoolFull(Exception):
+    pass
+
+
+def process_image(data: bytes):
+    # Runs in a worker process, so decoding never holds the server's GIL
+    from PIL import Image  # imported on first use, keeps startup light
+
+    img = Image.open(BytesIO(data))
+    img.verify()
+    img = Image.open(BytesIO(data))  # Reopen the image to use it after verification
+    image_format = img.format
+    image_hash = dhash(img)  # decoded here already, hashing is nearly free
+
+    output = BytesIO()
+    img.save(output, format=image_format)
+    return output.getvalue(), image_format, image_hash
+
+
+class ImagePool:
+    def __init__(
+        self,
+        workers: int = IMAGE_POOL_WORKERS,
+        max_pending: int = IMAGE_POOL_MAX_PENDING,
+    ):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = None
+        self._lock = threading.Lock()
+
+        self.pending = 0  # queued plus in flight
+        self.processed = 0
+        self.rejected = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context(
+                        "spawn"
+                    ),  # safe with threads
+                )
+            return self._executor
+
+    def _acquire(self):
+        with self._lock:
+            if self.pending >= self.max_pending:  # bounded queue, shed the load
+                self.rejected += 1
+                raise ImagePoolFull()
+            self.pending += 1
+
+    def _release(self, elapsed: float):
+        with self._lock:
+            self.pending -= 1
+            self.processed += 1
+            self.total_seconds += elapsed
+            self.max_seconds = max(self.max_seconds, elapsed)
+        image_processing_duration.observe(elapsed)
+        record_image_time(elapsed)
+
+    def run(self, fn, *args):
+        self._acquire()
+        start = time.perf_counter()
+        try:
+            if self.workers > 0:
+                return self._get_executor().submit(fn, *args).result()
+            return fn(*args)
+        except BrokenProcessPool:
+            self.shutdown()  # a worker died, start a fresh pool on the next call
+            raise
+        finally:
+            self._release(time.perf_counter() - start)
+
+    async def run_async(self, fn, *args):
+        # Same as run() but awaits the worker instead of blocking a thread
+        self._acquire()
+        start = time.perf_counter()
+        try:
+            if self.workers > 0:
+                future = self._get_executor().submit(fn, *args)
+                return await asyncio.wrap_future(future)
+            return fn(*args)
+        except BrokenProcessPool:
+            self.shutdown()
+            raise
+        finally:
+            self._release(time.perf_counter() - start)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "pending": self.pending,
+                "processed": self.processed,
+                "rejected": self.rejected,
+                "total_seconds": self.total_seconds,
+                "max_seconds": self.max_seconds,
+            }
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+
+image_pool = ImagePool()
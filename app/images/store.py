@@ -0,0 +1,91 @@
+import hashlib
+import os
+import tempfile
+import uuid
+from io import BytesIO
+
+from app.app_config import IMAGE_FOLDER
+
+CHUNK_SIZE = 64 * 1024
+
+
+def image_path(digest: str, extension: str, folder: str = IMAGE_FOLDER):
+    # Two shard levels keep every directory small, e.g. ab/cd/abcd...ef.png
+    return os.path.join(folder, digest[:2], digest[2:4], f"{digest}.{extension}")
+
+
+def store_image(stream, extension: str, folder: str = IMAGE_FOLDER):
+    os.makedirs(folder, exist_ok=True)
+
+    # Hash while streaming to a temp file, the final name is only known at the end
+    digest = hashlib.sha256()
+    fd, temp_path = tempfile.mkstemp(dir=folder, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as temp_file:
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+                temp_file.write(chunk)
+
+        path = image_path(digest.hexdigest(), extension, folder)
+        if os.path.exists(path):  # same content is already stored once
+            os.remove(temp_path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    return path
+
+
+def restore_image(path: str, data: bytes, folder: str = IMAGE_FOLDER):
+    # Called once the row pointing to path is committed. A release that counted
+    # the references before that commit may have removed the shared file.
+    if os.path.exists(path):
+        return False
+
+    store_image(BytesIO(data), os.path.splitext(path)[1][1:], folder)
+    return True
+
+
+def image_folder_path(path: str, folder: str = IMAGE_FOLDER):
+    # Never touch anything outside of the image folder
+    root = os.path.realpath(folder)
+    target = os.path.realpath(path)
+    if os.path.commonpath([root, target]) != root or target == root:
+        return None
+    return target
+
+
+def delete_image(path: str, folder: str = IMAGE_FOLDER):
+    target = image_folder_path(path, folder)
+    if target is None:
+        return False
+
+    try:
+        os.remove(target)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def trash_image(path: str, folder: str = IMAGE_FOLDER):
+    # Moves the file aside so the caller can count its references once more,
+    # then restore it or delete the returned trash path
+    target = image_folder_path(path, folder)
+    if target is None:
+        return None
+
+    trash_path = f"{target}.{uuid.uuid4().hex}.trash"
+    try:
+        os.rename(target, trash_path)
+    except FileNotFoundError:
+        return None
+    return trash_path
+
+
+def restore_trashed_image(trash_path: str, path: str):
+    # Same content either way if an upload has written the file again meanwhile
+    os.replace(trash_path, path)
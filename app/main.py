@@ -1,11 +1,117 @@
-from fastapi import FastAPI
+import os
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, APIRouter
+from fastapi.responses import PlainTextResponse
 from app.delivery.seashells import seashell_router
+from app.images.pool import image_pool
+from app.images.derivatives import derivative_cache
+from app.usecase.cache import seashell_cache
+from app.usecase.changes import change_feed
+from app.metrics.middleware import MetricsMiddleware
+from app.metrics.profiling import ProfilingMiddleware
+from app.metrics.registry import metrics
+from app.repository.seashells import init_db, dispose_db
+from app.repository.coalescer import write_coalescer
+from app.app_config import ASYNC_MODE, WORKERS_ENV
 
-app = FastAPI()
-app.include_router(seashell_router)
 
+def include_seashell_routers(app: FastAPI, async_mode: bool = ASYNC_MODE):
+    if not async_mode:
+        app.include_router(seashell_router)
+        return
 
-@app.get("/")
+    from app.delivery.seashells_async import seashell_async_router
+
+    # Async endpoints replace their sync twins, the rest stay on the threadpool.
+    # Sync routes go first so static paths like /export win over /{seashell_id}.
+    replaced = {
+        (route.path, method)
+        for route in seashell_async_router.routes
+        for method in route.methods
+    }
+    remaining = APIRouter()
+    remaining.routes.extend(
+        route
+        for route in seashell_router.routes
+        if not any((route.path, method) in replaced for method in route.methods)
+    )
+    app.include_router(remaining)
+    app.include_router(seashell_async_router)
+
+
+system_router = APIRouter()
+
+
+@system_router.get("/")
 def status():
 
     return "Program is running"
+
+
+@system_router.get("/stats/images")
+def image_stats():
+
+    return {"pool": image_pool.stats(), "derivatives": derivative_cache.stats()}
+
+
+@system_router.get("/stats/cache")
+def cache_stats():
+
+    return seashell_cache.stats()
+
+
+@system_router.get("/stats/writes")
+def write_stats():
+
+    return write_coalescer.stats()
+
+
+@system_router.get("/stats/changes")
+def change_stats():
+
+    return change_feed.stats()
+
+
+@system_router.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+
+    return PlainTextResponse(
+        metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Per process resources, every worker of the launcher runs this on its own
+    init_db()  # engine, sessionmaker and a no-op schema check once it exists
+    app.state.image_pool = image_pool  # worker processes start on the first upload
+    app.state.seashell_cache = seashell_cache
+    if int(os.environ.get(WORKERS_ENV, "1")) > 1:
+        # A write only invalidates the worker that served it, the others would
+        # answer with the old payload and ETag until the TTL ran out
+        seashell_cache.disable()
+    try:
+        yield
+    finally:
+        image_pool.shutdown()
+        write_coalescer.shutdown()  # commits what is still queued first
+        seashell_cache.clear()
+        dispose_db()
+        if app.state.async_mode:
+            from app.repository.seashells_async import dispose_async_db
+
+            await dispose_async_db()
+
+
+def create_app(async_mode: bool = ASYNC_MODE):
+    app = FastAPI(lifespan=lifespan)
+    app.state.async_mode = async_mode
+    app.add_middleware(ProfilingMiddleware)
+    app.add_middleware(MetricsMiddleware)  # outermost, also times profiled requests
+    include_seashell_routers(app, async_mode)
+    app.include_router(system_router)
+
+    return app
+
+
+app = create_app()  # for "uvicorn app.main:app" and the tests
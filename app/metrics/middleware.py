@@ -0,0 +1,83 @@
+import logging
+import time
+
+from app.metrics.registry import (
+    request_duration,
+    request_queries,
+    request_sql_duration,
+    slow_requests,
+)
+from app.metrics.tracking import RequestStats, current_request_stats
+from app.app_config import SLOW_REQUEST_SECONDS
+
+logger = logging.getLogger("app.metrics")
+
+
+class MetricsMiddleware:
+    # Plain ASGI instead of BaseHTTPMiddleware, so streamed responses are timed
+    # to their last byte and nothing is buffered
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats()
+        token = current_request_stats.set(stats)
+        status = 500
+        event_stream = False
+        start = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status, event_stream
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                event_stream = any(
+                    name == b"content-type" and value.startswith(b"text/event-stream")
+                    for name, value in message.get("headers", [])
+                )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            current_request_stats.reset(token)
+            elapsed = time.perf_counter() - start
+            self.record(scope, status, stats, elapsed, event_stream)
+
+    def record(
+        self,
+        scope,
+        status: int,
+        stats: RequestStats,
+        elapsed: float,
+        event_stream: bool = False,
+    ):
+        route = scope.get("route")  # set by the router on a match
+        route = route.path if route is not None else "unmatched"  # bounded labels
+        method = scope["method"]
+
+        request_duration.observe(elapsed, method=method, route=route, status=status)
+        request_queries.observe(stats.queries, method=method, route=route)
+        request_sql_duration.observe(stats.sql_seconds, method=method, route=route)
+
+        # Event streams stay open by design, their duration is not slowness
+        if elapsed >= SLOW_REQUEST_SECONDS and not event_stream:
+            slow_requests.inc(method=method, route=route)
+            statements = "".join(
+                f"\n  {seconds * 1000:.1f}ms {statement}"
+                for seconds, _, statement in stats.slowest_statements()
+            )
+            logger.warning(
+                "Slow request %s %s status=%s total=%.1fms queries=%d sql=%.1fms "
+                "image=%.1fms, slowest statements:%s",
+                method,
+                scope["path"],
+                status,
+                elapsed * 1000,
+                stats.queries,
+                stats.sql_seconds * 1000,
+                stats.image_seconds * 1000,
+                statements or " none",
+            )
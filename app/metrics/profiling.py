@@ -0,0 +1,114 @@
+import cProfile
+import functools
+import inspect
+import os
+import pstats
+import threading
+import uuid
+from contextvars import ContextVar
+from typing import Optional
+
+from fastapi.routing import APIRoute
+from starlette.routing import Match
+
+from app.app_config import PROFILING_ENABLED, PROFILE_DIR
+
+
+class ProfileSession:
+    def __init__(self):
+        self.profile_id = uuid.uuid4().hex
+        self.profiles = []  # one cProfile.Profile per thread the request ran on
+
+    def start(self):
+        profile = cProfile.Profile()
+        self.profiles.append(profile)
+        profile.enable()
+        return profile
+
+    def save(self, folder: str = PROFILE_DIR):
+        # pstats format, readable by pstats, snakeviz or flameprof
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f"{self.profile_id}.pstats")
+        pstats.Stats(*self.profiles).dump_stats(path)
+        return path
+
+
+current_profile_session: ContextVar[Optional[ProfileSession]] = ContextVar(
+    "current_profile_session", default=None
+)
+# cProfile hooks are per thread and the event loop runs every request on one,
+# so only one request at a time is profiled
+_profiling_lock = threading.Lock()
+
+
+def profiled(endpoint):
+    # Sync endpoints run on a threadpool worker, the middleware's profiler never
+    # sees that thread, so the worker gets a profiler of its own. Routes are
+    # rebuilt by every include_router, the endpoint is then wrapped already.
+    if inspect.iscoroutinefunction(endpoint) or getattr(endpoint, "profiled", False):
+        return endpoint
+
+    @functools.wraps(endpoint)
+    def wrapper(*args, **kwargs):
+        session = current_profile_session.get()
+        if session is None:
+            return endpoint(*args, **kwargs)
+
+        profile = session.start()
+        try:
+            return endpoint(*args, **kwargs)
+        finally:
+            profile.disable()
+
+    wrapper.profiled = True
+    return wrapper
+
+
+class ProfiledRoute(APIRoute):
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, profiled(endpoint), **kwargs)
+
+
+def profiled_by_route(scope):
+    # Python 3.12+ refuses to enable a profiler while another one is active, in
+    # any thread, so the middleware leaves sync endpoints to their own profiler
+    for route in scope["app"].router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(getattr(route, "endpoint", None), "profiled", False)
+    return False
+
+
+class ProfilingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (
+            not PROFILING_ENABLED
+            or scope["type"] != "http"
+            or (b"x-profile", b"1") not in scope["headers"]
+            or not _profiling_lock.acquire(blocking=False)
+        ):
+            return await self.app(scope, receive, send)
+
+        session = ProfileSession()
+        token = current_profile_session.set(session)
+
+        async def send_with_profile_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [
+                    *message.get("headers", []),
+                    (b"x-profile-id", session.profile_id.encode()),
+                ]
+            await send(message)
+
+        profile = None if profiled_by_route(scope) else session.start()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            if profile is not None:
+                profile.disable()
+            current_profile_session.reset(token)
+            _profiling_lock.release()
+            session.save(PROFILE_DIR)
@@ -0,0 +1,144 @@
+import bisect
+import threading
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+
+def format_labels(labelnames, values):
+    if not labelnames:
+        return ""
+    pairs = (f'{name}="{value}"' for name, value in zip(labelnames, values))
+    return "{" + ",".join(pairs) + "}"
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Counter:
+    kind = "counter"
+
+    # Counter names carry the _total suffix themselves, HELP, TYPE and the
+    # samples all use the same name
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}  # label values -> count
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(escape_label(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield f"{self.name}{format_labels(self.labelnames, key)} {value}"
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames=(), buckets=DURATION_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(escape_label(labels[name]) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)  # first bucket with le >= value
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def samples(self):
+        with self._lock:
+            values = {key: list(series) for key, series in self._values.items()}
+        labelnames = self.labelnames + ("le",)
+        for key, series in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                labels = format_labels(labelnames, key + (repr(float(bound)),))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = format_labels(labelnames, key + ("+Inf",))
+            yield f"{self.name}_bucket{labels} {series[-1]}"
+            yield f"{self.name}_sum{format_labels(self.labelnames, key)} {series[-2]}"
+            yield f"{self.name}_count{format_labels(self.labelnames, key)} {series[-1]}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        # Prometheus text exposition format 0.0.4
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+request_duration = metrics.register(
+    Histogram(
+        "seashell_request_duration_seconds",
+        "Time from the request arriving to the last response byte",
+        ("method", "route", "status"),
+    )
+)
+request_queries = metrics.register(
+    Histogram(
+        "seashell_request_queries",
+        "SQL statements executed per request",
+        ("method", "route"),
+        QUERY_COUNT_BUCKETS,
+    )
+)
+request_sql_duration = metrics.register(
+    Histogram(
+        "seashell_request_sql_seconds",
+        "Total SQL execution time per request",
+        ("method", "route"),
+    )
+)
+image_processing_duration = metrics.register(
+    Histogram(
+        "seashell_image_processing_seconds",
+        "Time an upload spent queued and processed in the image pool",
+    )
+)
+write_batch_size = metrics.register(
+    Histogram(
+        "seashell_write_batch_size",
+        "Writes committed together by the write coalescer",
+        buckets=BATCH_SIZE_BUCKETS,
+    )
+)
+slow_requests = metrics.register(
+    Counter(
+        "seashell_slow_requests_total",
+        "Requests slower than SLOW_REQUEST_SECONDS",
+        ("method", "route"),
+    )
+)
@@ -0,0 +1,68 @@
+import heapq
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+
+from app.app_config import SLOW_REQUEST_LOG_STATEMENTS
+
+
+class RequestStats:
+    def __init__(self):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.image_seconds = 0.0
+        self.slowest = []  # min heap of (seconds, sequence, statement)
+
+    def record_query(self, statement: str, elapsed: float):
+        # Mutated from the threadpool worker, which shares this object via the context
+        self.queries += 1
+        self.sql_seconds += elapsed
+        entry = (elapsed, self.queries, statement)
+        if len(self.slowest) < SLOW_REQUEST_LOG_STATEMENTS:
+            heapq.heappush(self.slowest, entry)
+        elif SLOW_REQUEST_LOG_STATEMENTS:
+            heapq.heappushpop(self.slowest, entry)
+
+    def slowest_statements(self):
+        return sorted(self.slowest, reverse=True)
+
+
+# Set by the metrics middleware, None outside of a request (CLI, startup DDL)
+current_request_stats: ContextVar[Optional[RequestStats]] = ContextVar(
+    "current_request_stats", default=None
+)
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_times", []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start_times"].pop()
+    stats = current_request_stats.get()
+    if stats is not None:
+        stats.record_query(statement, elapsed)
+
+
+def handle_error(exception_context):
+    # The failed statement never reaches after_cursor_execute
+    connection = exception_context.connection
+    if connection is not None and connection.info.get("query_start_times"):
+        connection.info["query_start_times"].pop()
+
+
+def instrument_engine(engine):
+    # Pass engine.sync_engine for an AsyncEngine
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", after_cursor_execute)
+    event.listen(engine, "handle_error", handle_error)
+
+    return engine
+
+
+def record_image_time(elapsed: float):
+    stats = current_request_stats.get()
+    if stats is not None:
+        stats.image_seconds += elapsed
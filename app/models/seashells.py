@@ -1,19 +1,211 @@
-from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy import (
+    Column,
+    Computed,
+    Integer,
+    String,
+    DateTime,
+    Index,
+    event,
+    table,
+    column,
+)
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
+from datetime import datetime, timezone
+
+from app.app_config import CHANGE_FEED_MAX_EVENTS
 
 
 Base = declarative_base()
 
 
+def utcnow():
+    # Microsecond timestamps in the same format as bound datetimes, so updated_at
+    # works as a validator and compares consistently in keyset seeks
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
 class SeaShell(Base):
     __tablename__ = "seashells"
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    created_at = Column(DateTime, default=func.now())
-    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
-    collected_at = Column(DateTime, nullable=False, default=func.now())
-    name = Column(String)
-    species = Column(String)
+    created_at = Column(DateTime, default=utcnow)
+    updated_at = Column(DateTime, default=utcnow, onupdate=utcnow, index=True)
+    collected_at = Column(DateTime, nullable=False, default=func.now(), index=True)
+    name = Column(String, index=True)
+    species = Column(String, index=True)
     description = Column(String(200), nullable=True)
-    image_url = Column(String)
+    image_url = Column(String, index=True)  # images are shared, count references
+
+    # Perceptual hash of the image, NULL until hashed. The 16 bit slices are
+    # generated from it and indexed for the near duplicate lookup.
+    image_hash = Column(Integer, nullable=True)
+    image_hash_0 = Column(Integer, Computed("(image_hash >> 48) & 65535"), index=True)
+    image_hash_1 = Column(Integer, Computed("(image_hash >> 32) & 65535"), index=True)
+    image_hash_2 = Column(Integer, Computed("(image_hash >> 16) & 65535"), index=True)
+    image_hash_3 = Column(Integer, Computed("image_hash & 65535"), index=True)
+
+    # Single column indexes already end in the rowid, so they serve (column, id)
+    # keyset scans. These cover a species filter combined with any other sort.
+    __table_args__ = (
+        Index("ix_seashells_species_collected_at", "species", "collected_at"),
+        Index("ix_seashells_species_name", "species", "name"),
+        Index("ix_seashells_species_updated_at", "species", "updated_at"),
+    )
+
+
+class SeaShellStat(Base):
+    # Row counts per (species, collection month), kept current by the triggers below
+    __tablename__ = "seashell_stats"
+
+    species = Column(String, primary_key=True)
+    month = Column(String(7), primary_key=True)  # YYYY-MM of collected_at
+    count = Column(Integer, nullable=False, default=0)
+
+
+class ImportProgress(Base):
+    # Records of a source file the importer has processed, committed in the same
+    # transaction as the batch that processed them
+    __tablename__ = "import_progress"
+
+    source = Column(String, primary_key=True)
+    records_done = Column(Integer, nullable=False, default=0)
+
+
+class SeaShellChange(Base):
+    # Change log read by the change feed, one row per written seashell, filled by
+    # the triggers below, so every worker and the CLIs share one sequence
+    __tablename__ = "seashell_changes"
+    __table_args__ = {"sqlite_autoincrement": True}  # ids are never reused
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    op = Column(String(6), nullable=False)  # create, update or delete
+    seashell_id = Column(Integer, nullable=False)
+
+
+# External content FTS5 index over seashells, kept in sync by the triggers below
+seashells_fts = table("seashells_fts", column("rowid"))
+
+SEASHELLS_FTS_DDL = [
+    """CREATE VIRTUAL TABLE seashells_fts USING fts5(
+        name, species, description,
+        content='seashells', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER seashells_fts_insert AFTER INSERT ON seashells BEGIN
+        INSERT INTO seashells_fts(rowid, name, species, description)
+        VALUES (new.id, new.name, new.species, new.description);
+    END""",
+    """CREATE TRIGGER seashells_fts_delete AFTER DELETE ON seashells BEGIN
+        INSERT INTO seashells_fts(seashells_fts, rowid, name, species, description)
+        VALUES ('delete', old.id, old.name, old.species, old.description);
+    END""",
+    """CREATE TRIGGER seashells_fts_update AFTER UPDATE OF name, species, description
+    ON seashells BEGIN
+        INSERT INTO seashells_fts(seashells_fts, rowid, name, species, description)
+        VALUES ('delete', old.id, old.name, old.species, old.description);
+        INSERT INTO seashells_fts(rowid, name, species, description)
+        VALUES (new.id, new.name, new.species, new.description);
+    END""",
+    "INSERT INTO seashells_fts(seashells_fts) VALUES ('rebuild')",  # index existing rows
+]
+
+
+@event.listens_for(Base.metadata, "after_create")
+def create_seashells_fts(target, connection, **kw):
+    if connection.dialect.name != "sqlite":
+        return
+
+    exists = connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE name = 'seashells_fts'"
+    ).first()
+    if exists is None:
+        for statement in SEASHELLS_FTS_DDL:
+            connection.exec_driver_sql(statement)
+
+
+@event.listens_for(Base.metadata, "before_drop")
+def drop_seashells_fts(target, connection, **kw):
+    if connection.dialect.name == "sqlite":
+        connection.exec_driver_sql("DROP TABLE IF EXISTS seashells_fts")
+
+
+# Every write to seashells adjusts its (species, month) group in the same transaction,
+# so the ORM, the bulk statements and raw SQL all keep the summary current.
+SEASHELL_STATS_GROUP = (
+    "IFNULL({row}.species, ''), strftime('%Y-%m', {row}.collected_at)"
+)
+
+SEASHELL_STATS_DDL = [
+    f"""CREATE TRIGGER seashell_stats_insert AFTER INSERT ON seashells BEGIN
+        INSERT INTO seashell_stats(species, month, count)
+        VALUES ({SEASHELL_STATS_GROUP.format(row="new")}, 1)
+        ON CONFLICT(species, month) DO UPDATE SET count = count + 1;
+    END""",
+    f"""CREATE TRIGGER seashell_stats_delete AFTER DELETE ON seashells BEGIN
+        UPDATE seashell_stats SET count = count - 1
+        WHERE (species, month) = ({SEASHELL_STATS_GROUP.format(row="old")});
+        DELETE FROM seashell_stats
+        WHERE (species, month) = ({SEASHELL_STATS_GROUP.format(row="old")}) AND count <= 0;
+    END""",
+    f"""CREATE TRIGGER seashell_stats_update AFTER UPDATE OF species, collected_at
+    ON seashells BEGIN
+        UPDATE seashell_stats SET count = count - 1
+        WHERE (species, month) = ({SEASHELL_STATS_GROUP.format(row="old")});
+        INSERT INTO seashell_stats(species, month, count)
+        VALUES ({SEASHELL_STATS_GROUP.format(row="new")}, 1)
+        ON CONFLICT(species, month) DO UPDATE SET count = count + 1;
+        DELETE FROM seashell_stats
+        WHERE (species, month) = ({SEASHELL_STATS_GROUP.format(row="old")}) AND count <= 0;
+    END""",
+]
+
+SEASHELL_STATS_REBUILD = [
+    "DELETE FROM seashell_stats",
+    f"""INSERT INTO seashell_stats(species, month, count)
+    SELECT {SEASHELL_STATS_GROUP.format(row="seashells")}, count(*) FROM seashells
+    GROUP BY 1, 2""",
+]
+
+
+@event.listens_for(Base.metadata, "after_create")
+def create_seashell_stats_triggers(target, connection, **kw):
+    if connection.dialect.name != "sqlite":
+        return
+
+    exists = connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE name = 'seashell_stats_insert'"
+    ).first()
+    if exists is None:  # existing databases get their rows counted once
+        for statement in SEASHELL_STATS_DDL + SEASHELL_STATS_REBUILD:
+            connection.exec_driver_sql(statement)
+
+
+def seashell_changes_ddl(max_events: int = CHANGE_FEED_MAX_EVENTS):
+    # Appends in the writing transaction, the log keeps the newest max_events rows
+    return [
+        """CREATE TRIGGER seashell_changes_insert AFTER INSERT ON seashells BEGIN
+            INSERT INTO seashell_changes(op, seashell_id) VALUES ('create', new.id);
+        END""",
+        """CREATE TRIGGER seashell_changes_update AFTER UPDATE ON seashells BEGIN
+            INSERT INTO seashell_changes(op, seashell_id) VALUES ('update', new.id);
+        END""",
+        """CREATE TRIGGER seashell_changes_delete AFTER DELETE ON seashells BEGIN
+            INSERT INTO seashell_changes(op, seashell_id) VALUES ('delete', old.id);
+        END""",
+        f"""CREATE TRIGGER seashell_changes_prune AFTER INSERT ON seashell_changes BEGIN
+            DELETE FROM seashell_changes WHERE id <= new.id - {max_events};
+        END""",
+    ]
+
+
+@event.listens_for(Base.metadata, "after_create")
+def create_seashell_changes_triggers(target, connection, **kw):
+    if connection.dialect.name != "sqlite":
+        return
+
+    exists = connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE name = 'seashell_changes_insert'"
+    ).first()
+    if exists is None:
+        for statement in seashell_changes_ddl():
+            connection.exec_driver_sql(statement)
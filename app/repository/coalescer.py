@@ -0,0 +1,148 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from sqlalchemy.orm import sessionmaker
+
+from app.repository.database import create_db_engine, use_explicit_transactions
+from app.metrics.registry import write_batch_size
+from app.app_config import (
+    DATABASE_URL,
+    WRITE_COALESCE_MAX_BATCH,
+    WRITE_COALESCE_WINDOW_SECONDS,
+)
+
+_STOP = object()
+
+
+class WriteCoalescer:
+    # One writer thread commits the writes queued by concurrent requests together,
+    # paying one fsync per batch instead of one per write
+    def __init__(
+        self,
+        database_url: str = DATABASE_URL,
+        max_batch: int = WRITE_COALESCE_MAX_BATCH,
+        window_seconds: float = WRITE_COALESCE_WINDOW_SECONDS,
+    ):
+        self.database_url = database_url
+        self.max_batch = max_batch
+        self.window_seconds = window_seconds
+        self._queue = queue.Queue()
+        self._thread = None
+        self._engine = None
+        self._sessions = None
+        self._lock = threading.Lock()
+
+        self.batches = 0
+        self.operations = 0
+        self.failed = 0
+        self.largest_batch = 0
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                # Its own single connection engine, the writes never wait on the pool
+                self._engine = use_explicit_transactions(
+                    create_db_engine(self.database_url, pool_size=1, max_overflow=0)
+                )
+                self._sessions = sessionmaker(
+                    bind=self._engine, autoflush=False, expire_on_commit=False
+                )
+                self._thread = threading.Thread(
+                    target=self._run, name="write-coalescer", daemon=True
+                )
+                self._thread.start()
+
+    def enqueue(self, operation, *args) -> Future:
+        # operation(*args, db) must not commit, the writer commits the batch
+        if self._thread is None:
+            self._start()
+        future = Future()
+        self._queue.put((operation, args, future))
+        return future
+
+    def submit(self, operation, *args):
+        return self.enqueue(operation, *args).result()
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = time.monotonic() + self.window_seconds
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    item = self._queue.get(timeout=remaining)
+                else:  # window over, still take what is already queued
+                    item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._queue.put(_STOP)  # stop after this batch
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            self._commit(self._collect(first))
+
+    def _commit(self, batch):
+        outcomes = []
+        db = self._sessions()
+        try:
+            for operation, args, future in batch:
+                try:
+                    with db.begin_nested():  # a failing write only undoes itself
+                        outcomes.append((future, operation(*args, db), None))
+                except Exception as e:
+                    outcomes.append((future, None, e))
+            db.commit()
+        except Exception as e:  # the commit failed, none of the batch was written
+            db.rollback()
+            outcomes = [(future, None, e) for _, _, future in batch]
+        finally:
+            db.close()  # results stay loaded, expire_on_commit is off
+
+        with self._lock:
+            self.batches += 1
+            self.operations += len(batch)
+            self.failed += sum(1 for _, _, error in outcomes if error is not None)
+            self.largest_batch = max(self.largest_batch, len(batch))
+        write_batch_size.observe(len(batch))
+
+        for future, result, error in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_batch": self.max_batch,
+                "window_seconds": self.window_seconds,
+                "queued": self._queue.qsize(),
+                "batches": self.batches,
+                "operations": self.operations,
+                "failed": self.failed,
+                "largest_batch": self.largest_batch,
+                "average_batch": (
+                    round(self.operations / self.batches, 2) if self.batches else 0
+                ),
+            }
+
+    def shutdown(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+            engine, self._engine = self._engine, None
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join()
+        if engine is not None:
+            engine.dispose()
+
+
+write_coalescer = WriteCoalescer()
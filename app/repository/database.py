@@ -0,0 +1,149 @@
+from sqlalchemy import create_engine, event, inspect
+from sqlalchemy.engine import make_url
+from sqlalchemy.schema import CreateColumn
+
+from app.metrics.tracking import instrument_engine
+from app.app_config import (
+    DATABASE_URL,
+    ASYNC_DATABASE_URL,
+    SQLITE_JOURNAL_MODE,
+    SQLITE_SYNCHRONOUS,
+    SQLITE_CACHE_SIZE_KB,
+    SQLITE_MMAP_SIZE,
+    SQLITE_BUSY_TIMEOUT_MS,
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    DB_POOL_TIMEOUT,
+)
+
+
+def set_connection_pragmas(cursor):
+    cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")  # negative is KiB
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    set_connection_pragmas(cursor)
+    cursor.close()
+
+
+def set_read_only_pragmas(dbapi_connection, connection_record):
+    # The journal mode belongs to the writers, a read only connection can't set it
+    cursor = dbapi_connection.cursor()
+    set_connection_pragmas(cursor)
+    cursor.execute("PRAGMA query_only=ON")  # also refuses writes to temp tables
+    cursor.close()
+
+
+def is_memory_database(database_url: str):
+    url = make_url(database_url)
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+
+
+def read_only_url(database_url: str):
+    # The same SQLite file opened as a URI with mode=ro, the driver refuses writes
+    url = make_url(database_url)
+    return url.set(
+        database=f"file:{url.database}",
+        query={**url.query, "mode": "ro", "uri": "true"},
+    )
+
+
+def create_db_engine(
+    database_url: str = DATABASE_URL,
+    pool_size: int = DB_POOL_SIZE,
+    max_overflow: int = DB_MAX_OVERFLOW,
+    read_only: bool = False,
+):
+    url = make_url(database_url)
+    pragmas = set_read_only_pragmas if read_only else set_sqlite_pragmas
+    options = {}
+    if url.get_backend_name() == "sqlite":
+        options["connect_args"] = {"check_same_thread": False}
+    if not is_memory_database(
+        database_url
+    ):  # in memory databases use a single connection
+        options.update(
+            pool_size=pool_size, max_overflow=max_overflow, pool_timeout=DB_POOL_TIMEOUT
+        )
+
+    if read_only and url.get_backend_name() == "sqlite":
+        database_url = read_only_url(database_url)
+
+    engine = create_engine(database_url, **options)
+    if url.get_backend_name() == "sqlite":
+        event.listen(engine, "connect", pragmas)
+    instrument_engine(engine)  # per request query counts and SQL time
+
+    return engine
+
+
+def use_explicit_transactions(engine, begin: str = "BEGIN IMMEDIATE"):
+    # pysqlite only opens a transaction at the first DML statement, so a leading
+    # SAVEPOINT becomes the outermost transaction and its RELEASE commits. Hand
+    # BEGIN over to SQLAlchemy, IMMEDIATE takes the write lock up front.
+    @event.listens_for(engine, "connect")
+    def disable_driver_transactions(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def emit_begin(connection):
+        connection.exec_driver_sql(begin)
+
+    return engine
+
+
+def create_async_db_engine(
+    database_url: str = ASYNC_DATABASE_URL,
+    pool_size: int = DB_POOL_SIZE,
+    max_overflow: int = DB_MAX_OVERFLOW,
+    read_only: bool = False,
+):
+    # Imported here so the sync mode runs without aiosqlite installed
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+    url = make_url(database_url)
+    pragmas = set_read_only_pragmas if read_only else set_sqlite_pragmas
+    options = {}
+    if not is_memory_database(database_url):  # aiosqlite defaults to no pooling
+        options.update(
+            poolclass=AsyncAdaptedQueuePool,
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_timeout=DB_POOL_TIMEOUT,
+        )
+
+    if read_only and url.get_backend_name() == "sqlite":
+        database_url = read_only_url(database_url)
+
+    engine = create_async_engine(database_url, **options)
+    if url.get_backend_name() == "sqlite":
+        event.listen(engine.sync_engine, "connect", pragmas)
+    instrument_engine(engine.sync_engine)
+
+    return engine
+
+
+def create_schema(engine, metadata):
+    metadata.create_all(bind=engine)
+
+    # create_all skips tables that already exist, add columns and indexes declared
+    # since. New columns are nullable or generated, so existing rows stay valid.
+    with engine.begin() as connection:
+        inspector = inspect(connection)
+        for table in metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    definition = CreateColumn(column).compile(dialect=engine.dialect)
+                    connection.exec_driver_sql(
+                        f"ALTER TABLE {table.name} ADD COLUMN {definition}"
+                    )
+            for index in table.indexes:
+                index.create(bind=connection, checkfirst=True)
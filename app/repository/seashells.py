@@ -1,17 +1,123 @@
-from sqlalchemy import create_engine
+import threading
+from datetime import datetime
+from typing import List, Optional
+from sqlalchemy import (
+    func,
+    insert,
+    select,
+    update,
+    delete,
+    literal_column,
+    or_,
+    text,
+    tuple_,
+)
 from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.sql.expression import UnaryExpression
+from sqlalchemy.sql.operators import custom_op
 
-from app.models.seashells import SeaShell, Base
-from app.app_config import DATABASE_URL, OFFSET, LIMIT
+from app.models.seashells import (
+    SeaShell,
+    SeaShellStat,
+    SeaShellChange,
+    ImportProgress,
+    Base,
+    seashells_fts,
+    SEASHELL_STATS_REBUILD,
+)
+from app.repository.database import (
+    create_db_engine,
+    create_schema,
+    is_memory_database,
+)
+from app.repository.coalescer import write_coalescer
+from app.images.hashing import chunk_probes
+from app.app_config import (
+    DATABASE_URL,
+    LIMIT,
+    EXPORT_BATCH_SIZE,
+    BULK_CHUNK_SIZE,
+    WRITE_COALESCING,
+    CHANGE_FEED_BATCH_SIZE,
+    SIMILAR_CANDIDATE_BATCH_SIZE,
+    READ_WRITE_SPLIT,
+    DB_READ_POOL_SIZE,
+    DB_READ_MAX_OVERFLOW,
+    DB_WRITE_POOL_SIZE,
+    DB_WRITE_MAX_OVERFLOW,
+)
 from app.schemas.seashells import UpdateSeaShellReq
 
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base.metadata.create_all(bind=engine)
+# Bound on first use instead of at import, so importing the app never touches
+# the database file. The app lifespan and the CLIs call init_db().
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False)
+_engine = None
+_read_engine = None
+_engine_lock = threading.RLock()
+
+
+def split_engines():
+    # An in memory database only exists on its own connection, nothing to split
+    return READ_WRITE_SPLIT and not is_memory_database(DATABASE_URL)
+
+
+def get_engine():
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                if split_engines():
+                    # A few writers. pysqlite only begins at the first write, so
+                    # lookups on these sessions never hold the write lock.
+                    engine = create_db_engine(
+                        DATABASE_URL, DB_WRITE_POOL_SIZE, DB_WRITE_MAX_OVERFLOW
+                    )
+                else:
+                    engine = create_db_engine(DATABASE_URL)
+                SessionLocal.configure(bind=engine)
+                _engine = engine
+    return _engine
+
+
+def get_read_engine():
+    global _read_engine
+    if _read_engine is None:
+        with _engine_lock:
+            if _read_engine is None:
+                if split_engines():  # WAL readers never wait for the writers
+                    engine = create_db_engine(
+                        DATABASE_URL,
+                        DB_READ_POOL_SIZE,
+                        DB_READ_MAX_OVERFLOW,
+                        read_only=True,
+                    )
+                else:
+                    engine = get_engine()
+                ReadSessionLocal.configure(bind=engine)
+                _read_engine = engine
+    return _read_engine
+
+
+def init_db(create: bool = True):
+    engine = get_engine()
+    if create:  # idempotent, only missing tables, triggers and indexes are added
+        create_schema(engine, Base.metadata)
+    return engine
+
+
+def dispose_db():
+    global _engine, _read_engine
+    with _engine_lock:
+        engines = {_engine, _read_engine} - {None}
+        _engine, _read_engine = None, None
+    for engine in engines:
+        engine.dispose()
 
 
 def get_db():
+    get_engine()
     db = SessionLocal()
     try:
         yield db
@@ -19,7 +125,34 @@ def get_db():
         db.close()
 
 
+def get_read_db():
+    get_read_engine()
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def insert_seashell(seashell: SeaShell, db: Session):
+    # The write without its commit, shared with the write coalescer
+    db.add(seashell)
+    db.flush()
+
+    return seashell
+
+
+def end_transaction(db: Session):
+    # The writer thread needs the write lock, a session must not hold it while
+    # waiting for a coalesced write
+    db.commit()
+
+
 def add_seashell(seashell: SeaShell, db: Session):
+    if WRITE_COALESCING:
+        end_transaction(db)
+        return write_coalescer.submit(insert_seashell, seashell)
+
     db.add(seashell)
     db.commit()
     db.refresh(seashell)
@@ -27,18 +160,415 @@ def add_seashell(seashell: SeaShell, db: Session):
     return seashell
 
 
+def add_seashells(
+    seashells: List[dict],
+    db: Session,
+    chunk_size: int = BULK_CHUNK_SIZE,
+    progress: Optional[ImportProgress] = None,
+):
+    # executemany style batches, all committed together in a single transaction
+    statement = insert(SeaShell).returning(SeaShell.id, sort_by_parameter_order=True)
+    seashell_ids = []
+    try:
+        for start in range(0, len(seashells), chunk_size):
+            chunk = seashells[start : start + chunk_size]
+            seashell_ids.extend(db.scalars(statement, chunk).all())
+        if progress is not None:  # committed or rolled back with the batch
+            db.merge(progress)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    return seashell_ids
+
+
+def get_import_progress(source: str, db: Session):
+
+    return (
+        db.scalar(
+            select(ImportProgress.records_done).where(ImportProgress.source == source)
+        )
+        or 0
+    )
+
+
 def get_seashell(seashell_id: int, db: Session):
     seashell_obj = db.query(SeaShell).filter(SeaShell.id == seashell_id).first()
 
     return seashell_obj
 
 
-def get_all_seashells(db: Session):
-    sea_shells = db.query(SeaShell).offset(OFFSET).limit(LIMIT).all()
+def get_seashell_updated_at(seashell_id: int, db: Session):
+    # Primary key lookup of the validator alone, no row is hydrated
+    return db.scalar(select(SeaShell.updated_at).where(SeaShell.id == seashell_id))
+
+
+def collection_version_statement():
+    # Newest updated_at from the index, row count from the summary table
+    return select(
+        select(func.max(SeaShell.updated_at)).scalar_subquery(),
+        select(func.coalesce(func.sum(SeaShellStat.count), 0)).scalar_subquery(),
+    )
+
+
+def get_collection_version(db: Session):
+
+    return db.execute(collection_version_statement()).one()
+
+
+SORT_COLUMNS = {
+    "id": SeaShell.id,
+    "collected_at": SeaShell.collected_at,
+    "updated_at": SeaShell.updated_at,
+    "name": SeaShell.name,
+}
+
+
+def unindexed(column):
+    # Unary plus, SQLite never uses an index for a term on it
+    return UnaryExpression(column, operator=custom_op("+"), type_=column.type)
+
+
+def filter_seashells(
+    statement,
+    species: Optional[str] = None,
+    collected_from: Optional[datetime] = None,
+    collected_to: Optional[datetime] = None,
+    name_prefix: Optional[str] = None,
+    unindexed_ranges: bool = False,
+):
+    collected_at, name = SeaShell.collected_at, SeaShell.name
+    if unindexed_ranges:
+        collected_at, name = unindexed(collected_at), unindexed(name)
+
+    if species is not None:
+        statement = statement.where(SeaShell.species == species)
+    if collected_from is not None:
+        statement = statement.where(collected_at >= collected_from)
+    if collected_to is not None:
+        statement = statement.where(collected_at <= collected_to)
+    if name_prefix is not None:
+        # A range instead of LIKE, so the name index can be used
+        statement = statement.where(name >= name_prefix)
+        if name_prefix and ord(name_prefix[-1]) < 0x10FFFF:
+            upper = name_prefix[:-1] + chr(ord(name_prefix[-1]) + 1)
+            statement = statement.where(name < upper)
+
+    return statement
+
+
+def seashells_page_statement(
+    after_id: Optional[int] = None,
+    limit: int = LIMIT,
+    sort: str = "id",
+    descending: bool = False,
+    after_key=None,
+    **filters,
+):
+    # Plain column tuples, the list path never needs hydrated ORM instances.
+    # Sorted by id with a species filter, the species index is read in rowid
+    # order and the scan stops at limit. The date and name ranges are kept off
+    # the composite indexes, which would sort every match in a temp B-tree.
+    column = SORT_COLUMNS[sort]
+    statement = filter_seashells(
+        select(*SeaShell.__table__.columns),
+        **filters,
+        unindexed_ranges=column is SeaShell.id and filters.get("species") is not None,
+    )
+
+    # Keyset pagination, seek past the last seen (sort key, id)
+    if after_id is not None:
+        if column is SeaShell.id:
+            position, last = SeaShell.id, after_id
+        else:
+            position, last = tuple_(column, SeaShell.id), tuple_(after_key, after_id)
+        statement = statement.where(position < last if descending else position > last)
+
+    order = [column, SeaShell.id] if column is not SeaShell.id else [SeaShell.id]
+    if descending:
+        order = [item.desc() for item in order]
+
+    return statement.order_by(*order).limit(limit)
+
+
+def get_all_seashells(
+    db: Session,
+    after_id: Optional[int] = None,
+    limit: int = LIMIT,
+    sort: str = "id",
+    descending: bool = False,
+    after_key=None,
+    **filters,
+):
+    statement = seashells_page_statement(
+        after_id, limit, sort, descending, after_key, **filters
+    )
+    sea_shells = db.execute(statement).all()
 
     return sea_shells
 
 
+def search_seashells(query: str, db: Session, offset: int = 0, limit: int = LIMIT):
+    # bm25 ranks matches in name above species above description
+    rank = func.bm25(literal_column(seashells_fts.name), 10.0, 5.0, 1.0)
+    statement = (
+        select(*SeaShell.__table__.columns)
+        .join(seashells_fts, seashells_fts.c.rowid == SeaShell.id)
+        .where(literal_column(seashells_fts.name).op("MATCH")(query))
+        .order_by(rank, SeaShell.id)
+        .offset(offset)
+        .limit(limit)
+    )
+    sea_shells = db.execute(statement).all()
+
+    return sea_shells
+
+
+def iter_seashell_batches(
+    db: Session,
+    updated_since: Optional[datetime] = None,
+    batch_size: int = EXPORT_BATCH_SIZE,
+):
+    # Plain column rows streamed from a server side cursor, batch_size at a time
+    statement = select(*SeaShell.__table__.columns).order_by(SeaShell.id)
+    if updated_since is not None:
+        statement = statement.where(SeaShell.updated_at >= updated_since)
+
+    result = db.execute(statement.execution_options(yield_per=batch_size))
+    for partition in result.partitions():
+        yield [row._asdict() for row in partition]
+
+
+def get_seashell_stat_counts(db: Session, group: str, species: Optional[str] = None):
+    # Reads the trigger maintained summary, cost grows with groups not with rows
+    column = getattr(SeaShellStat, group)
+    statement = select(column, func.sum(SeaShellStat.count)).group_by(column)
+    if species is not None:
+        statement = statement.where(SeaShellStat.species == species)
+
+    return db.execute(statement.order_by(column)).all()
+
+
+def rebuild_seashell_stats(db: Session):
+    # Recounts every group from seashells, repairs drift from writes outside the app
+    try:
+        for statement in SEASHELL_STATS_REBUILD:
+            db.execute(text(statement))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    return db.scalar(select(func.count()).select_from(SeaShellStat))
+
+
+def get_change_bounds(db: Session):
+    # Oldest and newest change id, two primary key lookups. A single SELECT with
+    # both aggregates would scan the table.
+    return db.execute(
+        select(
+            select(func.min(SeaShellChange.id)).scalar_subquery(),
+            select(func.max(SeaShellChange.id)).scalar_subquery(),
+        )
+    ).one()
+
+
+def get_changes(db: Session, after_id: int, limit: int = CHANGE_FEED_BATCH_SIZE):
+    statement = (
+        select(SeaShellChange.id, SeaShellChange.op, SeaShellChange.seashell_id)
+        .where(SeaShellChange.id > after_id)
+        .order_by(SeaShellChange.id)
+        .limit(limit)
+    )
+
+    return db.execute(statement).all()
+
+
+HASH_CHUNK_COLUMNS = [
+    SeaShell.image_hash_0,
+    SeaShell.image_hash_1,
+    SeaShell.image_hash_2,
+    SeaShell.image_hash_3,
+]
+
+
+def get_image_hash(seashell_id: int, db: Session):
+
+    return db.scalar(select(SeaShell.image_hash).where(SeaShell.id == seashell_id))
+
+
+def similar_seashells_statement(
+    image_hash: int, distance: int, exclude_id: Optional[int] = None
+):
+    # One index probe per hash chunk, unioned by SQLite, so the cost follows the
+    # number of candidates instead of the table size. Exact distances are
+    # checked by the caller, the candidates may be further away. Only id and
+    # hash, the caller reads every candidate and loads the rows it keeps.
+    probes = chunk_probes(image_hash, distance)
+    statement = select(SeaShell.id, SeaShell.image_hash).where(
+        or_(*(column.in_(values) for column, values in zip(HASH_CHUNK_COLUMNS, probes)))
+    )
+    if exclude_id is not None:
+        statement = statement.where(SeaShell.id != exclude_id)
+
+    return statement
+
+
+def iter_similar_candidates(
+    image_hash: int,
+    distance: int,
+    db: Session,
+    exclude_id: Optional[int] = None,
+    batch_size: int = SIMILAR_CANDIDATE_BATCH_SIZE,
+):
+    # Every candidate, batch_size at a time from a server side cursor
+    statement = similar_seashells_statement(image_hash, distance, exclude_id)
+    result = db.execute(statement.execution_options(yield_per=batch_size))
+    for partition in result.partitions():
+        yield partition
+
+
+def get_seashells_by_ids(seashell_ids: List[int], db: Session):
+    statement = select(*SeaShell.__table__.columns).where(SeaShell.id.in_(seashell_ids))
+
+    return db.execute(statement).all()
+
+
+def get_unhashed_image_urls(db: Session, after: str = "", limit: int = LIMIT):
+    # Distinct images still missing a hash, seeking past the last image_url seen
+    statement = (
+        select(SeaShell.image_url)
+        .where(SeaShell.image_hash.is_(None), SeaShell.image_url > after)
+        .group_by(SeaShell.image_url)
+        .order_by(SeaShell.image_url)
+        .limit(limit)
+    )
+
+    return db.scalars(statement).all()
+
+
+def set_image_hashes(image_hashes: dict, db: Session):
+    # image_url -> hash, for every row sharing the image, in one transaction
+    try:
+        for image_url, image_hash in image_hashes.items():
+            db.execute(
+                update(SeaShell)
+                .where(SeaShell.image_url == image_url, SeaShell.image_hash.is_(None))
+                .values(image_hash=image_hash)
+                .execution_options(synchronize_session=False)
+            )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+
+def count_image_references(image_url: str, db: Session):
+
+    return db.scalar(
+        select(func.count())
+        .select_from(SeaShell)
+        .where(SeaShell.image_url == image_url)
+    )
+
+
+def get_image_url(seashell_id: int, db: Session):
+
+    return db.scalar(select(SeaShell.image_url).where(SeaShell.id == seashell_id))
+
+
+def update_seashell_statement(seashell_id: int, changes: dict):
+    # One UPDATE that only sets the changed columns and hands back the new row,
+    # shared with the async repository
+    table = SeaShell.__table__
+
+    return (
+        update(table)
+        .where(table.c.id == seashell_id)
+        .values(**changes)
+        .returning(*table.columns)
+    )
+
+
+def delete_seashell_statement(seashell_id: int):
+    table = SeaShell.__table__
+
+    return delete(table).where(table.c.id == seashell_id).returning(*table.columns)
+
+
+def update_seashell_row(seashell_id: int, changes: dict, db: Session):
+
+    return db.execute(update_seashell_statement(seashell_id, changes)).first()
+
+
+def delete_seashell_row(seashell_id: int, db: Session):
+
+    return db.execute(delete_seashell_statement(seashell_id)).first()
+
+
+def update_seashell_by_id(seashell_id: int, changes: dict, db: Session):
+    if WRITE_COALESCING:
+        end_transaction(db)
+        return write_coalescer.submit(update_seashell_row, seashell_id, changes)
+
+    seashell_row = update_seashell_row(seashell_id, changes, db)
+    db.commit()
+
+    return seashell_row
+
+
+def delete_seashell_by_id(seashell_id: int, db: Session):
+    if WRITE_COALESCING:
+        end_transaction(db)
+        return write_coalescer.submit(delete_seashell_row, seashell_id)
+
+    seashell_row = delete_seashell_row(seashell_id, db)
+    db.commit()
+
+    return seashell_row
+
+
+def target_seashells(statement, seashell_ids: Optional[List[int]], filters: dict):
+    if seashell_ids is not None:
+        return statement.where(SeaShell.id.in_(seashell_ids))
+
+    return filter_seashells(statement, **filters)
+
+
+def update_seashells(
+    changes: dict, db: Session, seashell_ids: Optional[List[int]] = None, **filters
+):
+    # Set based, one UPDATE for every targeted row in a single transaction
+    statement = target_seashells(update(SeaShell), seashell_ids, filters)
+    statement = statement.values(**changes).returning(SeaShell.id)
+    try:
+        updated_ids = db.scalars(
+            statement.execution_options(synchronize_session=False)
+        ).all()
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    return updated_ids
+
+
+def delete_seashells(db: Session, seashell_ids: Optional[List[int]] = None, **filters):
+    statement = target_seashells(delete(SeaShell), seashell_ids, filters)
+    statement = statement.returning(SeaShell.id, SeaShell.image_url)
+    try:
+        deleted_rows = db.execute(
+            statement.execution_options(synchronize_session=False)
+        ).all()
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    return deleted_rows
+
+
 def update_seashell(
     seashell_obj: SeaShell, updated_seashell: UpdateSeaShellReq, db: Session
 ):
@@ -0,0 +1,199 @@
+import asyncio
+from typing import List, Optional
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.models.seashells import SeaShell
+from app.repository.database import create_async_db_engine, is_memory_database
+from app.repository.seashells import (
+    seashells_page_statement,
+    collection_version_statement,
+    insert_seashell,
+    update_seashell_row,
+    delete_seashell_row,
+    update_seashell_statement,
+    delete_seashell_statement,
+    similar_seashells_statement,
+)
+from app.repository.coalescer import write_coalescer
+from app.app_config import (
+    ASYNC_DATABASE_URL,
+    LIMIT,
+    SIMILAR_CANDIDATE_BATCH_SIZE,
+    WRITE_COALESCING,
+    READ_WRITE_SPLIT,
+    DB_READ_POOL_SIZE,
+    DB_READ_MAX_OVERFLOW,
+    DB_WRITE_POOL_SIZE,
+    DB_WRITE_MAX_OVERFLOW,
+)
+
+
+# Created on first use like the sync engines, the schema is made by init_db()
+AsyncSessionLocal = async_sessionmaker(autoflush=False, expire_on_commit=False)
+AsyncReadSessionLocal = async_sessionmaker(autoflush=False, expire_on_commit=False)
+_async_engine = None
+_async_read_engine = None
+
+
+def split_async_engines():
+
+    return READ_WRITE_SPLIT and not is_memory_database(ASYNC_DATABASE_URL)
+
+
+def get_async_engine():
+    global _async_engine
+    if _async_engine is None:  # only ever called from the event loop thread
+        if split_async_engines():
+            _async_engine = create_async_db_engine(
+                ASYNC_DATABASE_URL, DB_WRITE_POOL_SIZE, DB_WRITE_MAX_OVERFLOW
+            )
+        else:
+            _async_engine = create_async_db_engine(ASYNC_DATABASE_URL)
+        AsyncSessionLocal.configure(bind=_async_engine)
+    return _async_engine
+
+
+def get_async_read_engine():
+    global _async_read_engine
+    if _async_read_engine is None:
+        if split_async_engines():
+            _async_read_engine = create_async_db_engine(
+                ASYNC_DATABASE_URL,
+                DB_READ_POOL_SIZE,
+                DB_READ_MAX_OVERFLOW,
+                read_only=True,
+            )
+        else:
+            _async_read_engine = get_async_engine()
+        AsyncReadSessionLocal.configure(bind=_async_read_engine)
+    return _async_read_engine
+
+
+async def dispose_async_db():
+    global _async_engine, _async_read_engine
+    engines = {_async_engine, _async_read_engine} - {None}
+    _async_engine, _async_read_engine = None, None
+    for engine in engines:
+        await engine.dispose()
+
+
+async def get_async_db():
+    get_async_engine()
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def get_async_read_db():
+    get_async_read_engine()
+    async with AsyncReadSessionLocal() as db:
+        yield db
+
+
+async def add_seashell(seashell: SeaShell, db: AsyncSession):
+    if WRITE_COALESCING:  # awaited, the writer thread does the blocking work
+        await db.commit()  # holds no lock the writer thread needs
+        return await asyncio.wrap_future(
+            write_coalescer.enqueue(insert_seashell, seashell)
+        )
+
+    db.add(seashell)
+    await db.commit()
+    await db.refresh(seashell)
+
+    return seashell
+
+
+async def get_seashell(seashell_id: int, db: AsyncSession):
+    result = await db.scalars(select(SeaShell).where(SeaShell.id == seashell_id))
+
+    return result.first()
+
+
+async def get_seashell_updated_at(seashell_id: int, db: AsyncSession):
+
+    return await db.scalar(
+        select(SeaShell.updated_at).where(SeaShell.id == seashell_id)
+    )
+
+
+async def get_collection_version(db: AsyncSession):
+
+    return (await db.execute(collection_version_statement())).one()
+
+
+async def get_all_seashells(
+    db: AsyncSession,
+    after_id: Optional[int] = None,
+    limit: int = LIMIT,
+    sort: str = "id",
+    descending: bool = False,
+    after_key=None,
+    **filters,
+):
+    statement = seashells_page_statement(
+        after_id, limit, sort, descending, after_key, **filters
+    )
+    sea_shells = (await db.execute(statement)).all()
+
+    return sea_shells
+
+
+async def iter_similar_candidates(
+    image_hash: int,
+    distance: int,
+    db: AsyncSession,
+    exclude_id: Optional[int] = None,
+    batch_size: int = SIMILAR_CANDIDATE_BATCH_SIZE,
+):
+    statement = similar_seashells_statement(image_hash, distance, exclude_id)
+    result = await db.stream(statement.execution_options(yield_per=batch_size))
+    async for partition in result.partitions():
+        yield partition
+
+
+async def get_seashells_by_ids(seashell_ids: List[int], db: AsyncSession):
+    statement = select(*SeaShell.__table__.columns).where(SeaShell.id.in_(seashell_ids))
+
+    return (await db.execute(statement)).all()
+
+
+async def count_image_references(image_url: str, db: AsyncSession):
+
+    return await db.scalar(
+        select(func.count())
+        .select_from(SeaShell)
+        .where(SeaShell.image_url == image_url)
+    )
+
+
+async def get_image_url(seashell_id: int, db: AsyncSession):
+
+    return await db.scalar(select(SeaShell.image_url).where(SeaShell.id == seashell_id))
+
+
+async def update_seashell_by_id(seashell_id: int, changes: dict, db: AsyncSession):
+    if WRITE_COALESCING:
+        await db.commit()
+        return await asyncio.wrap_future(
+            write_coalescer.enqueue(update_seashell_row, seashell_id, changes)
+        )
+
+    statement = update_seashell_statement(seashell_id, changes)
+    seashell_row = (await db.execute(statement)).first()
+    await db.commit()
+
+    return seashell_row
+
+
+async def delete_seashell_by_id(seashell_id: int, db: AsyncSession):
+    if WRITE_COALESCING:
+        await db.commit()
+        return await asyncio.wrap_future(
+            write_coalescer.enqueue(delete_seashell_row, seashell_id)
+        )
+
+    seashell_row = (await db.execute(delete_seashell_statement(seashell_id))).first()
+    await db.commit()
+
+    return seashell_row
@@ -1,6 +1,7 @@
 from datetime import datetime
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, Field, model_validator
 from typing import Optional, Union, List
+from typing_extensions import TypedDict
 
 
 class CreateSeaShellReq(BaseModel):
@@ -9,6 +10,7 @@ class CreateSeaShellReq(BaseModel):
     species: str
     description: Optional[str] = "No description provided"
     image_url: str
+    image_hash: Optional[int] = None  # perceptual hash of the image
 
 
 class UpdateSeaShellReq(BaseModel):
@@ -33,6 +35,110 @@ class SeaShellResponse(BaseModel):
         from_attributes = True  # map object attributes
 
 
+class SimilarSeaShell(SeaShellResponse):
+    distance: int  # bits differing between the two image hashes
+
+
+class SimilarResponse(BaseModel):
+    message: str
+    data: List[SimilarSeaShell]
+
+
+class SeaShellRow(TypedDict):  # a plain row dict, serialized without a model
+    id: int
+    created_at: datetime
+    updated_at: datetime
+    collected_at: datetime
+    name: str
+    species: str
+    description: Optional[str]
+    image_url: str
+
+
+class ResponsePayload(TypedDict):  # same JSON shape as Response
+    message: str
+    data: Union[SeaShellRow, List[SeaShellRow]]
+    next_cursor: Optional[str]
+
+
 class Response(BaseModel):
     message: str
     data: Union[SeaShellResponse, List[SeaShellResponse]]
+    next_cursor: Optional[str] = None  # only set on list pages that have more rows
+
+
+class BulkItemResult(BaseModel):
+    index: int  # position of the record in the request
+    id: Optional[int] = None
+    error: Optional[str] = None
+
+
+class BulkResponse(BaseModel):
+    message: str
+    data: List[BulkItemResult]
+
+
+class SeaShellFilter(BaseModel):
+    species: Optional[str] = None
+    collected_from: Optional[datetime] = None
+    collected_to: Optional[datetime] = None
+    name_prefix: Optional[str] = Field(None, min_length=1)  # "" would match every row
+
+
+class BulkSeaShellChanges(BaseModel):
+    model_config = ConfigDict(extra="forbid")  # images can't be bulk edited
+
+    collected_at: Optional[datetime] = None
+    name: Optional[str] = None
+    species: Optional[str] = None
+    description: Optional[str] = None
+
+
+class BulkDeleteReq(BaseModel):
+    ids: Optional[List[int]] = None
+    filter: Optional[SeaShellFilter] = None
+
+    @model_validator(mode="after")
+    def check_target(self):
+        # Exactly one of ids or a non empty filter, never the whole table by accident
+        has_filter = self.filter is not None and bool(
+            self.filter.model_dump(exclude_none=True)
+        )
+        if (self.ids is None) == (not has_filter):
+            raise ValueError("Provide either ids or a non empty filter")
+        return self
+
+
+class BulkUpdateReq(BulkDeleteReq):
+    changes: BulkSeaShellChanges
+
+
+class BulkWriteResult(BaseModel):
+    id: int
+    status: str  # "updated", "deleted" or "not_found"
+
+
+class BulkWriteResponse(BaseModel):
+    message: str
+    data: List[BulkWriteResult]
+
+
+class SpeciesCount(BaseModel):
+    species: str
+    count: int
+
+
+class MonthCount(BaseModel):
+    month: str  # YYYY-MM of collected_at
+    count: int
+
+
+class SeaShellStats(BaseModel):
+    total: int
+    species: List[SpeciesCount]
+    months: List[MonthCount]
+
+
+class StatsResponse(BaseModel):
+    message: str
+    data: SeaShellStats
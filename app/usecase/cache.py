@@ -0,0 +1,85 @@
+import threading
+import time
+from collections import OrderedDict
+
+from app.app_config import SEASHELL_CACHE_MAX_ENTRIES, SEASHELL_CACHE_TTL_SECONDS
+
+
+class TTLCache:
+    def __init__(
+        self,
+        max_entries: int = SEASHELL_CACHE_MAX_ENTRIES,
+        ttl_seconds: float = SEASHELL_CACHE_TTL_SECONDS,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # key -> (expires_at, value), oldest use first
+        self._generation = 0  # bumped on every invalidation
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def generation(self):
+        # Read before loading from the database, see set()
+        return self._generation
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, generation: int = None):
+        with self._lock:
+            # A write invalidated something while the value was loaded, it may be stale
+            if generation is not None and generation != self._generation:
+                return False
+            if self.max_entries <= 0:  # disabled
+                return False
+
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            return True
+
+    def invalidate(self, key):
+        with self._lock:
+            self._generation += 1
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def disable(self):
+        # Nothing is stored from now on, every get() is a miss
+        with self._lock:
+            self.max_entries = 0
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+seashell_cache = TTLCache()
@@ -0,0 +1,106 @@
+import asyncio
+import threading
+from itertools import groupby
+from typing import Optional
+from sqlalchemy.orm import Session
+
+from app.repository.seashells import (
+    get_change_bounds as get_change_bounds_repo,
+    get_changes as get_changes_repo,
+)
+from app.app_config import CHANGE_FEED_BATCH_SIZE
+
+
+class ChangeFeed:
+    # The events are rows of seashell_changes, shared by every worker. This only
+    # wakes the streams of this process right after a local write, writes of
+    # other workers are picked up when a stream polls.
+    def __init__(self):
+        self._notified = 0
+        self._waiters = {}  # event loop -> future resolved by the next notify
+        self._lock = threading.Lock()
+
+        self.resyncs = 0
+
+    def notify(self):
+        with self._lock:
+            self._notified += 1
+            waiters, self._waiters = self._waiters, {}
+
+        for loop, future in waiters.items():
+            try:
+                loop.call_soon_threadsafe(_wake, future)
+            except RuntimeError:  # the loop was closed meanwhile
+                pass
+
+    def notified(self):
+
+        return self._notified
+
+    async def wait(self, notified: int, timeout: float):
+        # Until notify() was called since notified() returned notified, or
+        # timeout seconds passed
+        with self._lock:
+            if self._notified != notified:
+                return True
+            loop = asyncio.get_running_loop()
+            future = self._waiters.get(loop)
+            if future is None:  # shared by every subscriber of this event loop
+                future = self._waiters[loop] = loop.create_future()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    def count_resync(self):
+        with self._lock:
+            self.resyncs += 1
+
+    def stats(self):
+        with self._lock:
+            return {"notified": self._notified, "resyncs": self.resyncs}
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+change_feed = ChangeFeed()
+
+
+def resume_changes(last_event_id: Optional[str], db: Session):
+    # Returns (change id to continue after, resync). New subscribers start at the
+    # newest change, an id the log never had, e.g. of another database, resyncs.
+    _, newest = get_change_bounds_repo(db)
+    newest = newest or 0
+    if last_event_id is None:
+        return newest, False
+
+    try:
+        sequence = int(last_event_id)
+    except ValueError:
+        sequence = None
+    if sequence is None or not 0 <= sequence <= newest:
+        change_feed.count_resync()
+        return newest, True
+    return sequence, False
+
+
+def get_changes(sequence: int, db: Session, limit: int = CHANGE_FEED_BATCH_SIZE):
+    # Returns (events, change id to continue after, resync). Consecutive changes
+    # with the same op become one event, its id is the id of the last change.
+    rows = get_changes_repo(db, sequence, limit)
+    if rows and rows[0].id != sequence + 1:  # pruned before the stream read them
+        change_feed.count_resync()
+        _, newest = get_change_bounds_repo(db)
+        return [], newest, True
+
+    events = []
+    for op, group in groupby(rows, key=lambda row: row.op):
+        group = list(group)
+        event = {"op": op, "ids": [row.seashell_id for row in group]}
+        events.append((group[-1].id, event))
+
+    return events, rows[-1].id if rows else sequence, False
@@ -1,19 +1,80 @@
+import base64
+import binascii
+import csv
+import heapq
+import io
+import json
+import re
+from datetime import datetime
+from itertools import chain
+from typing import List, Optional
+from fastapi import Request
 from sqlalchemy.orm import Session
 
-from app.schemas.seashells import CreateSeaShellReq, UpdateSeaShellReq
-from app.models.seashells import SeaShell
+from app.schemas.seashells import (
+    CreateSeaShellReq,
+    UpdateSeaShellReq,
+    SeaShellResponse,
+    BulkUpdateReq,
+    BulkDeleteReq,
+    BulkWriteResult,
+    SeaShellStats,
+    SpeciesCount,
+    MonthCount,
+    SimilarSeaShell,
+)
+from app.models.seashells import SeaShell, ImportProgress
 from app.repository.seashells import (
     get_db,
+    get_read_db,
     add_seashell as add_seashell_repo,
+    add_seashells as add_seashells_repo,
+    get_import_progress as get_import_progress_repo,
     get_seashell as get_seashell_repo,
+    get_seashell_updated_at as get_seashell_updated_at_repo,
+    get_collection_version as get_collection_version_repo,
     get_all_seashells as get_all_seashells_repo,
+    iter_seashell_batches as iter_seashell_batches_repo,
+    search_seashells as search_seashells_repo,
+    get_seashell_stat_counts as get_seashell_stat_counts_repo,
+    rebuild_seashell_stats as rebuild_seashell_stats_repo,
+    get_image_hash as get_image_hash_repo,
+    iter_similar_candidates as iter_similar_candidates_repo,
+    get_seashells_by_ids as get_seashells_by_ids_repo,
+    get_unhashed_image_urls as get_unhashed_image_urls_repo,
+    set_image_hashes as set_image_hashes_repo,
+    count_image_references as count_image_references_repo,
+    get_image_url as get_image_url_repo,
+    update_seashell_by_id as update_seashell_by_id_repo,
+    delete_seashell_by_id as delete_seashell_by_id_repo,
+    update_seashells as update_seashells_repo,
+    delete_seashells as delete_seashells_repo,
     update_seashell as update_seashell_repo,
     delete_seashell as delete_seashell_repo,
 )
+from app.images.store import delete_image, trash_image, restore_trashed_image
+from app.images.hashing import hamming_distance, image_file_hash
+from app.usecase.cache import seashell_cache
+from app.usecase.changes import change_feed
+from app.app_config import (
+    LIMIT,
+    MAX_LIMIT,
+    BULK_CHUNK_SIZE,
+    SIMILAR_DEFAULT_DISTANCE,
+    IMAGE_HASH_BATCH_SIZE,
+)
+
+
+READ_METHODS = ("GET", "HEAD")
 
 
-def get_database():
-    db = next(get_db())  # Getting the session instance
+def get_database(request: Request = None):
+    # Reads of GET requests go to the read only pool, writes and the CLIs, which
+    # call this without a request, get a session of the writer pool
+    if request is not None and request.method in READ_METHODS:
+        db = next(get_read_db())
+    else:
+        db = next(get_db())  # Getting the session instance
     try:
         yield db
     finally:
@@ -27,9 +88,36 @@ def add_seashell(seashellreq: CreateSeaShellReq, db: Session):
         species=seashellreq.species,
         description=seashellreq.description,
         image_url=seashellreq.image_url,
+        image_hash=seashellreq.image_hash,
     )
 
-    return add_seashell_repo(seashell, db)
+    seashell = add_seashell_repo(seashell, db)
+    change_feed.notify()
+
+    return seashell
+
+
+def add_seashells(
+    seashellreqs: List[CreateSeaShellReq],
+    db: Session,
+    chunk_size: int = BULK_CHUNK_SIZE,
+    progress: Optional[tuple] = None,
+):
+    # progress is (source, records done) of an import, stored with the rows
+    seashells = [seashellreq.model_dump() for seashellreq in seashellreqs]
+    if progress is not None:
+        source, records_done = progress
+        progress = ImportProgress(source=source, records_done=records_done)
+
+    seashell_ids = add_seashells_repo(seashells, db, chunk_size, progress)
+    change_feed.notify()
+
+    return seashell_ids
+
+
+def get_import_progress(source: str, db: Session):
+
+    return get_import_progress_repo(source, db)
 
 
 def get_seashell(seashell_id: int, db: Session):
@@ -37,17 +125,406 @@ def get_seashell(seashell_id: int, db: Session):
     return get_seashell_repo(seashell_id, db)
 
 
+def get_seashell_response(seashell_id: int, db: Session):
+    # Read through cache of serialized payloads, writes below invalidate it
+    payload = seashell_cache.get(seashell_id)
+    if payload is not None:
+        return payload
+
+    generation = seashell_cache.generation()
+    seashell_obj = get_seashell_repo(seashell_id, db)
+    if seashell_obj is None:
+        return None
+
+    payload = SeaShellResponse.model_validate(seashell_obj).model_dump()
+    seashell_cache.set(seashell_id, payload, generation)
+    return payload
+
+
+def get_seashell_updated_at(seashell_id: int, db: Session):
+    # Validator for conditional requests, a cached payload already carries it
+    payload = seashell_cache.get(seashell_id)
+    if payload is not None:
+        return payload["updated_at"]
+
+    return get_seashell_updated_at_repo(seashell_id, db)
+
+
+def get_collection_version(db: Session):
+    updated_at, count = get_collection_version_repo(db)
+
+    return updated_at, count
+
+
 def get_all_seashells(db: Session):
 
     return get_all_seashells_repo(db)
 
 
+def encode_cursor(payload: dict) -> str:
+    data = json.dumps(payload, separators=(",", ":")).encode()
+
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> dict:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+    if not isinstance(payload, dict):
+        raise ValueError("Invalid cursor")
+
+    return payload
+
+
+def cursor_int(payload: dict, field: str) -> int:
+    value = payload.get(field)
+    if not isinstance(value, int) or isinstance(value, bool) or value < 0:
+        raise ValueError("Invalid cursor")
+
+    return value
+
+
+SORTS = ["id", "collected_at", "updated_at", "name"]  # "-" prefix sorts descending
+
+
+def parse_page_request(cursor: Optional[str], limit: int, sort: str):
+    descending = sort.startswith("-")
+    column = sort.lstrip("-")
+    if column not in SORTS:
+        raise ValueError("Invalid sort")
+    limit = max(1, min(limit, MAX_LIMIT))  # server side cap on the page size
+
+    after_id, after_key = None, None
+    if cursor:
+        payload = decode_cursor(cursor)
+        if payload.get("sort", "id") != sort:  # a cursor only continues its own order
+            raise ValueError("Invalid cursor")
+        after_id = cursor_int(payload, "id")
+        if column != "id":
+            after_key = payload.get("key")
+            if column != "name" and after_key is not None:
+                try:
+                    after_key = datetime.fromisoformat(after_key)
+                except (TypeError, ValueError) as e:
+                    raise ValueError("Invalid cursor") from e
+
+    return column, descending, limit, after_id, after_key
+
+
+def page_with_cursor(seashells, limit: int, sort: str):
+    # One extra row was fetched to know whether another page exists
+    if len(seashells) <= limit:
+        return seashells, None
+
+    seashells = seashells[:limit]
+    last = seashells[-1]
+    column = sort.lstrip("-")
+    payload = {"id": last.id}
+    if sort != "id":
+        payload["sort"] = sort
+    if column != "id":
+        payload["key"] = _export_value(getattr(last, column))
+
+    return seashells, encode_cursor(payload)
+
+
+def get_seashells_page(
+    db: Session,
+    cursor: Optional[str] = None,
+    limit: int = LIMIT,
+    sort: str = "id",
+    **filters,
+):
+    column, descending, limit, after_id, after_key = parse_page_request(
+        cursor, limit, sort
+    )
+    seashells = get_all_seashells_repo(
+        db, after_id, limit + 1, column, descending, after_key, **filters
+    )
+
+    return page_with_cursor(seashells, limit, sort)
+
+
+def build_search_query(text: str) -> str:
+    # Quote every word so user input can't inject FTS5 syntax, prefix match the last
+    words = re.findall(r"\w+", text.lower())
+    if not words:
+        raise ValueError("Empty search query")
+
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+def search_seashells(
+    text: str, db: Session, cursor: Optional[str] = None, limit: int = LIMIT
+):
+    query = build_search_query(text)
+    offset = cursor_int(decode_cursor(cursor), "offset") if cursor else 0
+    limit = max(1, min(limit, MAX_LIMIT))
+
+    seashells = search_seashells_repo(query, db, offset, limit + 1)
+    next_cursor = None
+    if len(seashells) > limit:
+        seashells = seashells[:limit]
+        next_cursor = encode_cursor({"offset": offset + limit})
+
+    return seashells, next_cursor
+
+
+EXPORT_FIELDS = [
+    "id",
+    "created_at",
+    "updated_at",
+    "collected_at",
+    "name",
+    "species",
+    "description",
+    "image_url",
+]
+
+
+def _export_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def export_seashells_ndjson(db: Session, updated_since: Optional[datetime] = None):
+    # One chunk per fetched batch keeps memory flat and the number of writes low
+    for rows in iter_seashell_batches_repo(db, updated_since):
+        yield "".join(
+            json.dumps({field: _export_value(row[field]) for field in EXPORT_FIELDS})
+            + "\n"
+            for row in rows
+        )
+
+
+def export_seashells_csv(db: Session, updated_since: Optional[datetime] = None):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    yield buffer.getvalue()
+
+    for rows in iter_seashell_batches_repo(db, updated_since):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(
+            [_export_value(row[field]) for field in EXPORT_FIELDS] for row in rows
+        )
+        yield buffer.getvalue()
+
+
+def get_seashell_stats(db: Session, species: Optional[str] = None):
+    species_counts = get_seashell_stat_counts_repo(db, "species", species)
+    month_counts = get_seashell_stat_counts_repo(db, "month", species)
+
+    return SeaShellStats(
+        total=sum(count for _, count in species_counts),
+        species=[
+            SpeciesCount(species=name, count=count) for name, count in species_counts
+        ],
+        months=[MonthCount(month=month, count=count) for month, count in month_counts],
+    )
+
+
+def rebuild_seashell_stats(db: Session):
+
+    return rebuild_seashell_stats_repo(db)
+
+
+def closest_matches(matches, candidates, image_hash: int, distance: int, limit: int):
+    # Candidates share a hash chunk, keeps the limit closest (distance, id) pairs
+    # within distance. Called per batch, so memory stays at limit pairs.
+    within = (
+        (hamming_distance(image_hash, candidate_hash), seashell_id)
+        for seashell_id, candidate_hash in candidates
+    )
+    within = (match for match in within if match[0] <= distance)
+
+    return heapq.nsmallest(limit, chain(matches, within))
+
+
+def similar_seashells(matches, seashells):
+    # Rows deleted since the candidates were read are left out
+    rows = {seashell.id: seashell for seashell in seashells}
+
+    return [
+        SimilarSeaShell.model_validate(
+            {**rows[seashell_id]._mapping, "distance": match}
+        )
+        for match, seashell_id in matches
+        if seashell_id in rows
+    ]
+
+
+def find_similar_seashells(
+    image_hash: int,
+    db: Session,
+    distance: int = SIMILAR_DEFAULT_DISTANCE,
+    limit: int = LIMIT,
+    exclude_id: Optional[int] = None,
+):
+    matches = []
+    for candidates in iter_similar_candidates_repo(
+        image_hash, distance, db, exclude_id
+    ):
+        matches = closest_matches(matches, candidates, image_hash, distance, limit)
+    seashells = get_seashells_by_ids_repo([match[1] for match in matches], db)
+
+    return similar_seashells(matches, seashells)
+
+
+def get_similar_seashells(
+    seashell_id: int,
+    db: Session,
+    distance: int = SIMILAR_DEFAULT_DISTANCE,
+    limit: int = LIMIT,
+):
+    image_hash = get_image_hash_repo(seashell_id, db)
+    if image_hash is None:
+        if get_image_url_repo(seashell_id, db) is None:
+            return None
+        raise ValueError("Seashell image is not hashed yet")
+
+    limit = max(1, min(limit, MAX_LIMIT))
+    return find_similar_seashells(image_hash, db, distance, limit, seashell_id)
+
+
+def hash_stored_images(
+    db: Session, batch_size: int = IMAGE_HASH_BATCH_SIZE, report=print
+):
+    # Backfills rows stored before hashing, every distinct image is read once.
+    # Missing or unreadable files stay unhashed and are skipped.
+    hashed, after = 0, ""
+    while image_urls := get_unhashed_image_urls_repo(db, after, batch_size):
+        image_hashes = {}
+        for image_url in image_urls:
+            try:
+                image_hashes[image_url] = image_file_hash(image_url)
+            except (OSError, SyntaxError):
+                report(f"skipped {image_url}")
+        set_image_hashes_repo(image_hashes, db)
+        hashed += len(image_hashes)
+        after = image_urls[-1]
+
+    return hashed
+
+
+def release_image(image_url: Optional[str], db: Session):
+    # Stored images are shared by content, only remove ones nobody points to.
+    # An upload of the same content may reuse the file and commit its row right
+    # after the count, so the file is moved aside and counted again. Uploads
+    # restore the file after their commit if a release removed it anyway.
+    if not image_url or count_image_references_repo(image_url, db) > 0:
+        return False
+    trash_path = trash_image(image_url)
+    if trash_path is None:
+        return False
+    if count_image_references_repo(image_url, db) > 0:
+        restore_trashed_image(trash_path, image_url)
+        return False
+
+    return delete_image(trash_path)
+
+
 def update_seashell(
     seashell_obj: SeaShell, updated_seashellreq: UpdateSeaShellReq, db: Session
 ):
-    return update_seashell_repo(seashell_obj, updated_seashellreq, db)
+    old_image_url = seashell_obj.image_url
+    seashell = update_seashell_repo(seashell_obj, updated_seashellreq, db)
+    seashell_cache.invalidate(seashell.id)
+    change_feed.notify()
+    if seashell.image_url != old_image_url:
+        release_image(old_image_url, db)
+
+    return seashell
 
 
 def delete_seashell(seashell_obj: SeaShell, db: Session):
+    seashell = delete_seashell_repo(seashell_obj, db)
+    seashell_cache.invalidate(seashell.id)
+    change_feed.notify()
+    release_image(seashell.image_url, db)
+
+    return seashell
+
+
+def update_seashell_by_id(seashell_id: int, changes: dict, db: Session):
+    if not changes:
+        return get_seashell_response(seashell_id, db)
+
+    # The old image is only looked up when the image is replaced
+    old_image_url = None
+    if "image_url" in changes:
+        old_image_url = get_image_url_repo(seashell_id, db)
+
+    seashell_row = update_seashell_by_id_repo(seashell_id, changes, db)
+    seashell_cache.invalidate(seashell_id)
+    if seashell_row is None:
+        release_image(changes.get("image_url"), db)  # uploaded for a missing shell
+    else:
+        change_feed.notify()
+        if old_image_url != seashell_row.image_url:
+            release_image(old_image_url, db)
+
+    return seashell_row
+
+
+def delete_seashell_by_id(seashell_id: int, db: Session):
+    seashell_row = delete_seashell_by_id_repo(seashell_id, db)
+    seashell_cache.invalidate(seashell_id)
+    if seashell_row is not None:
+        change_feed.notify()
+        release_image(seashell_row.image_url, db)
+
+    return seashell_row
+
+
+def bulk_results(requested_ids: Optional[List[int]], done_ids, status: str):
+    done = set(done_ids)
+    if requested_ids is None:  # filter mode, report what matched
+        return [
+            BulkWriteResult(id=seashell_id, status=status) for seashell_id in done_ids
+        ]
+
+    return [
+        BulkWriteResult(
+            id=seashell_id, status=status if seashell_id in done else "not_found"
+        )
+        for seashell_id in dict.fromkeys(requested_ids)  # unique, keeps the order
+    ]
+
+
+def update_seashells(bulkreq: BulkUpdateReq, db: Session):
+    changes = bulkreq.changes.model_dump(exclude_none=True)
+    filters = bulkreq.filter.model_dump(exclude_none=True) if bulkreq.filter else {}
+    if not changes:
+        raise ValueError("No changes provided")
+
+    updated_ids = update_seashells_repo(changes, db, bulkreq.ids, **filters)
+    for seashell_id in updated_ids:
+        seashell_cache.invalidate(seashell_id)
+    change_feed.notify()
+
+    return bulk_results(bulkreq.ids, updated_ids, "updated")
+
+
+def delete_seashells(bulkreq: BulkDeleteReq, db: Session):
+    filters = bulkreq.filter.model_dump(exclude_none=True) if bulkreq.filter else {}
+
+    deleted_rows = delete_seashells_repo(db, bulkreq.ids, **filters)
+    for row in deleted_rows:
+        seashell_cache.invalidate(row.id)
+    change_feed.notify()
+
+    # Image urls of the removed rows, to clean up once nothing references them
+    image_urls = list(dict.fromkeys(row.image_url for row in deleted_rows))
+    results = bulk_results(bulkreq.ids, [row.id for row in deleted_rows], "deleted")
+    return results, image_urls
+
 
-    return delete_seashell_repo(seashell_obj, db)
+def release_images(image_urls: List[str], db: Session):
+    return [image_url for image_url in image_urls if release_image(image_url, db)]
@@ -0,0 +1,169 @@
+from typing import Optional
+from fastapi import Request
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.schemas.seashells import CreateSeaShellReq, SeaShellResponse
+from app.models.seashells import SeaShell
+from app.repository.seashells_async import (
+    get_async_db,
+    get_async_read_db,
+    add_seashell as add_seashell_repo,
+    get_seashell as get_seashell_repo,
+    get_seashell_updated_at as get_seashell_updated_at_repo,
+    get_collection_version as get_collection_version_repo,
+    get_all_seashells as get_all_seashells_repo,
+    iter_similar_candidates as iter_similar_candidates_repo,
+    get_seashells_by_ids as get_seashells_by_ids_repo,
+    count_image_references as count_image_references_repo,
+    get_image_url as get_image_url_repo,
+    update_seashell_by_id as update_seashell_by_id_repo,
+    delete_seashell_by_id as delete_seashell_by_id_repo,
+)
+from app.usecase.seashells import (
+    READ_METHODS,
+    parse_page_request,
+    page_with_cursor,
+    closest_matches,
+    similar_seashells,
+)
+from app.usecase.cache import seashell_cache
+from app.usecase.changes import change_feed
+from app.images.store import delete_image, trash_image, restore_trashed_image
+from app.app_config import LIMIT, SIMILAR_DEFAULT_DISTANCE
+
+
+async def get_async_database(request: Request = None):
+    if request is not None and request.method in READ_METHODS:
+        sessions = get_async_read_db()
+    else:
+        sessions = get_async_db()
+    async for db in sessions:  # Getting the session instance
+        yield db
+
+
+async def add_seashell(seashellreq: CreateSeaShellReq, db: AsyncSession):
+    seashell = SeaShell(
+        collected_at=seashellreq.collected_at,
+        name=seashellreq.name,
+        species=seashellreq.species,
+        description=seashellreq.description,
+        image_url=seashellreq.image_url,
+        image_hash=seashellreq.image_hash,
+    )
+
+    seashell = await add_seashell_repo(seashell, db)
+    change_feed.notify()
+
+    return seashell
+
+
+async def get_seashell_response(seashell_id: int, db: AsyncSession):
+    # Shares the read through cache with the sync path
+    payload = seashell_cache.get(seashell_id)
+    if payload is not None:
+        return payload
+
+    generation = seashell_cache.generation()
+    seashell_obj = await get_seashell_repo(seashell_id, db)
+    if seashell_obj is None:
+        return None
+
+    payload = SeaShellResponse.model_validate(seashell_obj).model_dump()
+    seashell_cache.set(seashell_id, payload, generation)
+    return payload
+
+
+async def get_seashell_updated_at(seashell_id: int, db: AsyncSession):
+    payload = seashell_cache.get(seashell_id)
+    if payload is not None:
+        return payload["updated_at"]
+
+    return await get_seashell_updated_at_repo(seashell_id, db)
+
+
+async def get_collection_version(db: AsyncSession):
+    updated_at, count = await get_collection_version_repo(db)
+
+    return updated_at, count
+
+
+async def get_seashells_page(
+    db: AsyncSession,
+    cursor: Optional[str] = None,
+    limit: int = LIMIT,
+    sort: str = "id",
+    **filters,
+):
+    column, descending, limit, after_id, after_key = parse_page_request(
+        cursor, limit, sort
+    )
+    seashells = await get_all_seashells_repo(
+        db, after_id, limit + 1, column, descending, after_key, **filters
+    )
+
+    return page_with_cursor(seashells, limit, sort)
+
+
+async def find_similar_seashells(
+    image_hash: int,
+    db: AsyncSession,
+    distance: int = SIMILAR_DEFAULT_DISTANCE,
+    limit: int = LIMIT,
+    exclude_id: Optional[int] = None,
+):
+    matches = []
+    candidate_batches = iter_similar_candidates_repo(
+        image_hash, distance, db, exclude_id
+    )
+    async for candidates in candidate_batches:
+        matches = closest_matches(matches, candidates, image_hash, distance, limit)
+    seashells = await get_seashells_by_ids_repo([match[1] for match in matches], db)
+
+    return similar_seashells(matches, seashells)
+
+
+async def release_image(image_url: Optional[str], db: AsyncSession):
+    # Same steps as the sync release
+    if not image_url or await count_image_references_repo(image_url, db) > 0:
+        return False
+    trash_path = trash_image(image_url)
+    if trash_path is None:
+        return False
+    if await count_image_references_repo(image_url, db) > 0:
+        restore_trashed_image(trash_path, image_url)
+        return False
+
+    return delete_image(trash_path)
+
+
+async def update_seashell_by_id(seashell_id: int, changes: dict, db: AsyncSession):
+    if not changes:
+        return await get_seashell_response(seashell_id, db)
+
+    # The old image is only looked up when the image is replaced
+    old_image_url = None
+    if "image_url" in changes:
+        old_image_url = await get_image_url_repo(seashell_id, db)
+
+    seashell_row = await update_seashell_by_id_repo(seashell_id, changes, db)
+    seashell_cache.invalidate(seashell_id)
+    if seashell_row is None:
+        await release_image(
+            changes.get("image_url"), db
+        )  # uploaded for a missing shell
+    else:
+        change_feed.notify()
+        if old_image_url != seashell_row.image_url:
+            await release_image(old_image_url, db)
+
+    return seashell_row
+
+
+async def delete_seashell_by_id(seashell_id: int, db: AsyncSession):
+    seashell_row = await delete_seashell_by_id_repo(seashell_id, db)
+    seashell_cache.invalidate(seashell_id)
+    if seashell_row is not None:
+        change_feed.notify()
+        await release_image(seashell_row.image_url, db)
+
+    return seashell_row
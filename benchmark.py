@@ -0,0 +1,328 @@
+import argparse
+import json
+import math
+import random
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from io import BytesIO
+
+from PIL import Image
+from sqlalchemy import func, select
+from sqlalchemy.orm import sessionmaker
+
+from app.models.seashells import Base, SeaShell
+from app.repository.database import create_db_engine, create_schema
+from app.repository.seashells import add_seashells
+from app.images.store import store_image
+
+BENCHMARK_DATABASE_URL = "sqlite:///./benchmark.db"
+SEED_BATCH_SIZE = 10000  # rows inserted per transaction while seeding
+SPECIES = ["snail", "clam", "cowrie", "conch", "scallop", "whelk", "cockle", "oyster"]
+WORKLOAD = {  # endpoint name -> share of the requests
+    "get_one": 50,
+    "list": 25,
+    "create": 10,
+    "patch": 10,
+    "delete": 5,
+}
+
+
+def generate_image(rng: random.Random):
+    color = tuple(rng.randrange(0, 256, 32) for _ in range(3))  # 512 distinct images
+    image_data = BytesIO()
+    Image.new("RGB", (64, 64), color=color).save(image_data, format="PNG")
+
+    return image_data.getvalue()
+
+
+def seed_database(
+    database_url: str, rows: int, images: int = 100, seed: int = 0, reseed=False
+):
+    engine = create_db_engine(database_url)
+    if reseed:
+        Base.metadata.drop_all(bind=engine)
+    create_schema(engine, Base.metadata)
+    db = sessionmaker(bind=engine)()
+    rng = random.Random(seed)
+
+    existing = db.scalar(select(func.count()).select_from(SeaShell))
+    if existing < rows:
+        # Stored by content, so the generated images are shared between rows
+        image_urls = [
+            store_image(BytesIO(generate_image(rng)), "png") for _ in range(images)
+        ]
+        start = datetime(2020, 1, 1)
+        for offset in range(existing, rows, SEED_BATCH_SIZE):
+            add_seashells(
+                [
+                    {
+                        "collected_at": start + timedelta(minutes=rng.randrange(2**21)),
+                        "name": f"shell-{i}",
+                        "species": rng.choice(SPECIES),
+                        "description": f"benchmark seashell {i}",
+                        "image_url": rng.choice(image_urls),
+                    }
+                    for i in range(offset, min(rows, offset + SEED_BATCH_SIZE))
+                ],
+                db,
+            )
+
+    seashell_ids = db.scalars(select(SeaShell.id)).all()
+    db.close()
+    return engine, seashell_ids
+
+
+def in_process_clients(engine):
+    from fastapi.testclient import TestClient
+    from app.main import app
+    from app.usecase.seashells import get_database
+    from app.usecase.cache import seashell_cache
+
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    def override_get_db():
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_database] = override_get_db
+    seashell_cache.clear()
+
+    return lambda: TestClient(app)
+
+
+def http_clients(base_url: str):
+    import httpx
+
+    return lambda: httpx.Client(base_url=base_url, timeout=30)
+
+
+class Workload:
+    def __init__(self, seashell_ids, seed: int = 0):
+        self.seashell_ids = seashell_ids  # seeded rows, never deleted
+        self.created_ids = deque()  # rows created during the run, deleted ones pop
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def next_request(self):
+        with self.lock:
+            name = self.rng.choices(list(WORKLOAD), weights=WORKLOAD.values())[0]
+            seashell_id = self.rng.choice(self.seashell_ids)
+            image = generate_image(self.rng) if name == "create" else None
+
+        if name == "get_one":
+            return name, ("GET", f"/v1/seashell/{seashell_id}"), {}
+        if name == "list":
+            return name, ("GET", "/v1/seashell/"), {"params": {"limit": 20}}
+        if name == "patch":
+            data = {"description": f"patched {time.time()}"}
+            return name, ("PATCH", f"/v1/seashell/{seashell_id}"), {"data": data}
+        if name == "delete" and self.created_ids:
+            try:
+                return (
+                    name,
+                    ("DELETE", f"/v1/seashell/{self.created_ids.popleft()}"),
+                    {},
+                )
+            except IndexError:  # another thread took the last one
+                pass
+
+        data = {
+            "name": "benchmark",
+            "collected_at": "2024-02-01T14:30:45",
+            "species": "snail",
+        }
+        files = {"image": ("image.png", image, "image/png")}
+        return "create", ("POST", "/v1/seashell/"), {"data": data, "files": files}
+
+
+def percentile(sorted_values, p: float):
+    # Nearest rank on an already sorted list
+    if not sorted_values:
+        return None
+    rank = max(
+        0, min(len(sorted_values) - 1, math.ceil(p / 100 * len(sorted_values)) - 1)
+    )
+
+    return sorted_values[rank]
+
+
+def summarize(latencies: dict, errors: dict, duration: float):
+    endpoints = {}
+    for name in WORKLOAD:
+        values = sorted(latencies.get(name, []))
+        endpoints[name] = {
+            "count": len(values),
+            "errors": errors.get(name, 0),
+            "throughput_rps": round(len(values) / duration, 2) if duration else None,
+            "mean_ms": round(sum(values) / len(values), 3) if values else None,
+            **{
+                f"p{p}_ms": (round(percentile(values, p), 3) if values else None)
+                for p in (50, 95, 99)
+            },
+        }
+
+    total = sum(endpoint["count"] for endpoint in endpoints.values())
+    return {
+        "requests": total,
+        "duration_s": round(duration, 3),
+        "throughput_rps": round(total / duration, 2) if duration else None,
+        "endpoints": endpoints,
+    }
+
+
+def run_workload(make_client, workload: Workload, requests: int, concurrency: int):
+    latencies = {name: [] for name in WORKLOAD}
+    errors = {name: 0 for name in WORKLOAD}
+    errors_lock = threading.Lock()
+    local = threading.local()
+
+    def send(_):
+        if not hasattr(local, "client"):
+            local.client = make_client()
+        name, (method, path), options = workload.next_request()
+
+        started = time.perf_counter()
+        response = local.client.request(method, path, **options)
+        elapsed = (time.perf_counter() - started) * 1000
+        latencies[name].append(elapsed)  # list.append is atomic
+        if response.status_code >= 400:
+            with errors_lock:
+                errors[name] += 1
+        elif name == "create":
+            workload.created_ids.append(response.json()["data"]["id"])
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(send, range(requests)))
+
+    return latencies, errors, time.perf_counter() - started
+
+
+COLD_START_SCRIPT = """
+import json, sys, time
+from fastapi.testclient import TestClient
+
+start = time.perf_counter()
+from app.main import create_app
+import app.repository.seashells as repository
+
+imported = time.perf_counter()
+repository.DATABASE_URL = sys.argv[1]  # the engine is only created on startup
+with TestClient(create_app()) as client:  # runs the lifespan startup
+    started = time.perf_counter()
+    client.get("/")
+    ready = time.perf_counter()
+print(json.dumps({
+    "import_s": round(imported - start, 3),
+    "startup_s": round(started - imported, 3),
+    "first_request_s": round(ready - started, 3),
+    "total_s": round(ready - start, 3),
+}))
+"""
+
+
+def measure_cold_start(database_url: str = BENCHMARK_DATABASE_URL):
+    # A fresh interpreter, so no module of the app is imported yet. The startup
+    # creates the schema in the benchmark database, never in ./seashell.db.
+    result = subprocess.run(
+        [sys.executable, "-c", COLD_START_SCRIPT, database_url],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(
+    mode: str = "inprocess",
+    database_url: str = BENCHMARK_DATABASE_URL,
+    url: str = "http://127.0.0.1:7777",
+    rows: int = 10000,
+    images: int = 100,
+    requests: int = 2000,
+    warmup: int = 100,
+    concurrency: int = 8,
+    seed: int = 0,
+    reseed: bool = False,
+):
+    cold_start = measure_cold_start(database_url)
+    seed_started = time.perf_counter()
+    engine, seashell_ids = seed_database(database_url, rows, images, seed, reseed)
+    seed_time = time.perf_counter() - seed_started
+
+    if mode == "http":
+        make_client = http_clients(url)
+    else:
+        make_client = in_process_clients(engine)
+
+    workload = Workload(seashell_ids, seed)
+    run_workload(make_client, workload, warmup, concurrency)  # not recorded
+    latencies, errors, duration = run_workload(
+        make_client, workload, requests, concurrency
+    )
+
+    return {
+        "commit": git_commit(),
+        "mode": mode,
+        "rows": len(seashell_ids),
+        "concurrency": concurrency,
+        "seed": seed,
+        "seed_s": round(seed_time, 3),
+        "cold_start": cold_start,
+        **summarize(latencies, errors, duration),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load benchmark for the seashell API")
+    parser.add_argument("--mode", choices=["inprocess", "http"], default="inprocess")
+    parser.add_argument("--database-url", default=BENCHMARK_DATABASE_URL)
+    parser.add_argument("--url", default="http://127.0.0.1:7777")  # http mode only
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--images", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--warmup", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--reseed", action="store_true")
+    parser.add_argument("--output")  # JSON report path, stdout when omitted
+    args = parser.parse_args()
+
+    report = run_benchmark(
+        args.mode,
+        args.database_url,
+        args.url,
+        args.rows,
+        args.images,
+        args.requests,
+        args.warmup,
+        args.concurrency,
+        args.seed,
+        args.reseed,
+    )
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as report_file:
+            report_file.write(output + "\n")
+    else:
+        print(output)
@@ -0,0 +1,187 @@
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from io import BytesIO
+from itertools import islice
+
+from pydantic import ValidationError
+
+from app.images.pool import process_image
+from app.images.store import store_image
+from app.schemas.seashells import CreateSeaShellReq
+from app.app_config import IMAGE_FOLDER
+
+IMPORT_BATCH_SIZE = 1000  # rows per transaction, progress is stored with each
+
+
+def read_records(path: str):
+    # Yields (line number, record dict) from a CSV with a header row or from JSONL
+    with open(path, newline="") as source:
+        if path.endswith(".jsonl") or path.endswith(".ndjson"):
+            for line_number, line in enumerate(source, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    yield line_number, json.loads(line)
+                except ValueError:
+                    yield line_number, None
+        else:
+            for line_number, row in enumerate(csv.DictReader(source), start=2):
+                yield line_number, row
+
+
+def import_image(path: str, folder: str = IMAGE_FOLDER):
+    # Runs in a worker process: verify, normalize and store one image
+    try:
+        with open(path, "rb") as image_file:
+            data, image_format, image_hash = process_image(image_file.read())
+    except FileNotFoundError:
+        return None, None, "Missing image file"
+    except (OSError, SyntaxError):  # unreadable or not an image
+        return None, None, "Invalid image file"
+
+    image_url = store_image(BytesIO(data), image_format.lower(), folder)
+    return image_url, image_hash, None
+
+
+def build_seashellreq(record, image_url: str, image_hash: int = None):
+    if not isinstance(record, dict):
+        raise ValueError("Invalid record")
+
+    try:
+        collected_at = datetime.fromisoformat(record.get("collected_at") or "")
+    except (TypeError, ValueError):
+        raise ValueError("Invalid collected_at")
+
+    try:
+        return CreateSeaShellReq(
+            name=record.get("name"),
+            species=record.get("species"),
+            description=record.get("description") or None,
+            collected_at=collected_at,
+            image_url=image_url,
+            image_hash=image_hash,
+        )
+    except ValidationError:
+        raise ValueError("Invalid seashell fields")
+
+
+def import_batch(batch, images_dir: str, executor, db, folder: str, progress=None):
+    from app.usecase.seashells import add_seashells
+
+    # Every distinct image of the batch is processed once, in parallel
+    filenames = list(
+        dict.fromkeys(
+            record.get("image")
+            for _, record in batch
+            if isinstance(record, dict) and isinstance(record.get("image"), str)
+        )
+    )
+    paths = [os.path.join(images_dir, os.path.basename(name)) for name in filenames]
+    if executor is not None:
+        results = executor.map(import_image, paths, [folder] * len(paths))
+    else:
+        results = (import_image(path, folder) for path in paths)
+    images = dict(zip(filenames, results))
+
+    seashellreqs, rejected = [], []
+    for line_number, record in batch:
+        try:
+            filename = record.get("image") if isinstance(record, dict) else None
+            image_url, image_hash, error = images.get(
+                filename, (None, None, "Missing image file")
+            )
+            if image_url is None:
+                raise ValueError(error)
+            seashellreqs.append(build_seashellreq(record, image_url, image_hash))
+        except ValueError as e:
+            rejected.append((line_number, str(e)))
+
+    # One transaction for the whole batch and the progress that skips it on a rerun
+    add_seashells(seashellreqs, db, progress=progress)
+    for filename, path in zip(filenames, paths):
+        image_url = images[filename][0]
+        if image_url is not None and not os.path.exists(image_url):
+            import_image(path, folder)  # removed by a concurrent release, store again
+    return len(seashellreqs), rejected
+
+
+def import_seashells(
+    path: str,
+    images_dir: str,
+    db,
+    workers: int = os.cpu_count(),
+    batch_size: int = IMPORT_BATCH_SIZE,
+    checkpoint: str = None,
+    folder: str = IMAGE_FOLDER,
+    report=print,
+):
+    from app.usecase.seashells import get_import_progress
+
+    checkpoint = checkpoint or os.path.abspath(path)
+    skip = get_import_progress(checkpoint, db)
+    records = islice(read_records(path), skip, None)  # resume after the last batch
+    executor = None
+    if workers > 0:
+        executor = ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+        )
+
+    records_done, imported, rejected = skip, 0, []
+    start = time.perf_counter()
+    try:
+        while batch := list(islice(records, batch_size)):
+            records_done += len(batch)
+            batch_imported, batch_rejected = import_batch(
+                batch, images_dir, executor, db, folder, (checkpoint, records_done)
+            )
+            imported += batch_imported
+            rejected.extend(batch_rejected)
+
+            elapsed = time.perf_counter() - start
+            report(
+                f"{records_done} records, {imported} imported, {len(rejected)} "
+                f"rejected, {(records_done - skip) / elapsed:.0f} rows/s"
+            )
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    return {"imported": imported, "rejected": rejected, "skipped": skip}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import seashells from CSV or JSONL")
+    parser.add_argument("path", help="metadata, .csv with a header row or .jsonl")
+    parser.add_argument("images_dir", help="directory holding the image files")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    parser.add_argument("--checkpoint")  # progress key, defaults to the full path
+    args = parser.parse_args()
+
+    from app.repository.seashells import init_db
+    from app.usecase.seashells import get_database
+
+    init_db()
+    db = next(get_database())
+    try:
+        result = import_seashells(
+            args.path,
+            args.images_dir,
+            db,
+            args.workers,
+            args.batch_size,
+            args.checkpoint,
+        )
+    finally:
+        db.close()
+
+    for line_number, error in result["rejected"]:
+        print(f"line {line_number}: {error}", file=sys.stderr)
+    print(f"Imported {result['imported']} seashells")
@@ -1,5 +1,67 @@
+import argparse
+import os
 import uvicorn
 
 
+def rebuild_stats():
+    from app.repository.seashells import init_db
+    from app.usecase.seashells import get_database, rebuild_seashell_stats
+
+    init_db()
+    db = next(get_database())
+    groups = rebuild_seashell_stats(db)
+    db.close()
+    print(f"Rebuilt seashell stats, {groups} groups")
+
+
+def hash_images():
+    from app.repository.seashells import init_db
+    from app.usecase.seashells import get_database, hash_stored_images
+
+    init_db()  # adds the hash columns to an existing database
+    db = next(get_database())
+    hashed = hash_stored_images(db)
+    db.close()
+    print(f"Hashed {hashed} stored images")
+
+
+def serve(workers: int, host: str, port: int, reload: bool = False):
+    if reload:  # development server, restarts on code changes
+        uvicorn.run("app.main:app", host=host, port=port, reload=True)
+        return
+
+    from app.repository.seashells import init_db, dispose_db
+    from app.app_config import WORKERS_ENV
+
+    # The schema is created once here, so the workers only find it in place
+    # instead of racing each other for the SQLite write lock with DDL
+    init_db()
+    dispose_db()  # no connections are inherited by the workers
+    os.environ[WORKERS_ENV] = str(workers)  # inherited by the workers, see lifespan
+    uvicorn.run(
+        "app.main:create_app", factory=True, host=host, port=port, workers=workers
+    )
+
+
 if __name__ == "__main__":
-    uvicorn.run("app.main:app", port=7777, reload=True)
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "command",
+        nargs="?",
+        default="serve",
+        choices=["serve", "rebuild-stats", "hash-images"],
+    )
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--reload", action="store_true")  # development server
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7777)
+    args = parser.parse_args()
+    if args.reload and args.workers > 1:
+        parser.error("--reload serves a single worker")
+
+    if args.command == "rebuild-stats":
+        rebuild_stats()
+    elif args.command == "hash-images":
+        hash_images()
+    else:
+        serve(args.workers, args.host, args.port, args.reload)